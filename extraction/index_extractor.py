@@ -13,6 +13,6 @@ from index_utils.index_xml_postprocess import index_xml_postprocess
 def extract_index():
    index_to_xml()
    index_xml_postprocess()
-   index_to_db()
+   index_to_db(pipelined=True)
 
 
@@ -0,0 +1,114 @@
+"""
+This module measures how the stages of the index extraction scale with
+the size of the index. Synthetic indexes (see index_generator) are run
+through index_to_xml, index_xml_postprocess and index_to_db, and the
+throughput (items/second) and peak memory of every stage are reported.
+
+Every stage is run in a separate process inside a temporary working
+directory, so that the peak memory of a stage is not hidden by the
+memory of the previous ones and the database of the project is left
+untouched.
+
+Usage: python -m extraction.index_utils.index_benchmark [scale ...]
+"""
+
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from index_generator import generate_index_html
+
+
+STAGES = ['xml', 'postprocess', 'db']
+SCALES = [1, 10, 100]
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def peak_memory():
+    '''Return the peak resident set size of this process in kB.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_stage(stage):
+    '''
+    Run a single stage in the current working directory. Return the
+    time it took in seconds and the peak memory of the process in kB.
+    '''
+    if stage == 'xml':
+        from index_to_xml import index_to_xml as run
+    elif stage == 'postprocess':
+        from index_xml_postprocess import index_xml_postprocess as run
+    elif stage == 'db':
+        from django.core.management import call_command
+        call_command('syncdb', interactive=False, verbosity=0)
+        from index_to_db import index_to_db
+        run = lambda: index_to_db(pipelined=True)
+    else:
+        raise ValueError('Unknown stage: {0}'.format(stage))
+    start = time.time()
+    run()
+    return {'seconds': time.time() - start, 'peak': peak_memory()}
+
+
+def prepare(work_dir, scale, seed):
+    '''
+    Set up a working directory holding everything the index
+    extraction reads. Return the number of generated items.
+    '''
+    os.mkdir(os.path.join(work_dir, 'html'))
+    os.mkdir(os.path.join(work_dir, 'resources'))
+    shutil.copy(os.path.join(ROOT, 'resources', 'forenames.txt'),
+                os.path.join(work_dir, 'resources'))
+    with open(os.path.join(work_dir, 'sbr-regesten.xml'), 'w') as f:
+        f.write('<sbr-regesten>\n')
+    return generate_index_html(
+        os.path.join(work_dir, 'html', 'sbr-regesten.html'), scale, seed)
+
+
+def benchmark(scales=SCALES, seed=0, out=sys.stdout):
+    '''
+    Run all stages for indexes of the given scales and write a
+    report to out. Return the results as a list of dicts.
+    '''
+    env = dict(os.environ, PYTHONPATH=ROOT,
+               DJANGO_SETTINGS_MODULE='sbr_regesten.settings')
+    results = []
+    out.write('{0:>6} {1:>12} {2:>8} {3:>10} {4:>12} {5:>12}\n'.format(
+            'scale', 'stage', 'items', 'seconds', 'items/s', 'peak kB'))
+    for scale in scales:
+        work_dir = tempfile.mkdtemp()
+        try:
+            items = prepare(work_dir, scale, seed)
+            for stage in STAGES:
+                with open(os.devnull, 'w') as devnull:
+                    output = subprocess.check_output(
+                        [sys.executable, '-W', 'ignore', '-m',
+                         'extraction.index_utils.index_benchmark',
+                         '--stage', stage],
+                        cwd=work_dir, env=env, stderr=devnull)
+                result = json.loads(output.strip().splitlines()[-1])
+                result.update(scale=scale, stage=stage, items=items)
+                results.append(result)
+                out.write('{scale:>6} {stage:>12} {items:>8} '
+                          '{seconds:>10.2f} {rate:>12.1f} {peak:>12}\n'.format(
+                        rate=items / max(result['seconds'], 1e-6),
+                        **result))
+                out.flush()
+        finally:
+            shutil.rmtree(work_dir)
+    return results
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--stage']:
+        result = run_stage(sys.argv[2])
+        sys.stdout.write('\n' + json.dumps(result) + '\n')
+    else:
+        benchmark([float(scale) for scale in sys.argv[1:]] or SCALES)
@@ -0,0 +1,246 @@
+"""
+This module generates synthetic index HTML in the format of the Word
+export of the Sbr Regesten. The generated index can be made arbitrarily
+large, which allows to measure how the index extraction scales beyond
+the size of the book (see index_benchmark).
+"""
+
+
+import codecs
+import random
+
+
+# Number of index items in the book, i.e. the size of an index
+# generated at scale 1.
+BOOK_ITEMS = 1000
+
+# Share of each item type in a generated index.
+ITEM_TYPES = [('location', 0.35), ('person', 0.25), ('family', 0.15),
+              ('persongroup', 0.08), ('landmark', 0.1), ('siehe', 0.07)]
+
+# Names consist of three syllables of three letters each. As all names
+# have the same length, no name is part of another one, so that siehe
+# references are resolved to the right item.
+SYLLABLES = ['bel', 'din', 'ger', 'lin', 'ros', 'sel', 'hal', 'ham',
+             'ker', 'ric', 'mol', 'ven', 'sit', 'ter', 'dud', 'wei',
+             'lim', 'fec', 'ing', 'qui', 'sch', 'bli', 'nal', 'gud',
+             'ens', 'hei', 'mar', 'pel', 'kir', 'ton', 'rup', 'pin',
+             'sul', 'zer', 'fel', 'lor', 'mun', 'dal', 'ner', 'wil',
+             'kum', 'sta', 'ral', 'eng', 'ost', 'rin', 'lau', 'mes',
+             'nit', 'vol', 'sar', 'ilm', 'ulf', 'ebe', 'gol', 'pet',
+             'rod', 'tib', 'kel', 'zil']
+
+FORENAMES = ['Johann', 'Thomas', 'Jacob', 'Peter', 'Heinrich', 'Nikolaus',
+             'Friedrich', 'Philipp', 'Conrad', 'Margarethe', 'Katharina',
+             'Greden', 'Wilhelm', 'Simon', 'Bernhard', 'Anna']
+
+ROMAN = ['I.', 'II.', 'III.', 'IV.', 'V.']
+
+ROLES = ['Graf von', 'Bischof von', 'Herr von', 'Ritter', 'Junker',
+         'Amtmann zu', 'Pastor zu', 'Schultheiss zu']
+
+SETTLEMENTS = ['Dorf', 'Stadt', 'Burg', 'Kloster', 'Hofgut', 'Schloss',
+               'Herrschaft']
+
+DISTRICTS = ['Gem. Kleinblittersdorf', u'Stadtverband Saarbr\xfccken',
+             'Kr. Saarlouis', 'Merzig-Wadern-Kreis', 'Kreis Neunkirchen']
+
+REGIONS = ['SL', 'RLP', 'Dep. Moselle', 'Dep. Bas-Rhin']
+
+COUNTRIES = ['F', 'Lux']
+
+LANDMARK_TYPES = ['Fluss', 'Berg', 'Bach', 'Wald']
+
+GROUPS = ['Notare', 'Einwohner von', 'Herren von', 'Edelknechte von']
+
+DESCRIPTIONS = ['Schultheiss', 'Schreiber', 'Schoeffe', 'Knecht', 'Vogt',
+                'Wirt', 'Meier', 'Zoellner']
+
+CONCEPTS = [u'G\xfcter', 'Zehnt', 'Weinberg', 'Leibeigene', 'Rechte',
+            'Gericht', u'M\xfchle', 'Kirche', 'Wiese', 'Zins']
+
+QUOTES = ['ein stuck wingarten gelegen', 'dem man sprichet der alte',
+          'seligen sone von', 'unser lieber getruwer',
+          'mit allen rechten und zugehorden', 'den man nennet den jungen']
+
+DATE_AFFIXES = ['', '', '', ' (a)', ' (b)', ' ca.']
+
+MSO_P = u"<p class=MsoNormal style='margin-left:14.2pt;text-indent:-14.2pt'>"
+MSO_B = u"<b><span style='mso-bidi-font-weight:normal'>{0}</span></b>"
+MSO_I = u"<i style='mso-bidi-font-style:normal'>{0}</i>"
+MSO_SPAN = u"<span style='font-size:10.0pt;font-family:\"Times New Roman\"'>" \
+    "{0}</span>"
+
+
+class IndexGenerator(object):
+    '''
+    Generate the paragraphs of a synthetic index. All random choices
+    are made by a seeded random number generator, so an index can be
+    reproduced from its scale and seed.
+    '''
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.names = set()
+        self.locations = []
+        self.families = []
+
+    def choice(self, sequence):
+        return self.random.choice(sequence)
+
+    def name(self):
+        '''Return a place or family name not used before.'''
+        while True:
+            name = ''.join(self.choice(SYLLABLES) for i in range(3))
+            name = name[0].upper() + name[1:]
+            if name not in self.names:
+                self.names.add(name)
+                return name
+
+    def date(self):
+        year = self.random.randint(1250, 1550)
+        date = '{0}-{1:02d}-{2:02d}'.format(
+            year, self.random.randint(1, 12), self.random.randint(1, 28))
+        if self.random.random() < 0.05:
+            date = '{0}/{1}'.format(date, year + 1)
+        return date + self.choice(DATE_AFFIXES)
+
+    def dates(self, max_count=3):
+        return ', '.join(self.date() for i in
+                         range(self.random.randint(1, max_count)))
+
+    def quote(self):
+        return MSO_I.format(self.choice(QUOTES))
+
+    def concept_line(self, depth=0):
+        '''Return a body line holding a (related) concept.'''
+        line = '- ' * depth
+        if self.random.random() < 0.3:
+            line += self.quote() + ' '
+        line += self.choice(CONCEPTS)
+        if self.random.random() < 0.3:
+            line += ', ' + self.choice(DESCRIPTIONS)
+        return line + ' ' + self.dates()
+
+    def person_line(self, depth=0):
+        '''Return a body line holding a member of a family or group.'''
+        line = '- ' * depth + self.choice(FORENAMES)
+        if self.random.random() < 0.4:
+            line += ', ' + self.choice(DESCRIPTIONS)
+        return line + ' ' + self.dates()
+
+    def body(self, line):
+        '''
+        Return body lines created by line. Some of the lines are
+        followed by nested lines starting with '-'.
+        '''
+        lines = []
+        for i in range(self.random.randint(0, 5)):
+            lines.append(line())
+            for j in range(self.random.choice([0, 0, 0, 1, 2])):
+                lines.append(line(1))
+                if self.random.random() < 0.2:
+                    lines.append(line(2))
+        return lines
+
+    def add_names(self):
+        if self.random.random() < 0.2:
+            return ' (' + MSO_I.format(self.name()) + ')'
+        return ''
+
+    def siehe(self):
+        '''Return a reference to an earlier location or family.'''
+        targets = self.locations + self.families
+        if targets and self.random.random() < 0.15:
+            return ' siehe ' + self.choice(targets)
+        return ''
+
+    def location(self):
+        name = self.name()
+        place = [self.choice(DISTRICTS)]
+        if self.random.random() < 0.5:
+            place.append(self.choice(REGIONS))
+        if self.random.random() < 0.3:
+            place.append(self.choice(COUNTRIES))
+        header = MSO_B.format(name) + self.add_names() + ', ' + \
+            self.choice(SETTLEMENTS) + ' (' + ', '.join(place) + ')'
+        if self.random.random() < 0.5:
+            header += ' ' + self.dates()
+        header += self.siehe()
+        self.locations.append(name)
+        return [header] + self.body(self.concept_line)
+
+    def family(self):
+        name = self.name()
+        header = MSO_B.format(name) + self.add_names() + ', Familie von ' + \
+            self.dates(2) + self.siehe()
+        self.families.append(name)
+        return [header] + self.body(self.person_line)
+
+    def persongroup(self):
+        header = MSO_B.format(self.choice(GROUPS) + ' ' + self.name())
+        if self.random.random() < 0.5:
+            header += ' ' + self.dates(2)
+        return [header] + self.body(self.person_line)
+
+    def person(self):
+        forename = self.choice(FORENAMES)
+        if self.random.random() < 0.5:
+            forename += ' ' + self.choice(ROMAN)
+        header = MSO_B.format(forename) + ', ' + self.choice(ROLES) + ' ' + \
+            self.name() + ' ' + self.dates()
+        return [header] + self.body(self.concept_line)
+
+    def landmark(self):
+        header = MSO_B.format(self.name()) + self.add_names() + ', ' + \
+            self.choice(LANDMARK_TYPES) + ' ' + self.dates()
+        return [header] + self.body(self.concept_line)
+
+    def siehe_item(self):
+        '''Return an item that only refers to an earlier item.'''
+        targets = self.locations + self.families
+        if not targets:
+            return self.location()
+        return [MSO_B.format(self.name()) + ' siehe ' + self.choice(targets)]
+
+    def item(self):
+        '''Return the lines of an item of a randomly chosen type.'''
+        r = self.random.random()
+        for item_type, share in ITEM_TYPES:
+            r -= share
+            if r < 0:
+                break
+        if item_type == 'siehe':
+            lines = self.siehe_item()
+        else:
+            lines = getattr(self, item_type)()
+        if len(lines) > 1 and self.random.random() < 0.1:
+            lines.insert(1, 'siehe ' + self.choice(self.locations))
+        return lines
+
+    def paragraphs(self, count):
+        '''Yield the HTML paragraphs of an index with count items.'''
+        yield MSO_P + MSO_B.format('Index') + '</p>'
+        yield MSO_P + MSO_SPAN.format(
+            'Die Zahlen verweisen auf das Datum der Regesten.') + '</p>'
+        for i in range(count):
+            lines = [MSO_SPAN.format(line) if self.random.random() < 0.3
+                     else line for line in self.item()]
+            yield MSO_P + '<br>\n'.join(lines) + '</p>'
+        for i in range(11):
+            yield MSO_P + '<o:p>&nbsp;</o:p></p>'
+
+
+def generate_index_html(path, scale=1, seed=0):
+    '''
+    Write an HTML file containing a synthetic index with scale times
+    as many items as the index of the book. Return the number of
+    items written.
+    '''
+    count = int(BOOK_ITEMS * scale)
+    with codecs.open(path, 'w', 'cp1252') as f:
+        f.write('<html>\n<body lang=DE>\n<div class=WordSection1>\n')
+        for paragraph in IndexGenerator(seed).paragraphs(count):
+            f.write(paragraph + '\n')
+        f.write('</div>\n</body>\n</html>\n')
+    return count
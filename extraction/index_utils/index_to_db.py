@@ -8,34 +8,46 @@ Author: Susanne Fertmann <s9sufert@stud.uni-saarland.de>
 
 
 from bs4 import BeautifulSoup, Tag, NavigableString
-import codecs, string, re, sys
+from collections import namedtuple
+import codecs, string, re, sys, threading, Queue
+from django.db import connection, transaction
 from regesten_webapp import models
 from regesten_webapp.models import Location, Family, Person, Region
 from regesten_webapp.models import PersonGroup, Landmark, Concept, IndexEntry
 from regesten_webapp.models import Regest, RegestDate, Quote, ContentType
+from regesten_webapp.generation import corpus_changed, deferred_bump
+from regesten_webapp.generation import pending_bumps
+from regesten_webapp.utils import content_hash
+from extraction.index_utils.relation_writer import RelationWriter
 
 
-def get_item_ID():
-    '''Get consecutive id for an index item'''
-    global countIndex
-    item_id = countIndex
-    countIndex += 1
-    return item_id
+relations = RelationWriter()
 
-def ment_to_db(xmlNode, concept):
+# Index item types and the models they are stored as. Family comes
+# before PersonGroup, since every family is a persongroup as well.
+entryModels = [('family', Family), ('persongroup', PersonGroup),
+               ('location', Location), ('landmark', Landmark),
+               ('person', Person)]
+
+# Country abbreviations used in location headers
+countries = {'F': 'Frankreich', 'B': 'Belgien', 'CH': 'Schweiz',
+             'Lux': 'Luxemburg', 'L': 'Luxemburg', 'Spanien': 'Spanien',
+             'It': 'Italien'}
+
+
+def get_item_ID(itemsoup):
+    '''Get the id of an index item from its XML id (item_<n>).'''
+    return isolate_id(itemsoup['id'])
+
+def ment_to_db(mentions, concept):
     '''
     TO BE IMPLEMENTED:
-    Extract related regests and writes them into the database.
+    Write the regests a concept is mentioned in (a list of reg-ref
+    strings) into the database.
     '''
     pass
 
 
-def add_all(obj, li):
-    '''Add a list of elements to an object.'''
-    for elem in li:
-          obj.add(elem)
-
-
 def if_exists(node):
     '''Check if a node exists.'''
     if node:
@@ -44,334 +56,594 @@ def if_exists(node):
         return ''
 
 
-def create_quote(xmlNode,objId):
-    '''Build a quote from XML. Write it into the database.'''
-    q = Quote()
-    q.content_type = ContentType.objects.get(app_label='regesten_webapp', model='concept')
-    q.content = xmlNode.get_text()
-    q.object_id = objId
-    q.save()
-    return q
+########################## 1. XML to rows ##########################
 
+# The functions in this section turn XML index items into plain
+# tuples (rows) without touching the database. The functions in
+# section 2 write those rows into the database. Keeping both apart
+# allows parsing and writing to run in different threads (see
+# pipelined_items_to_db).
+
+EntryRow = namedtuple(
+    'EntryRow', ['type', 'id', 'fields', 'region', 'mentions', 'concepts',
+                 'refs'])
+
+ConceptRow = namedtuple(
+    'ConceptRow', ['type', 'fields', 'quotes', 'mentions', 'concepts'])
+
+
+def find_mentions(xmlNode):
+    '''Return the reg-refs in the mentioned-in tag of a node.'''
+    if xmlNode:
+        mentNode = xmlNode.find('mentioned-in', recursive=False)
+        if mentNode:
+            return [regRef.get_text() for regRef in mentNode.findAll('reg-ref')]
+    return []
 
-def create_person(xmlNode):
-    ''' Build a person from XML. Write it into the database.'''
-    global idConc
-    
-    p = Person()
-    pers_name = xmlNode.persname
-    p.name = pers_name.get_text().strip()
-    p.additional_names = if_exists(pers_name.addNames)
-    p.forename = if_exists(pers_name.forename)
-    p.surname = if_exists(pers_name.surname)
-    p.maidenname = if_exists(pers_name.maidenname)
-    p.rolename = if_exists(pers_name.rolename)
-    p.genname = if_exists(pers_name.genname)
-    p.description = if_exists(xmlNode.description)
-    p.id = idConc
-    idConc += 1
-    p.save()
-    return p
 
-  
-def create_concept(xmlNode):
-    ''' Build a concept. '''
+def find_refs(itemsoup):
+    '''
+    Return the ids of the index entries referenced in the header of an
+    XML index item.
+    '''
+    header = itemsoup.find(itemsoup['type'] + '-header')
+    if header and header.find('index-refs'):
+        return [isolate_id(node['itemid']) for node in \
+                header.find('index-refs').findAll('index-ref')]
+    return []
+
+
+def person_to_row(xmlNode):
+    ''' Build a person row from XML.'''
+    pers_name = xmlNode.persname
+    fields = {}
+    fields['name'] = pers_name.get_text().strip()
+    fields['additional_names'] = if_exists(pers_name.addNames)
+    fields['forename'] = if_exists(pers_name.forename)
+    fields['surname'] = if_exists(pers_name.surname)
+    fields['maidenname'] = if_exists(pers_name.maidenname)
+    fields['rolename'] = if_exists(pers_name.rolename)
+    fields['genname'] = if_exists(pers_name.genname)
+    fields['description'] = if_exists(xmlNode.description)
+    return ConceptRow('person', fields, [], find_mentions(xmlNode), [])
+
+
+def concept_to_row(xmlNode):
+    ''' Build a concept row from XML. '''
     name = xmlNode.find('name')
-    global idConc
-    
-    c = Concept()
-    c.name = name.get_text().strip()
-    c.description = if_exists(xmlNode.description)
-    c.id = idConc
-    idConc += 1
-    c.save()
+    fields = {}
+    fields['name'] = name.get_text().strip()
+    fields['description'] = if_exists(xmlNode.description)
 
     quoteList = []
-    qList = []
     if xmlNode.description:
         quoteList = xmlNode.description.findAll('quote')
     if not isinstance(name, NavigableString):
         quoteList += name.findAll('quote')
-    for quote in quoteList:
-        q = create_quote(quote, c.id)
-        qList.append(q)
-    add_all(c.quotes, qList)
-    return c
+    quotes = [quote.get_text() for quote in quoteList]
+    return ConceptRow('concept', fields, quotes, find_mentions(xmlNode), [])
 
 
-def relconc_to_db(relConc, createElement=create_concept):
-    '''Extract related-concepts and write them into the database.'''
-    clist = []
+def relconc_to_rows(relConc, createRow=concept_to_row):
+    '''Extract related-concepts from XML and build rows for them.'''
+    rows = []
     if relConc:
         for conc in relConc:
             if isinstance(conc, NavigableString):
                 continue
             if conc.name == 'concept' or conc.name == 'person':
-                c = createElement(conc)
-                c.save()
-                ment_to_db(conc, c)
-                if hasattr(conc, 'related-concepts'):
-                    add_all(c.related_concepts, relconc_to_db(conc.find\
-                           ('related-concepts')))
-                    clist.append(c)
-    return clist
-
-
-def loc_to_db(itemsoup,ref_dict):
-    '''Extract a location from XML and write it into the database.'''
+                row = createRow(conc)
+                row.concepts.extend(relconc_to_rows(conc.find\
+                                    ('related-concepts')))
+                rows.append(row)
+    return rows
+
+
+def loc_to_row(itemsoup):
+    '''Extract a location from XML and build a row for it.'''
     header = itemsoup.find('location-header')
     placeName = header.placename
     attrs = placeName.settlement.attrs
-     
-    l = Location()
-    l.additional_names = if_exists(placeName.addNames)
-    l.name = itemsoup['value']
-        
+    fields = {}
+    fields['additional_names'] = if_exists(placeName.addNames)
+    fields['name'] = itemsoup['value']
+
     # Abandoned villages
     if 'type' in attrs:
-        l.location_type = placeName.settlement['type']
+        fields['location_type'] = placeName.settlement['type']
     vill = placeName.settlement['abandoned-village']
-    if vill == 'true':
-       l.abandoned_village = True
-    else:
-       l.abandoned_village = False    
+    fields['abandoned_village'] = vill == 'true'
     if 'av-ref' in attrs:
-        l.av_ref = placeName.settlement['av-ref']    
-      
+        fields['av_ref'] = placeName.settlement['av-ref']
+
     # Reference point + district
     ref_point = placeName.find('reference_point')
     if ref_point:
         ref_point = ref_point.get_text().strip(' ,;.')
     if ref_point:
-        l.reference_point = ref_point
+        fields['reference_point'] = ref_point
     else:
-        l.reference_point = ''
+        fields['reference_point'] = ''
     if placeName.district:
-        l.district = placeName.district.get_text().strip(' ,;.')
-    
-    # Region  
+        fields['district'] = placeName.district.get_text().strip(' ,;.')
+
+    # Region
+    region = None
     if placeName.region:
-        regs = Region.objects.filter(name=placeName.region.get_text()\
-                                    .strip(' ,;.'))
-        if regs:
-            region = regs[0]
-        else:
-            region = Region.objects.create(name=placeName.region.get_text()\
-                     .strip(' ,;.'), region_type=placeName.region['type'])
-        l.region = region
-
-    # Country
+        region = (placeName.region.get_text().strip(' ,;.'),
+                  placeName.region['type'])
+
+    # Country (locations without one are assigned to a country by the
+    # type of their region, see write_entry)
     if placeName.country:
-        if placeName.country.get_text() == "F":
-            l.country = "Frankreich"
-        if placeName.country.get_text() == "B":
-            l.country = "Belgien"
-        if placeName.country.get_text() == "CH":
-            l.country = "Schweiz"
-        if placeName.country.get_text() == "Lux":
-            l.country = "Luxemburg"
-        if placeName.country.get_text() == "L":
-            l.country = "Luxemburg"
-        if placeName.country.get_text() == "Spanien":
-            l.country = "Spanien"
-        if placeName.country.get_text() == "It":
-            l.country = "Italien"
-    elif l.region and l.region.region_type == 'Bundesland':
-        l.country = "Deutschland"
-
-    l.id = get_item_ID()
-    l.xml_repr = itemsoup
-    l.save()
-    
-    # Mentionings + related index entries
-    ment_to_db(header, l)
-    ref_dict[l.id] = header.find('index-refs')
-    
+        fields['country'] = countries.get(placeName.country.get_text(), '')
+
     # Related concepts
+    concepts = []
     if itemsoup.find('concept-body'):
-        add_all(l.related_concepts, relconc_to_db(itemsoup.find\
-               ('concept-body').find('related-concepts')))
-       
-    print(l)
-    return l
-  
+        concepts = relconc_to_rows(itemsoup.find('concept-body')\
+                                   .find('related-concepts'))
 
+    fields['xml_repr'] = unicode(itemsoup)
+    return EntryRow('location', get_item_ID(itemsoup), fields, region,
+                    find_mentions(header), concepts, find_refs(itemsoup))
 
-def land_to_db(itemsoup,ref_dict):
-    '''Extract a landmark from XML and write it into the database.'''
+
+def land_to_row(itemsoup):
+    '''Extract a landmark from XML and build a row for it.'''
     header = itemsoup.find('landmark-header')
-     
-    land = Landmark()
-    land.name = itemsoup['value']
+    fields = {}
+    fields['name'] = itemsoup['value']
     if header.geogname:
-        land.add_Names = header.geogname
-        land.landmark_type = str(header.geogname['type'])
-    
-    land.id = get_item_ID()
-    land.xml_repr = itemsoup
-    land.save()
-       
-    # Mentionings + related index entries
-    ment_to_db(itemsoup.find('landmark-header'), land)
-    ref_dict[land.id] = header.find('index-refs')
-    
+        fields['landmark_type'] = str(header.geogname['type'])
+
     # Related concepts
-    if hasattr(itemsoup, 'concept-body'):
-        add_all(land.related_concepts, relconc_to_db(itemsoup.find\
-                ('concept-body').find('related-concepts')))
-       
-    print(land)
-    return land
-    
- 
-def pers_to_db(itemsoup,ref_dict):
-    '''Extract a person from XML and write it into the database.'''
-    p = Person()
-    if hasattr(itemsoup, 'person-header'):
-        header = itemsoup.find('person-header')
-        pers_name = header.person.persname
-        
-        p.name=itemsoup['value']
-        
-        p.additional_names = if_exists(pers_name.addNames)
-        p.forename = if_exists(pers_name.forename)
-        p.surname = if_exists(pers_name.surname)
-        p.maidenname = if_exists(pers_name.maidenname)
-        p.rolename = if_exists(pers_name.rolename)
-        p.genname = if_exists(pers_name.genname)
-        p.description = if_exists(header.person.description)
-        
-        p.id = get_item_ID()
-        p.xml_repr = itemsoup
-        p.save()
-            
-        # Mentionings + related index entries
-        ment_to_db(itemsoup.find('person-header'), p)
-        ref_dict[p.id] = header.find('index-refs')
-        
-        # Related concepts
-        if hasattr(itemsoup, 'concept-body'):
-            add_all(p.related_concepts, relconc_to_db(itemsoup.find\
-                   ('concept-body').find('related-concepts')))
-           
-        print (p)
-        return p
-    else:
+    concepts = []
+    if itemsoup.find('concept-body'):
+        concepts = relconc_to_rows(itemsoup.find('concept-body')\
+                                   .find('related-concepts'))
+
+    fields['xml_repr'] = unicode(itemsoup)
+    return EntryRow('landmark', get_item_ID(itemsoup), fields, None,
+                    find_mentions(header), concepts, find_refs(itemsoup))
+
+
+def pers_to_row(itemsoup):
+    '''Extract a person from XML and build a row for it.'''
+    header = itemsoup.find('person-header')
+    if not header:
         exit()
+    pers_name = header.person.persname
+    fields = {}
+    fields['name'] = itemsoup['value']
+    fields['additional_names'] = if_exists(pers_name.addNames)
+    fields['forename'] = if_exists(pers_name.forename)
+    fields['surname'] = if_exists(pers_name.surname)
+    fields['maidenname'] = if_exists(pers_name.maidenname)
+    fields['rolename'] = if_exists(pers_name.rolename)
+    fields['genname'] = if_exists(pers_name.genname)
+    fields['description'] = if_exists(header.person.description)
 
+    # Related concepts
+    concepts = []
+    if itemsoup.find('concept-body'):
+        concepts = relconc_to_rows(itemsoup.find('concept-body')\
+                                   .find('related-concepts'))
 
+    fields['xml_repr'] = unicode(itemsoup)
+    return EntryRow('person', get_item_ID(itemsoup), fields, None,
+                    find_mentions(header), concepts, find_refs(itemsoup))
 
-def persgr_to_db(itemsoup,ref_dict):
-    '''
-    Extract a persongroup from XML and write it into the database.
-    '''
+
+def persgr_to_row(itemsoup):
+    '''Extract a persongroup from XML and build a row for it.'''
     header = itemsoup.find('persongroup-header')
-    
-    pg = PersonGroup()
-    pg.name = header.find('group-name').get_text()
-    pg.id = get_item_ID()
-    pg.xml_repr = itemsoup
-    pg.save()
-    
-    # Mentionings + related index entries
-    ment_to_db(itemsoup.find('persongroup-header'), pg)
-    ref_dict[pg.id] = header.find('index-refs')
-    
-    # Related concepts
+    fields = {}
+    fields['name'] = header.find('group-name').get_text()
+
+    # Members
+    members = []
     if itemsoup.find('listing-body'):
-        add_all(pg.members, relconc_to_db(itemsoup.find('listing-body').members\
-               , createElement=create_person))
-    
-    print(pg)
-    return pg
+        members = relconc_to_rows(itemsoup.find('listing-body').members,
+                                  createRow=person_to_row)
 
+    fields['xml_repr'] = unicode(itemsoup)
+    return EntryRow('persongroup', get_item_ID(itemsoup), fields, None,
+                    find_mentions(header), members, find_refs(itemsoup))
 
 
-def fam_to_db(itemsoup, ref_dict):
-    '''Extract a family from XML and write it into the database.'''
+def fam_to_row(itemsoup):
+    '''Extract a family from XML and build a row for it.'''
     header = itemsoup.find('family-header')
-    
-    f = Family() 
-    f.name = itemsoup['value'].strip(' ,;.')
-    f.addnames = if_exists(header.addnames)
-    f.id = get_item_ID()
-    f.xml_repr = itemsoup
-    f.save()
-    
-    # mentioned_in + related index entries 
-    ment_to_db(itemsoup.find('family_header'), f)
-    ref_dict[f.id] = header.find('index-refs')
-    
-    # related-concepts
+    fields = {}
+    fields['name'] = itemsoup['value'].strip(' ,;.')
+
+    # Members
+    members = []
     if itemsoup.find('listing-body'):
-        add_all(f.members, relconc_to_db(itemsoup.find('listing-body').members\
-                , createElement=create_person))
-    
-    print (f)
-    return f
+        members = relconc_to_rows(itemsoup.find('listing-body').members,
+                                  createRow=person_to_row)
+
+    fields['xml_repr'] = unicode(itemsoup)
+    return EntryRow('family', get_item_ID(itemsoup), fields, None,
+                    find_mentions(header), members, find_refs(itemsoup))
+
+
+def item_to_row(itemsoup):
+    '''
+    Build a row for a single XML index item. Return None if the item
+    has an unknown type.
+    '''
+    type = itemsoup['type']
+
+    if type == 'location':
+        row = loc_to_row(itemsoup)
+
+    elif type == 'family':
+        row = fam_to_row(itemsoup)
+
+    elif type == 'person':
+        row = pers_to_row(itemsoup)
+
+    elif type == 'persongroup':
+        row = persgr_to_row(itemsoup)
+
+    elif type == 'landmark':
+        row = land_to_row(itemsoup)
+
+    else:
+        row = None
+        print ('unknown type!!')
+    return row
+
+
+########################## 2. Rows to db ###########################
+
+def create_quote(content, objId):
+    '''Write a quote into the database.'''
+    q = Quote()
+    q.content_type = ContentType.objects.get_for_model(Concept)
+    q.content = content
+    q.object_id = objId
+    q.save()
+    return q
+
+
+def get_region(name, region_type):
+    '''Return the region with the given name, creating it if needed.'''
+    regs = Region.objects.filter(name=name)
+    if regs:
+        return regs[0]
+    return Region.objects.create(name=name, region_type=region_type)
+
+
+def write_concept(row):
+    '''
+    Write a concept (or person) row and its nested related concepts
+    into the database.
+    '''
+    global idConc
+
+    if row.type == 'person':
+        c = Person(**row.fields)
+    else:
+        c = Concept(**row.fields)
+    c.id = idConc
+    idConc += 1
+    c.save()
+
+    for quote in row.quotes:
+        create_quote(quote, c.id)
+    ment_to_db(row.mentions, c)
+    relations.add(c.related_concepts,
+                  [write_concept(relConc) for relConc in row.concepts])
+    return c
+
+
+def write_entry(row):
+    '''
+    Write an index entry row and everything that belongs to it into
+    the database.
+    '''
+    entry = dict(entryModels)[row.type](**row.fields)
+    if row.region:
+        entry.region = get_region(*row.region)
+        if 'country' not in row.fields and \
+                entry.region.region_type == 'Bundesland':
+            entry.country = "Deutschland"
+    entry.id = row.id
+    entry.save()
+
+    # Mentionings
+    ment_to_db(row.mentions, entry)
+
+    # Related concepts (members for persongroups and families)
+    concepts = [write_concept(conc) for conc in row.concepts]
+    if row.type == 'persongroup' or row.type == 'family':
+        relations.add(entry.members, concepts)
+    else:
+        relations.add(entry.related_concepts, concepts)
+
+    print(entry)
+    return entry
+
+
+def item_to_db(itemsoup, ref_dict):
+    '''
+    Add a single XML index item to the database. Return None if the
+    item has an unknown type.
+    '''
+    row = item_to_row(itemsoup)
+    if row is None:
+        return None
+    ref_dict[row.id] = row.refs
+    return write_entry(row)
+
 
- 
 def items_to_db(itemList):
     '''Add a list of XML index items to the database.'''
     ref_dict = {}
     for itemsoup in itemList:
-        type = itemsoup['type']
-
-        if type == 'location':
-            entry = loc_to_db(itemsoup,ref_dict)
-        
-        elif type == 'family':
-            entry = fam_to_db(itemsoup,ref_dict)
-          
-        elif type == 'person':
-            entry = pers_to_db(itemsoup,ref_dict)
-        
-        elif type == 'persongroup':
-            entry = persgr_to_db(itemsoup,ref_dict)
-        
-        elif type == 'landmark':
-            entry = land_to_db(itemsoup,ref_dict)
-    
-        else:
-            entry = ''
-            print ('unknown type!!')
+        if item_to_db(itemsoup, ref_dict) is None:
             break
     return  ref_dict
 
 
+class EntryWriter(threading.Thread):
+    '''
+    Thread that takes index entry rows from a queue and writes them
+    into the database, one transaction per batch of rows. A None row
+    marks the end of the input.
+
+    The writes advance the generation of the corpus along with those
+    of the thread that created the writer, if it is inside a
+    deferred_bump block, or else once the writer is done.
+    '''
+
+    def __init__(self, rows, batchSize):
+        threading.Thread.__init__(self)
+        self.rows = rows
+        self.batchSize = batchSize
+        self.ref_dict = {}
+        self.error = None
+        self.pending = pending_bumps()
+
+    def run(self):
+        try:
+            with deferred_bump(self.pending):
+                done = False
+                while not done:
+                    batch = []
+                    while len(batch) < self.batchSize:
+                        row = self.rows.get()
+                        if row is None:
+                            done = True
+                            break
+                        batch.append(row)
+                    # After an error, keep draining the queue so that
+                    # the parsing thread does not block on a full queue.
+                    if batch and self.error is None:
+                        self.write_batch(batch)
+        finally:
+            connection.close()
+
+    def write_batch(self, batch):
+        '''Write a batch of rows into the database.'''
+        try:
+            with transaction.commit_on_success():
+                for row in batch:
+                    write_entry(row)
+                    self.ref_dict[row.id] = row.refs
+        except Exception:
+            self.error = sys.exc_info()
+
+
+def iter_items(xmlText):
+    '''
+    Parse the items in the index of an XML document one at a time,
+    instead of building a single soup for the whole document.
+    '''
+    start = xmlText.find('<index')
+    end = xmlText.find('</index>', start)
+    for match in re.finditer('(?s)<item .*?</item>', xmlText[start:end]):
+        yield BeautifulSoup(match.group(0)).find('item')
+
+
+def pipelined_items_to_db(itemIter, queueSize=1000, batchSize=200):
+    '''
+    Add XML index items to the database, turning items into rows in
+    this thread while a single writer thread writes the rows into the
+    database in batches. The queue between both threads holds at most
+    queueSize rows; parsing blocks while it is full.
+
+    Since the rows are written from a separate thread, this needs a
+    database that is shared between connections (such as the sqlite
+    file sbr-regesten.db, but not an in-memory database).
+    '''
+    rows = Queue.Queue(maxsize=queueSize)
+    writer = EntryWriter(rows, batchSize)
+    writer.start()
+    try:
+        for itemsoup in itemIter:
+            row = item_to_row(itemsoup)
+            if row is None or writer.error:
+                break
+            rows.put(row)
+    finally:
+        rows.put(None)
+        writer.join()
+    if writer.error:
+        raise writer.error[0], writer.error[1], writer.error[2]
+    return writer.ref_dict
+
+
 def isolate_id(id):
     '''Return the number in an id.'''
     return int(id.split('_')[1])
 
 
-def solve_refs(ref_dict):
+def solve_refs(ref_dict, only=None):
     '''
     Extract references from the dictionary and add them to the database.
+    If only is given, just solve references from or to the items whose
+    ids it contains.
     '''
-    for item_id, refNode in ref_dict.items():
-        if refNode:
-            refList = [node['itemid'] for node in refNode.findAll('index-ref')]
-            objList = [IndexEntry.objects.get(id=isolate_id(ref)) for ref in refList]
+    for item_id, refList in ref_dict.items():
+        if refList:
+            if only is not None and item_id not in only and \
+                    only.isdisjoint(refList):
+                continue
+            objList = IndexEntry.objects.filter(id__in=refList)
+            if len(objList) < len(set(refList)):
+                print(str(item_id) + ': index-ref could not be solved')
             obj = IndexEntry.objects.get(id=item_id)
-            add_all(obj.related_entries, objList)
+            relations.add(obj.related_entries, objList)
+
 
+def stored_model(item_id):
+    '''Return the model an index item is currently stored as.'''
+    for type, model in entryModels:
+        if model.objects.filter(pk=item_id).exists():
+            return model
 
 
-def index_to_db():
+def nested_concept_ids(item_id, itemIds):
+    '''
+    Return the ids of all concepts (and persons) that were created for
+    the body of an index item, i.e. its (nested) related concepts and
+    its members.
+    '''
+    members = PersonGroup.members.through.objects.filter(
+        persongroup=item_id).values_list('person', flat=True)
+    found = set(members)
+    frontier = found | set([item_id])
+    while frontier:
+        relConcs = Concept.related_concepts.through.objects.filter(
+            from_concept__in=frontier).values_list('to_concept', flat=True)
+        frontier = set(relConcs) - found - itemIds - set([item_id])
+        found |= frontier
+    return found
+
+
+def clear_item(item_id, itemIds):
+    '''
+    Remove everything an index item added to the database besides the
+    index entry itself: the concepts created for its body and all
+    relations starting or ending at the entry.
+    '''
+    Concept.objects.filter(id__in=nested_concept_ids(item_id, itemIds))\
+        .delete()
+    Concept.related_concepts.through.objects.filter(
+        from_concept=item_id).delete()
+    Concept.related_concepts.through.objects.filter(
+        to_concept=item_id).delete()
+    PersonGroup.members.through.objects.filter(persongroup=item_id).delete()
+    IndexEntry.related_entries.through.objects.filter(
+        from_indexentry=item_id).delete()
+    IndexEntry.related_entries.through.objects.filter(
+        to_indexentry=item_id).delete()
+
+
+def delete_item(item_id, itemIds):
+    '''Delete an index item and everything it added to the database.'''
+    clear_item(item_id, itemIds)
+    model = stored_model(item_id)
+    if model:
+        model.objects.filter(pk=item_id).delete()
+
+
+def update_items(itemList):
+    '''
+    Bring the index entries in the database in line with a list of XML
+    index items. Items whose XML did not change are skipped, changed
+    items are updated in place and entries whose items vanished from
+    the list are deleted. Return the ids of all affected entries.
+    '''
+    stored = dict(IndexEntry.objects.exclude(xml_repr='')\
+                  .values_list('id', 'xml_hash'))
+    itemIds = set(get_item_ID(itemsoup) for itemsoup in itemList)
+    allIds = itemIds | set(stored)
+    ref_dict = {}
+    affected = set()
+
+    for itemsoup in itemList:
+        item_id = get_item_ID(itemsoup)
+        if stored.get(item_id) == content_hash(itemsoup):
+            ref_dict[item_id] = find_refs(itemsoup)
+            continue
+        if item_id in stored:
+            if stored_model(item_id) is dict(entryModels).get(
+                    itemsoup['type']):
+                clear_item(item_id, allIds)
+            else:
+                delete_item(item_id, allIds)
+        affected.add(item_id)
+        if item_to_db(itemsoup, ref_dict) is None:
+            break
+
+    for item_id in set(stored) - itemIds:
+        print('Deleting index entry ' + str(item_id))
+        delete_item(item_id, allIds)
+        affected.add(item_id)
+
+    solve_refs(ref_dict, only=affected)
+    return affected
+
+
+def index_to_db(incremental=False, pipelined=False):
     '''
     Extract index items from the XML file and write them into the
     database sbr-regesten.db.
+
+    By default, all items are inserted into an empty database. If
+    pipelined is True, items are parsed one at a time while they are
+    written into the database (see pipelined_items_to_db). If
+    incremental is True, an index that is already stored in the
+    database is updated instead (see update_items).
     '''
     print('Writing index into db..')
     
-    with codecs.open ('sbr-regesten.xml', 'r', 'utf-8') as file:
-        soup = BeautifulSoup(file)
-        itemList = soup.find('index').findAll('item')
-        
-        global countIndex
-        countIndex = 0
-        global idConc
-        idConc = len(itemList) + 1
-        
-        ref_dict = items_to_db(itemList)
-        solve_refs(ref_dict)
+    # The generation of the corpus is advanced once, after writing the
+    # whole index. Relations are written in bulk, which sends no
+    # signals, so they are announced explicitly.
+    with deferred_bump():
+        with codecs.open ('sbr-regesten.xml', 'r', 'utf-8') as file:
+            global idConc
+
+            if incremental:
+                soup = BeautifulSoup(file)
+                itemList = soup.find('index').findAll('item')
+                with transaction.commit_on_success():
+                    idConc = max([get_item_ID(itemsoup) for itemsoup in \
+                                  itemList] + [max_concept_ID()]) + 1
+                    affected = update_items(itemList)
+                    print('{0} index entries changed.'.format(len(affected)))
+                    relations.flush()
+                    corpus_changed(Concept)
+                return
+
+            if pipelined:
+                xmlText = file.read()
+                itemIds = re.findall('<item [^>]*?id="item_(\d+)"', xmlText)
+                idConc = max([int(item_id) for item_id in itemIds] or [0]) + 1
+                ref_dict = pipelined_items_to_db(iter_items(xmlText))
+            else:
+                soup = BeautifulSoup(file)
+                itemList = soup.find('index').findAll('item')
+                idConc = max([get_item_ID(itemsoup)
+                              for itemsoup in itemList] or [0]) + 1
+                ref_dict = items_to_db(itemList)
+
+            solve_refs(ref_dict)
+            print('Writing {0} relations into db..'.format(len(relations)))
+            relations.flush()
+            corpus_changed(Concept)
+
+
+def max_concept_ID():
+    '''Return the highest id of any concept or index entry.'''
+    ids = list(Concept.objects.values_list('id', flat=True)\
+               .order_by('-id')[:1])
+    ids += list(IndexEntry.objects.values_list('id', flat=True)\
+                .order_by('-id')[:1])
+    return max(ids or [0])
@@ -6,10 +6,12 @@ Author: Susanne Fertmann <s9sufert@stud.uni-saarland.de>
 
 
 from bs4 import BeautifulSoup, Tag, NavigableString
+from bisect import bisect_left
 import codecs
 import string
 import re
 import sys
+from regesten_webapp.utils import name_key
 
 sys.setrecursionlimit(10000)
 
@@ -790,7 +792,7 @@ def listing_body_to_XML(body):
     membersTag = soup.new_tag('members')
     listBodyTag.append(membersTag)
 
-    personList = str(body).split('<br>')
+    personList = re.split('<br/?>', str(body))
     concList = []
     hyp = ''
     personTag = None
@@ -882,7 +884,7 @@ def conc_body_to_XML(body):
     concepts.
     '''
     listBodyTag = soup.new_tag('concept-body')
-    bodyList = str(body).split('<br>')
+    bodyList = re.split('<br/?>', str(body))
 
     if not body.get_text():
         return listBodyTag
@@ -1086,7 +1088,7 @@ def extract_items():
                 htmlItem=preprocess(htmlItem)
                 s = unicode(htmlItem)
 
-                lineList = s.split('<br>')
+                lineList = re.split('<br/?>', s)
                 h = lineList[0]
                 b = ''
                 restList = lineList[1:]
@@ -1196,6 +1198,40 @@ def classify_and_parse(items):
 
 #########################################
 
+def siehe_index(items):
+    '''
+    Return a sorted list of (name key, position, item) triples for the
+    xml items in a list of items, keyed by the first names in their
+    values (see regesten_webapp.utils.name_key).
+    '''
+    return sorted((name_key(i['value'].split('/')[0]), position, i)
+                  for position, i in enumerate(items)
+                  if not isinstance(i, IndexItem))
+
+
+def find_siehe_target(n, index, items):
+    '''
+    Find the xml item a siehe-item refers to by the name n: the first
+    item whose name has the same key as n, else the first item whose
+    name key starts with the key of n (both looked up in index, see
+    siehe_index), else the first item whose value contains n.
+    '''
+    key = name_key(n)
+    if key:
+        start = bisect_left(index, (key,))
+        matches = []
+        for k, position, i in index[start:]:
+            if not k.startswith(key):
+                break
+            matches.append((k != key, position, i))
+        if matches:
+            return min(matches)[2]
+    for i in items:
+        if not isinstance(i, IndexItem) and n in i['value'].strip():
+            return i
+    return None
+
+
 def postprocess_siehe(items):
     '''
     Postprocess a list of items. Solves references in the headers of
@@ -1203,6 +1239,7 @@ def postprocess_siehe(items):
     them to the complete list of xml items.
     '''
     xmlItemsComplete = []
+    index = siehe_index(items)
     
     for item in items:
         if not isinstance(item, IndexItem):
@@ -1214,32 +1251,29 @@ def postprocess_siehe(items):
             if sieheMatch:
                 n = sieheMatch.group(1).strip().split('/')[0]
                 itemTag = soup.new_tag('item')
-                for i in items:
-                    if not isinstance(i, IndexItem):
-                        if n in i['value'].strip():
-                            type = i['type']
-                            itemTag['type'] = type
-                            itemTag['value'] = item.header.b.get_text()
-                            itemTag['id'] = 'item_' + \
-                                                  str(item.header['tmp_id'])
-                            if not type:
-                              print (value+': unknown type.')
-                                
-                            if type == 'location':
-                              settleType = i.find('location-header').placeName\
-                                            .settlement['type']
-                              value, header = loc_header_to_XML(item.header)
-                              header.placeName.settlement['type'] = settleType
-                              itemTag.append(header)
-                              itemTag.append(conc_body_to_XML(item.body))
-                                
-                            if type == 'family':
-                              value, header = fam_header_to_XML(item.header)
-                              itemTag.append(header)
-                              itemTag.append(listing_body_to_XML(item.body))
-
-                            xmlItemsComplete.append(itemTag)
-                            break
+                i = find_siehe_target(n, index, items)
+                if i is not None:
+                    type = i['type']
+                    itemTag['type'] = type
+                    itemTag['value'] = item.header.b.get_text()
+                    itemTag['id'] = 'item_' + str(item.header['tmp_id'])
+                    if not type:
+                      print (value+': unknown type.')
+                        
+                    if type == 'location':
+                      settleType = i.find('location-header').placeName\
+                                    .settlement['type']
+                      value, header = loc_header_to_XML(item.header)
+                      header.placeName.settlement['type'] = settleType
+                      itemTag.append(header)
+                      itemTag.append(conc_body_to_XML(item.body))
+                        
+                    if type == 'family':
+                      value, header = fam_header_to_XML(item.header)
+                      itemTag.append(header)
+                      itemTag.append(listing_body_to_XML(item.body))
+
+                    xmlItemsComplete.append(itemTag)
     return xmlItemsComplete
 
 
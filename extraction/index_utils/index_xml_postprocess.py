@@ -11,27 +11,41 @@ import string
 import re
 import sys
 from bs4 import BeautifulSoup, Tag, NavigableString
+from regesten_webapp.utils import name_key
 
 
 
-def getItemIndex(itemList, name):
-    ''' Find index item with a certain name (string). Return its id.'''
-    matched = False
+def itemIndex(itemList):
+    '''
+    Map the name keys (see regesten_webapp.utils.name_key) of the names
+    of index items to lists of (name, id) pairs of the items.
+    '''
+    index = {}
     for item in itemList:
-        if unicode(re.split('/',item['value'])[0]).strip() == unicode(name):
-            if matched:
-                return None
-            matched = True
-            id = item['id']
-    if matched:
-            return id
+        name = unicode(re.split('/',item['value'])[0]).strip()
+        index.setdefault(name_key(name), []).append((name, item['id']))
+    return index
+
+
+def getItemIndex(index, name):
+    '''
+    Find index item with a certain name (string) in index (see
+    itemIndex). Return its id, or None if no single item matches. Items
+    spelling the name exactly the same way are preferred.
+    '''
+    items = index.get(name_key(name), [])
+    if len(items) > 1:
+        items = [item for item in items if item[0] == unicode(name)]
+    if len(items) == 1:
+        return items[0][1]
     return None
 
     
-def parseSiehe(inItem, itemList):
+def parseSiehe(inItem, index):
     '''
     Parse references to other index entries (index-refs). Find the
-    single references in the index-refs tag, solve and tag them.
+    single references in the index-refs tag, solve and tag them, looking
+    up the referenced entries in index (see itemIndex).
     '''
     soup=BeautifulSoup()
     sieheNames = ''
@@ -50,7 +64,7 @@ def parseSiehe(inItem, itemList):
         first = True
         for sieheName in sieheNames:
             name = sieheName.strip()
-            id = getItemIndex (itemList, name)
+            id = getItemIndex (index, name)
             if id:
                 indexRefTag = soup.new_tag('index-ref')
                 indexRefTag['itemid'] = id
@@ -74,7 +88,7 @@ def parseSiehe(inItem, itemList):
         else:
             outItem = sieheMatch.group(1) + sieheMatch.group(2)
 
-        outItem += parseSiehe(sieheMatch.group(3), itemList)
+        outItem += parseSiehe(sieheMatch.group(3), index)
         sieheNames = ''
         return outItem
     else:
@@ -92,7 +106,7 @@ def index_xml_postprocess():
             outFile.write('\n')
             inXml = inFile.read()
             inXmlSoup = BeautifulSoup(inXml)
-            itemList = inXmlSoup.find_all('item')
+            index = itemIndex(inXmlSoup.find_all('item'))
             lines = inXml.split('\n')
             
             for line in lines:
@@ -104,7 +118,7 @@ def index_xml_postprocess():
                     header = headerMatch.group(2)
                     header = re.sub('<.?index-refs>','', header)
                     outItem = headerMatch.group(1) + parseSiehe(header, \
-                              itemList) + headerMatch.group(3)
+                              index) + headerMatch.group(3)
                 else:
                     outItem = line
                 outFile.write(outItem)
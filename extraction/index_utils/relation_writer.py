@@ -0,0 +1,75 @@
+"""
+This module provides a buffered writer for many-to-many relations.
+"""
+
+from django.db import transaction
+
+
+class RelationWriter(object):
+    '''
+    Collect rows for the through tables of many-to-many relations and
+    write them to the database in batches.
+
+    Rows are buffered as (from_id, to_id) pairs per through table and
+    deduplicated before they are written. For symmetrical relations
+    (e.g. Concept.related_concepts) the reverse pair is buffered as
+    well, just like the related manager does on .add(). Note that no
+    m2m_changed signals are sent for rows written by flush().
+    '''
+
+    def __init__(self, batch_size=400):
+        # SQLite allows at most 999 variables per statement, and every
+        # row of a through table takes up two of them.
+        self.batch_size = batch_size
+        self.pending = {}
+
+    def add(self, manager, objs):
+        '''
+        Buffer relations between the instance a related manager
+        belongs to and a list of objects (or primary keys).
+        '''
+        key = (manager.through, manager.source_field_name,
+               manager.target_field_name)
+        pairs = self.pending.setdefault(key, set())
+        from_id = manager._fk_val
+        for obj in objs:
+            if isinstance(obj, manager.model):
+                to_id = manager._get_fk_val(obj, manager.target_field_name)
+            else:
+                to_id = obj
+            pairs.add((from_id, to_id))
+            if manager.symmetrical:
+                pairs.add((to_id, from_id))
+
+    def __len__(self):
+        return sum(len(pairs) for pairs in self.pending.values())
+
+    def flush(self):
+        '''
+        Write all buffered relations to the database, skipping rows
+        that already exist. Return the number of rows written.
+        '''
+        written = 0
+        with transaction.commit_on_success():
+            for (through, source, target), pairs in self.pending.items():
+                pairs = pairs - self._existing_pairs(
+                    through, source, target, pairs)
+                rows = [through(**{source + '_id': from_id,
+                                   target + '_id': to_id})
+                        for from_id, to_id in sorted(pairs)]
+                for start in range(0, len(rows), self.batch_size):
+                    through._default_manager.bulk_create(
+                        rows[start:start + self.batch_size])
+                written += len(rows)
+        self.pending = {}
+        return written
+
+    def _existing_pairs(self, through, source, target, pairs):
+        '''Return the subset of pairs already stored in through.'''
+        from_ids = sorted(set(from_id for from_id, to_id in pairs))
+        existing = set()
+        for start in range(0, len(from_ids), self.batch_size):
+            existing.update(through._default_manager.filter(**{
+                source + '__in': from_ids[start:start + self.batch_size]
+                }).values_list(source, target))
+        return existing
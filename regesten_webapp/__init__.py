@@ -59,6 +59,18 @@ OFFSET_TYPES = (
     ('kurz nach', 'kurz nach'),
     ('post', 'post'))
 
+# Number of days by which an offset widens a date when looking for
+# dates that overlap a given period, as (days before, days after).
+# Start dates are moved back by the first value of their offset, end
+# dates are moved forward by the second value of theirs.
+OFFSET_MARGINS = {
+    'vor': (365, 0),
+    'nach': (0, 365),
+    'kurz nach': (0, 30),
+    'post': (0, 365),
+    'um': (365, 365),
+    'ca.': (365, 365)}
+
 REGION_TYPES = (
     ('Bundesland', 'Bundesland'),
     ('Departement', 'Departement'),
@@ -7,15 +7,135 @@ in-depth descriptions of all possible configuration options.
 Author: Tim Krones <tkrones@coli.uni-saarland.de>
 """
 
+import hashlib
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.contenttypes.generic import GenericStackedInline
 from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db.models import ForeignKey, TextField
+from django.db.models.query import QuerySet
 from django.utils.translation import ugettext as _
 
 from regesten_webapp.models import Archive, Concept, Family
 from regesten_webapp.models import Footnote, Landmark, Location
 from regesten_webapp.models import MetaInfo, Person, PersonGroup
-from regesten_webapp.models import Quote, Regest, Region
+from regesten_webapp.models import Quote, Regest, Region, name_lookup
+from regesten_webapp.generation import cache_key, deferring_bumps
+from regesten_webapp.search import index_for
+from regesten_webapp.widgets import AutocompleteSelectMultiple
+
+
+# Number of seconds counts of changelist results are kept in the cache.
+COUNT_TIMEOUT = 24 * 60 * 60
+
+
+class CachedCountQuerySet(QuerySet):
+    """
+    Queryset counting its objects only once per generation of the
+    corpus (see generation.py), so that paging through a changelist
+    does not scan the whole table for every page.
+    """
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        sql, params = self.query.sql_with_params()
+        key = cache_key('count', hashlib.sha1(
+                repr((self.db, sql, params))).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            count = super(CachedCountQuerySet, self).count()
+            cache.set(key, count, COUNT_TIMEOUT)
+        return count
+
+
+class FullTextChangeList(ChangeList):
+    """
+    Changelist looking up search terms in the full-text index of its
+    model (see search.py) instead of scanning the search fields with
+    LIKE. Search fields that are not indexed are still scanned.
+    Concepts are also found by name (see models.name_lookup), so that
+    e.g. "Meyer" also finds "Meier".
+
+    Objects referenced by foreign keys in list_display are loaded
+    along with the results, so that a page costs a fixed number of
+    queries, and text fields that are not displayed (such as XML
+    representations) are not loaded at all.
+    """
+
+    def get_query_set(self, request):
+        query, self.query = self.query, ''
+        try:
+            queryset = super(FullTextChangeList, self).get_query_set(request)
+        finally:
+            self.query = query
+        if query:
+            index = index_for(self.model)
+            matches = index.filter(
+                queryset, query, [field for field in self.search_fields
+                                  if field not in index.fields])
+            if issubclass(self.model, Concept):
+                matches |= queryset.filter(
+                    name_lookup(query, prefix=True, model=self.model))
+            queryset = matches
+        fields = [field for field in self.lookup_opts.fields
+                  if field.name in self.list_display]
+        related = [field.name for field in fields
+                   if isinstance(field, ForeignKey)]
+        if related:
+            queryset = queryset.select_related(*related)
+        # Deferred loading mixes up the columns of models inheriting
+        # from several models (like Person) in Django 1.4.
+        if self.lookup_opts.parents:
+            return queryset
+        return queryset.defer(*[
+                field.name for field in self.lookup_opts.fields
+                if isinstance(field, TextField) and field not in fields])
+
+
+class DeferredBumpAdmin(admin.ModelAdmin):
+    """
+    Base class of the ModelAdmins for models making up the corpus.
+    Their views advance the generation of the corpus (see
+    generation.py) only once they returned, i.e. after committing the
+    objects they saved.
+    """
+
+    add_view = deferring_bumps(admin.ModelAdmin.add_view)
+    change_view = deferring_bumps(admin.ModelAdmin.change_view)
+    changelist_view = deferring_bumps(admin.ModelAdmin.changelist_view)
+    delete_view = deferring_bumps(admin.ModelAdmin.delete_view)
+
+
+class CorpusAdmin(DeferredBumpAdmin):
+    """
+    Base class of the ModelAdmins for regests and concepts. Their
+    changelists search the full-text index of their model, and count
+    results once per generation of the corpus. Many-to-many fields
+    listed in autocomplete_fields are edited with autocomplete widgets
+    instead of select boxes holding all objects of the related model.
+    """
+
+    autocomplete_fields = [
+        'mentions', 'related_concepts', 'related_entries', 'members']
+
+    def get_changelist(self, request, **kwargs):
+        return FullTextChangeList
+
+    def formfield_for_manytomany(self, db_field, request=None, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = AutocompleteSelectMultiple(reverse(
+                    'api-autocomplete',
+                    kwargs={'model': db_field.rel.to._meta.module_name}))
+        return super(CorpusAdmin, self).formfield_for_manytomany(
+            db_field, request, **kwargs)
+
+    def queryset(self, request):
+        return super(CorpusAdmin, self).queryset(request)._clone(
+            klass=CachedCountQuerySet)
 
 
 class FootnoteInline(admin.StackedInline):
@@ -32,7 +152,7 @@ class MetaInfoInline(admin.StackedInline):
     model = MetaInfo
 
 
-class RegestAdmin(admin.ModelAdmin):
+class RegestAdmin(CorpusAdmin):
     fieldsets = (
         (None, {
             'fields': (('title', 'location', 'regest_type'),)
@@ -54,11 +174,12 @@ class RegestAdmin(admin.ModelAdmin):
         MetaInfoInline,
         ]
     list_display = ['title', 'location', 'regest_type']
+    ordering = ['earliest_start', 'id']
     radio_fields = { 'author': admin.VERTICAL }
     search_fields = ['title', 'content']
 
 
-class ConceptAdmin(admin.ModelAdmin):
+class ConceptAdmin(CorpusAdmin):
     fieldsets = (
         (None, {
             'fields': ('name', 'description')
@@ -202,7 +323,7 @@ class RegionAdmin(admin.ModelAdmin):
 admin.site.unregister(Site)
 
 admin.site.register(Regest, RegestAdmin)
-admin.site.register(Archive)
+admin.site.register(Archive, DeferredBumpAdmin)
 admin.site.register(Concept, ConceptAdmin)
 admin.site.register(Landmark, LandmarkAdmin)
 admin.site.register(Location, LocationAdmin)
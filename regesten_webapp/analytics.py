@@ -0,0 +1,249 @@
+"""
+This module provides corpus-wide statistics over the dates of the Sbr
+Regesten, e.g. for timeline charts.
+
+The dates of all regests are loaded into NumPy arrays in a single
+pass over the RegestDate table and kept in memory until the generation
+of the corpus changes (see generation.py), so statistics are computed
+with vectorized operations instead of going through RegestDate
+instances one by one.
+"""
+
+import threading
+
+import numpy as np
+
+from datetime import date
+from django.db import DEFAULT_DB_ALIAS
+from regesten_webapp import OFFSET_MARGINS
+from regesten_webapp.generation import generation
+from regesten_webapp.models import RegestDate
+
+# Ordinal of the day NumPy counts datetime64 values from.
+EPOCH = date(1970, 1, 1).toordinal()
+
+# Number of rows converted to arrays at a time while loading dates.
+CHUNK_SIZE = 10000
+
+
+class DateArrays(object):
+    """
+    Holds the dates of all regests as NumPy arrays of equal length,
+    with one element per RegestDate:
+
+    - regest: ids of the regests the dates belong to
+    - start, end: first and last day of the dates (datetime64[D])
+    - start_offset, end_offset: offsets of the dates as indexes into
+      offsets, which always starts with '' (i.e., no offset)
+    - alt_date: whether or not the dates are alternative dates
+    """
+
+    def __init__(self, regest, start, end, start_offset, end_offset,
+                 alt_date, offsets):
+        self.regest = regest
+        self.start = start
+        self.end = end
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.alt_date = alt_date
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, queryset=None):
+        """
+        Load dates from queryset (default: all RegestDate objects).
+        Rows are streamed from the database and converted to arrays
+        chunk by chunk, so no model instances are created.
+        """
+        if queryset is None:
+            queryset = RegestDate.objects.all()
+        codes = {'': 0}
+        columns = [[] for i in range(6)]
+        chunks = [[] for i in range(6)]
+
+        def flush():
+            regests, starts, ends, start_offsets, end_offsets, alt_dates = \
+                columns
+            chunks[0].append(np.array(regests, dtype=np.int64))
+            chunks[1].append(np.array(starts, dtype=np.int64))
+            chunks[2].append(np.array(ends, dtype=np.int64))
+            chunks[3].append(np.array(start_offsets, dtype=np.uint8))
+            chunks[4].append(np.array(end_offsets, dtype=np.uint8))
+            chunks[5].append(np.array(alt_dates, dtype=bool))
+            for column in columns:
+                del column[:]
+
+        for regest, start, end, start_offset, end_offset, alt_date in \
+                queryset.values_list(
+                'regest', 'start', 'end', 'start_offset', 'end_offset',
+                'alt_date').iterator():
+            columns[0].append(regest)
+            columns[1].append(start.toordinal() - EPOCH)
+            columns[2].append(end.toordinal() - EPOCH)
+            columns[3].append(codes.setdefault(start_offset, len(codes)))
+            columns[4].append(codes.setdefault(end_offset, len(codes)))
+            columns[5].append(alt_date)
+            if len(columns[0]) == CHUNK_SIZE:
+                flush()
+        flush()
+
+        regest, start, end, start_offset, end_offset, alt_date = [
+            np.concatenate(chunk) for chunk in chunks]
+        offsets = sorted(codes, key=codes.get)
+        return cls(regest, start.astype('datetime64[D]'),
+                   end.astype('datetime64[D]'), start_offset, end_offset,
+                   alt_date, offsets)
+
+    def __len__(self):
+        return len(self.regest)
+
+    @property
+    def exact(self):
+        """
+        Boolean array telling which dates are exact, i.e. have no
+        offsets (cf. RegestDate.exact).
+        """
+        return (self.start_offset == 0) & (self.end_offset == 0)
+
+    def exact_counts(self):
+        """
+        Return number of exact and approximate dates as a dict with
+        keys 'exact' and 'approximate'.
+        """
+        exact = int(np.count_nonzero(self.exact))
+        return {'exact': exact, 'approximate': len(self) - exact}
+
+    def offset_counts(self):
+        """
+        Return a dict mapping offsets to the number of dates that
+        start or end with them. '' counts dates without any offsets.
+        """
+        counts = np.bincount(self.start_offset, minlength=len(self.offsets))
+        counts += np.bincount(
+            self.end_offset[self.end_offset != self.start_offset],
+            minlength=len(self.offsets))
+        counts[0] = np.count_nonzero(self.exact)
+        return dict(zip(self.offsets, counts.tolist()))
+
+    def margins(self):
+        """
+        Return start and end of all dates widened by the margins of
+        their offsets (see OFFSET_MARGINS).
+        """
+        before = np.array([OFFSET_MARGINS.get(offset, (0, 0))[0]
+                           for offset in self.offsets])
+        after = np.array([OFFSET_MARGINS.get(offset, (0, 0))[1]
+                          for offset in self.offsets])
+        return (self.start - before[self.start_offset].astype(
+                'timedelta64[D]'),
+                self.end + after[self.end_offset].astype('timedelta64[D]'))
+
+    def overlapping(self, start, end, offsets=True):
+        """
+        Boolean array telling which dates overlap the period from
+        start to end (cf. RegestDateManager.overlapping).
+        """
+        starts, ends = self.margins() if offsets else (self.start, self.end)
+        return (starts <= np.datetime64(end, 'D')) & \
+            (ends >= np.datetime64(start, 'D'))
+
+    def count_overlapping(self, start, end, offsets=True):
+        """
+        Return number of regests with a date overlapping the period
+        from start to end (cf. RegestManager.overlapping).
+        """
+        return len(np.unique(
+                    self.regest[self.overlapping(start, end, offsets)]))
+
+    def histogram(self, unit='year', exact=None):
+        """
+        Return number of dates per year, decade, or month (depending
+        on unit) as a pair of arrays (bins, counts). Dates are counted
+        in the bin of their start. Bins run without gaps from the
+        first to the last bin holding any dates; years and decades
+        are integers (decades are identified by their first year),
+        months are datetime64[M].
+
+        If exact is True or False, only exact or approximate dates
+        are counted.
+        """
+        starts = self.start
+        if exact is not None:
+            starts = starts[self.exact == exact]
+        first, positions = self.__positions(unit, starts)
+        counts = np.bincount(positions)
+        return self.__bins(unit, first, len(counts)), counts
+
+    def overlap_histogram(self, unit='year', offsets=True):
+        """
+        Return number of dates overlapping each year, decade, or month
+        (depending on unit) as a pair of arrays (bins, counts), with
+        bins as returned by histogram. Unlike histogram, a date range
+        is counted in every bin it overlaps.
+        """
+        starts, ends = self.margins() if offsets else (self.start, self.end)
+        first, start_positions, end_positions = self.__positions(
+            unit, starts, ends)
+        size = end_positions.max() + 2 if len(end_positions) else 1
+        counts = np.cumsum(
+            np.bincount(start_positions, minlength=size) -
+            np.bincount(end_positions + 1, minlength=size))[:-1]
+        return self.__bins(unit, first, len(counts)), counts
+
+    @staticmethod
+    def __units(unit, dates):
+        """
+        Convert dates to numbers of years, decades or months since
+        1970.
+        """
+        if unit == 'month':
+            return dates.astype('datetime64[M]').astype(np.int64)
+        years = dates.astype('datetime64[Y]').astype(np.int64)
+        if unit == 'decade':
+            return (years + 1970) // 10 - 197
+        if unit == 'year':
+            return years
+        raise ValueError('Unknown unit: {0}'.format(unit))
+
+    def __positions(self, unit, *dates):
+        """
+        Convert each of the arrays in dates to positions of bins of
+        the given unit. Return the number of the first bin (relative
+        to 1970) followed by the arrays of positions.
+        """
+        values = [self.__units(unit, array) for array in dates]
+        first = min(array.min() for array in values) \
+            if any(len(array) for array in values) else 0
+        return [first] + [array - first for array in values]
+
+    @staticmethod
+    def __bins(unit, first, count):
+        """
+        Return labels for count bins of the given unit starting with
+        bin first.
+        """
+        bins = np.arange(first, first + count)
+        if unit == 'month':
+            return bins.astype('datetime64[M]')
+        if unit == 'decade':
+            return (bins + 197) * 10
+        return bins + 1970
+
+
+_lock = threading.Lock()
+_arrays = {}
+
+
+def date_arrays(using=DEFAULT_DB_ALIAS):
+    """
+    Return DateArrays holding all RegestDate objects in database
+    using. The arrays are loaded on first use and kept until the
+    generation of the corpus changes, including changes made by other
+    processes.
+    """
+    current = generation(using)
+    with _lock:
+        if using not in _arrays or _arrays[using][0] != current:
+            _arrays[using] = (
+                current, DateArrays.load(RegestDate.objects.using(using)))
+        return _arrays[using][1]
@@ -0,0 +1,218 @@
+"""
+This module provides benchmarks for the analysis of regest titles, the
+extraction of dates from them, and queries over regest dates.
+
+The benchmarks run over the regest titles used in tests.py, which
+cover all types of titles known to occur in the Sbr Regesten. Query
+benchmarks run on synthetic corpora made from these titles and write
+to the database, so they should only be run against a test database
+(see the benchmark_dates command).
+"""
+
+import ast
+import os
+import random
+import re
+import timeit
+
+from datetime import date, timedelta
+from django.db import connection
+from regesten_webapp import OFFSET_MARGINS, RegestTitleType
+from regesten_webapp.utils import RegestDateExtractor, RegestTitleAnalyzer
+from regesten_webapp.utils import TITLE_PATTERNS
+
+
+def title_corpus():
+    """
+    Return all regest titles for which tests.py checks the dates
+    extracted from them.
+    """
+    path = os.path.join(os.path.dirname(__file__), 'tests.py')
+    with open(path) as tests:
+        tree = ast.parse(tests.read(), path)
+    titles = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and \
+                isinstance(node.func, ast.Attribute) and \
+                node.func.attr == '__create_and_check_dates' and \
+                node.args and isinstance(node.args[0], ast.Str):
+            titles.append(node.args[0].s)
+    return titles
+
+
+def classify_by_cascade(title):
+    """
+    Return type of a regest title by matching it against the pattern
+    of every type separately, one after another (which is how titles
+    were classified before RegestTitleAnalyzer.classify existed).
+    """
+    for title_type, pattern in TITLE_PATTERNS:
+        if re.match(pattern, title):
+            return title_type
+    return RegestTitleType.REGULAR
+
+
+def benchmark(function, titles, repeat=5, number=100):
+    """
+    Return the best time in seconds it took to call function once for
+    every title in titles.
+    """
+    def run():
+        for title in titles:
+            function(title)
+    return min(timeit.repeat(run, repeat=repeat, number=number)) / number
+
+
+def best_time(function, repeat=3):
+    """
+    Return the best time in seconds it took to call function.
+    """
+    return min(timeit.repeat(function, repeat=repeat, number=1))
+
+
+def benchmark_classify(titles=None, out=None):
+    """
+    Compare classifying titles with RegestTitleAnalyzer.classify to
+    classifying them with the separate checks. Return a dict mapping
+    names of the methods to their times per title in microseconds.
+    """
+    titles = titles or title_corpus()
+    results = {}
+    for name, function in [('cascade', classify_by_cascade),
+                           ('classify', RegestTitleAnalyzer.classify)]:
+        results[name] = benchmark(function, titles) / len(titles) * 1e6
+        if out:
+            out.write('{0:>10}: {1:8.2f} us/title ({2} titles)\n'.format(
+                    name, results[name], len(titles)))
+    return results
+
+
+def extract_dates(title):
+    """
+    Return dates for a regest title the way Regest.extract_dates does.
+    """
+    return RegestDateExtractor.extract_dates(
+        title, RegestTitleAnalyzer.classify(title))
+
+
+def benchmark_extract_dates(titles=None, out=None):
+    """
+    Return a dict holding the time it takes to extract the dates from
+    a title in microseconds, with the cache of RegestDateExtractor
+    turned off ('extract') and on ('cached').
+    """
+    titles = titles or title_corpus()
+    cache = RegestDateExtractor.cache
+    was_enabled = cache.enabled
+    results = {}
+    try:
+        for name, enabled in [('extract', False), ('cached', True)]:
+            cache.enabled = enabled
+            results[name] = benchmark(extract_dates, titles) / \
+                len(titles) * 1e6
+            if out:
+                out.write('{0:>10}: {1:8.2f} us/title ({2} titles)\n'.format(
+                        name, results[name], len(titles)))
+    finally:
+        cache.enabled = was_enabled
+    return results
+
+
+# Number of regests in a synthetic corpus of scale 1.
+CORPUS_REGESTS = 5000
+
+YEAR_PATTERN = re.compile('\d{4}')
+
+
+def synthetic_titles(count, seed=0):
+    """
+    Return count regest titles made from the titles in tests.py by
+    moving each of them to a random year between 1200 and 1550.
+    """
+    rand = random.Random(seed)
+    corpus = title_corpus()
+    titles = []
+    for i in range(count):
+        title = rand.choice(corpus)
+        shift = rand.randint(1200, 1550) - \
+            int(YEAR_PATTERN.search(title).group())
+        titles.append(YEAR_PATTERN.sub(
+                lambda match: str(int(match.group()) + shift), title))
+    return titles
+
+
+def overlapping_in_python(start, end):
+    """
+    Return ids of regests with a date overlapping the period from
+    start to end by loading all dates and checking them one by one.
+    """
+    from regesten_webapp.models import RegestDate
+    regest_ids = set()
+    for regest_date in RegestDate.objects.all():
+        before = OFFSET_MARGINS.get(regest_date.start_offset, (0, 0))[0]
+        after = OFFSET_MARGINS.get(regest_date.end_offset, (0, 0))[1]
+        if regest_date.start - timedelta(before) <= end and \
+                regest_date.end + timedelta(after) >= start:
+            regest_ids.add(regest_date.regest_id)
+    return regest_ids
+
+
+def overlapping_in_db(start, end):
+    """
+    Return ids of regests with a date overlapping the period from
+    start to end using RegestDateManager.overlapping.
+    """
+    from regesten_webapp.models import RegestDate
+    return set(RegestDate.objects.overlapping(start, end).values_list(
+            'regest', flat=True))
+
+
+def benchmark_overlap(scales=(1, 10, 100), out=None):
+    """
+    Fill the database with synthetic corpora of the given scales and
+    measure how long it takes to find the regests overlapping a
+    decade, scanning all dates in Python, querying without the
+    composite indexes on RegestDate, and querying with them. Return
+    a list of (scale, method, milliseconds) tuples.
+
+    N.B.: This deletes all regests from the database.
+    """
+    from regesten_webapp.models import Regest, RegestDate
+    sql_path = os.path.join(
+        os.path.dirname(__file__), 'sql', 'regestdate.sqlite3.sql')
+    with open(sql_path) as sql_file:
+        sql = ''.join(line for line in sql_file
+                      if not line.startswith('--'))
+    create_indexes = [statement for statement in sql.split(';')
+                      if statement.strip()]
+    indexes = ['regesten_webapp_regestdate_start_end',
+               'regesten_webapp_regestdate_regest_start']
+    start, end = date(1420, 01, 01), date(1429, 12, 31)
+    cursor = connection.cursor()
+    results = []
+    for scale in scales:
+        RegestDate.objects.all().delete()
+        Regest.objects.all().delete()
+        Regest.objects.bulk_import(
+            {'title': title} for title in
+            synthetic_titles(int(CORPUS_REGESTS * scale)))
+        expected = overlapping_in_python(start, end)
+        for index in indexes:
+            cursor.execute('DROP INDEX IF EXISTS {0}'.format(index))
+        results.append((scale, 'scan', best_time(
+                    lambda: overlapping_in_python(start, end)) * 1000))
+        results.append((scale, 'no index', best_time(
+                    lambda: overlapping_in_db(start, end)) * 1000))
+        for statement in create_indexes:
+            cursor.execute(statement)
+        cursor.execute('ANALYZE')
+        results.append((scale, 'index', best_time(
+                    lambda: overlapping_in_db(start, end)) * 1000))
+        assert overlapping_in_db(start, end) == expected
+        if out:
+            for result in results[-3:]:
+                out.write('{0:>6} {1:>10}: {2:10.2f} ms ({3} regests, '
+                          '{4} found)\n'.format(
+                        result[0], result[1], result[2],
+                        int(CORPUS_REGESTS * scale), len(expected)))
+    return results
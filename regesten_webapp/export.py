@@ -0,0 +1,213 @@
+"""
+This module exports the corpus of the Sbr Regesten for researchers:
+regests with their dates, and index entries with their relations.
+
+Exports are produced as a stream of chunks of text, record by record,
+so that memory use does not grow with the size of the corpus: Objects
+are read in chunks of CHUNK_SIZE (by primary key, with one query per
+chunk and relation), serialized, and dropped before the next chunk is
+read. Chunks can be compressed with gzip on the fly.
+"""
+
+import zlib
+
+from collections import defaultdict
+from django.core.serializers.json import DjangoJSONEncoder
+from regesten_webapp.models import Concept, Family, Landmark, Location
+from regesten_webapp.models import Person, PersonGroup, Regest, RegestDate
+from regesten_webapp.utils import ancestor_link
+
+# Number of objects read from the database at a time.
+CHUNK_SIZE = 500
+
+# Fields that are left out of exported records.
+EXCLUDED_FIELDS = ['xml_repr', 'xml_hash']
+
+# Models of index entries, in the order in which they are exported.
+ENTRY_MODELS = [Landmark, Location, Person, PersonGroup, Family]
+
+FORMATS = ['jsonl', 'json']
+
+
+class ExportError(Exception):
+    """
+    Raised when an unknown export or format is requested.
+    """
+    pass
+
+
+def chunks(queryset, fields, chunk_size=CHUNK_SIZE):
+    """
+    Yield dicts holding the primary key (as pk) and the given fields
+    of the objects of queryset, in lists of up to chunk_size dicts,
+    ordered by primary key. Every chunk is read with a separate query
+    starting after the last object of the previous chunk.
+    """
+    pk = queryset.model._meta.pk.name
+    queryset = queryset.order_by(pk).values(pk, *fields)
+    last = None
+    while True:
+        chunk = list((queryset if last is None else queryset.filter(
+                    **{pk + '__gt': last}))[:chunk_size])
+        if not chunk:
+            return
+        for values in chunk:
+            values['pk'] = values.pop(pk)
+        last = chunk[-1]['pk']
+        yield chunk
+
+
+def _fields(model):
+    """
+    Return names of the fields of model to export, leaving out primary
+    keys and links to parent models.
+    """
+    return [field.name for field in model._meta.fields
+            if not field.primary_key and field.name not in EXCLUDED_FIELDS
+            and not (field.rel and field.rel.parent_link)]
+
+
+def _related(model, name, keys, value=None):
+    """
+    Return a list holding, for each of the given primary keys of
+    objects of the model declaring the many-to-many field name of
+    model, the list of the ids of objects related to it by the field
+    (or the values of the given field of the through model instead),
+    with a single query.
+    """
+    field = model._meta.get_field(name)
+    source = field.m2m_field_name()
+    target = value or field.m2m_reverse_field_name()
+    related = defaultdict(list)
+    for key, related_value in field.rel.through.objects.filter(
+            **{source + '__in': keys}).order_by(
+            source, field.m2m_reverse_field_name()).values_list(
+            source, target):
+        related[key].append(related_value)
+    return [related[key] for key in keys]
+
+
+def _dates(keys):
+    """
+    Return a list holding, for each of the given primary keys of
+    regests, the list of the dates of the regest, with a single query.
+    """
+    dates = defaultdict(list)
+    for values in RegestDate.objects.filter(regest__in=keys).order_by(
+            'regest', 'id').values(
+            'regest', 'start', 'start_offset', 'end', 'end_offset',
+            'alt_date'):
+        dates[values.pop('regest')].append(values)
+    return [dates[key] for key in keys]
+
+
+def regest_records(chunk_size=CHUNK_SIZE):
+    """
+    Yield one dict per regest, holding its fields, its dates, the ids
+    of the concepts it mentions, and the info of its archives.
+    """
+    for regests in chunks(Regest.objects.all(), _fields(Regest),
+                          chunk_size):
+        keys = [regest['pk'] for regest in regests]
+        relations = [
+            ('dates', _dates(keys)),
+            ('mentions', _related(Regest, 'mentions', keys)),
+            ('archives', _related(
+                    Regest, 'archives', keys, 'archive__info'))]
+        for index, record in enumerate(regests):
+            record['id'] = record.pop('pk')
+            for name, related in relations:
+                record[name] = related[index]
+            yield record
+
+
+def entry_records(chunk_size=CHUNK_SIZE):
+    """
+    Yield one dict per index entry, holding its type, its fields, the
+    id of the concept it is, and the ids of related entries, related
+    concepts, and (for groups of persons) members.
+    """
+    for model in ENTRY_MODELS:
+        names = ['related_entries', 'related_concepts']
+        if issubclass(model, PersonGroup):
+            names.append('members')
+        # Relations may be inherited from parent models, whose primary
+        # keys are stored in the through tables.
+        pk = model._meta.pk.name
+        links = dict(
+            (name, ancestor_link(model, model._meta.get_field(name).model))
+            for name in names)
+        links = dict((name, 'pk' if link == pk else link)
+                     for name, link in links.items())
+        concept = ancestor_link(model, Concept)
+        fields = _fields(model) + sorted(
+            set(links.values() + [concept]).difference(['pk']))
+        queryset = model.objects.all()
+        # Families are exported separately.
+        if model is PersonGroup:
+            queryset = queryset.filter(family__isnull=True)
+        for entries in chunks(queryset, fields, chunk_size):
+            relations = [
+                (name, _related(model, name, [
+                            entry[links[name]] for entry in entries]))
+                for name in names]
+            for index, entry in enumerate(entries):
+                record = dict(
+                    (field, entry[field]) for field in _fields(model))
+                record.update(
+                    type=model._meta.module_name, id=entry['pk'],
+                    concept=entry[concept])
+                for name, related in relations:
+                    record[name] = related[index]
+                yield record
+
+
+# Exports by name, along with the functions producing their records.
+EXPORTS = {
+    'regests': regest_records,
+    'index': entry_records,
+    }
+
+
+def serialize(records, format):
+    """
+    Yield records serialized in format, one record at a time: as JSON
+    Lines (one JSON object per line) if format is 'jsonl', or as a
+    single JSON array if format is 'json'.
+    """
+    encoder = DjangoJSONEncoder(sort_keys=True)
+    if format == 'jsonl':
+        for record in records:
+            yield encoder.encode(record) + '\n'
+        return
+    separator = '[\n'
+    for record in records:
+        yield separator + encoder.encode(record)
+        separator = ',\n'
+    yield '[]\n' if separator == '[\n' else '\n]\n'
+
+
+def gzip_stream(stream):
+    """
+    Yield the chunks of text of stream compressed to the gzip format.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in stream:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(name, format='jsonl', compress=False, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator over chunks of the export called name (see
+    EXPORTS) in format (see serialize), compressed with gzip if
+    compress is True.
+    """
+    if name not in EXPORTS:
+        raise ExportError('Unknown export: {0}'.format(name))
+    if format not in FORMATS:
+        raise ExportError('Unknown format: {0}'.format(format))
+    stream = serialize(EXPORTS[name](chunk_size), format)
+    return gzip_stream(stream) if compress else stream
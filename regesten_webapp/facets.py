@@ -0,0 +1,78 @@
+"""
+This module computes facet counts for browsing regests, i.e. the
+number of regests matching a combination of filters (see filters.py)
+per author, type, location, decade, and archive.
+
+All facets of a filter combination are computed together, with one
+pass over the matching regests plus one query for the archives, and
+stored in the cache under a key containing the generation of the
+corpus (see generation.py). Writing regests or their dates therefore
+invalidates all facet counts at once.
+"""
+
+import hashlib
+import json
+
+from collections import defaultdict
+from django.core.cache import cache
+from django.db.models import Count
+from regesten_webapp.filters import FILTER_PARAMETERS, filter_regests
+from regesten_webapp.generation import cache_key
+from regesten_webapp.models import Regest
+
+FACETS = ['author', 'regest_type', 'location', 'decade', 'archive']
+
+# Number of seconds facet counts are kept in the cache.
+FACET_TIMEOUT = 24 * 60 * 60
+
+
+def filter_key(parameters):
+    """
+    Return a string identifying the combination of filters given in
+    parameters.
+    """
+    filters = sorted((parameter, parameters[parameter])
+                     for parameter in FILTER_PARAMETERS
+                     if parameters.get(parameter))
+    return hashlib.sha1(json.dumps(filters)).hexdigest()
+
+
+def compute_facet_counts(parameters):
+    """
+    Return facet counts for the regests matching the filters given in
+    parameters as a dict mapping names of facets to lists of (value,
+    count) pairs, largest counts first. Regests without dates are not
+    counted for the decade facet. Archives are identified by their
+    info.
+    """
+    regests = filter_regests(parameters)
+    counts = dict((facet, defaultdict(int)) for facet in FACETS)
+    for author, regest_type, location, earliest_start in \
+            regests.values_list(
+            'author', 'regest_type', 'location', 'earliest_start').iterator():
+        counts['author'][author] += 1
+        counts['regest_type'][regest_type] += 1
+        counts['location'][location] += 1
+        if earliest_start is not None:
+            counts['decade'][earliest_start.year // 10 * 10] += 1
+    for row in Regest.archives.through.objects.filter(
+            regest__in=regests.values('id')).values(
+            'archive__info').annotate(count=Count('regest')):
+        counts['archive'][row['archive__info']] = row['count']
+    return dict(
+        (facet, sorted(values.items(), key=lambda item: (-item[1], item[0])))
+        for facet, values in counts.items())
+
+
+def facet_counts(parameters):
+    """
+    Return facet counts for the regests matching the filters given in
+    parameters (see compute_facet_counts), from the cache if they were
+    computed before for the current generation of the corpus.
+    """
+    key = cache_key('facets', filter_key(parameters))
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute_facet_counts(parameters)
+        cache.set(key, counts, FACET_TIMEOUT)
+    return counts
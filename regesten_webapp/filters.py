@@ -0,0 +1,79 @@
+"""
+This module provides filtering of regests by the parameters of
+requests to the search API (see views.py) and of facet counts (see
+facets.py).
+"""
+
+import re
+
+from datetime import MAXYEAR, MINYEAR, date
+from regesten_webapp.models import Regest
+from regesten_webapp.search import REGEST_INDEX
+
+# Names of the parameters regests can be filtered by.
+FILTER_PARAMETERS = ['q', 'author', 'regest_type', 'location', 'start', 'end']
+
+# Bounds of date ranges open at one end. They leave a year of room for
+# the margins by which offsets widen dates (see OFFSET_MARGINS).
+FIRST_DATE = date(MINYEAR + 1, 1, 1)
+LAST_DATE = date(MAXYEAR - 1, 12, 31)
+
+DATE_PARAMETER_PATTERN = re.compile(r'^(\d{4})(?:-(\d{2})(?:-(\d{2}))?)?$')
+
+
+class InvalidParameter(Exception):
+    """
+    Raised when a parameter of a request has an invalid value.
+    """
+    pass
+
+
+def parse_date(value, end=False):
+    """
+    Parse a date given as YYYY, YYYY-MM or YYYY-MM-DD. Missing parts
+    default to the first day (or to the last day, if end is True) of
+    the year or month.
+    """
+    match = DATE_PARAMETER_PATTERN.match(value)
+    if not match:
+        raise InvalidParameter('Invalid date: {0}'.format(value))
+    year, month, day = match.groups()
+    try:
+        if month is None:
+            return date(int(year), 12, 31) if end else date(int(year), 1, 1)
+        if day is None:
+            first = date(int(year), int(month), 1)
+            if not end:
+                return first
+            following = date(first.year + first.month // 12,
+                             first.month % 12 + 1, 1)
+            return date.fromordinal(following.toordinal() - 1)
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        raise InvalidParameter('Invalid date: {0}'.format(value))
+
+
+def filter_regests(parameters, queryset=None):
+    """
+    Restrict queryset (default: all regests) to regests matching the
+    text (q), author, regest_type, location, and date range (start,
+    end) given in parameters. A regest matches a date range if one of
+    its dates overlaps it (see RegestManager.overlapping).
+    """
+    if queryset is None:
+        queryset = Regest.objects.all()
+    if parameters.get('q'):
+        queryset = REGEST_INDEX.filter(queryset, parameters['q'])
+    for field in ['author', 'regest_type', 'location']:
+        if parameters.get(field):
+            queryset = queryset.filter(**{field: parameters[field]})
+    if parameters.get('start') or parameters.get('end'):
+        start = parse_date(parameters['start']) \
+            if parameters.get('start') else FIRST_DATE
+        end = parse_date(parameters['end'], end=True) \
+            if parameters.get('end') else LAST_DATE
+        if start > end:
+            raise InvalidParameter('Start of date range is after its end')
+        queryset = queryset.filter(
+            id__in=Regest.objects.overlapping(start, end).values('id'))
+    return queryset
@@ -0,0 +1,191 @@
+"""
+This module keeps track of the generation of the corpus, a number that
+changes whenever regests, their dates, concepts (of any type), quotes,
+footnotes, or archives are written, including the relations between
+them. Cached data and ETags are keyed on the generation they were
+computed for, so writing to the corpus invalidates them without having
+to find and delete the affected keys: Entries for old generations are
+simply not looked up anymore and expire.
+
+The generation is stored in the database (see the Generation model)
+and mirrored in the cache for GENERATION_TIMEOUT seconds, so that
+looking it up costs at most one query per GENERATION_TIMEOUT seconds.
+The timeout is kept short because the default cache is local to each
+process: Generations advanced by other processes (e.g. management
+commands importing data) are only seen once the mirrored value has
+expired. After loading data with raw SQL, advance it with the
+bump_generation command.
+"""
+
+import hashlib
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.views.decorators.http import condition
+from regesten_webapp.models import Archive, Concept, Footnote, Generation
+from regesten_webapp.models import Quote, Regest, RegestDate, bulk_written
+
+GENERATION_KEY = 'regesten_webapp:generation'
+
+# Number of seconds the generation is kept in the cache, i.e. the
+# longest time it takes for a process to see a generation advanced by
+# another process.
+GENERATION_TIMEOUT = 5
+
+# Number of seconds responses of views are kept in the cache.
+VIEW_TIMEOUT = 24 * 60 * 60
+
+# Models whose objects make up the corpus.
+CORPUS_MODELS = (Regest, RegestDate, Concept, Quote, Footnote, Archive)
+
+_state = threading.local()
+
+
+def initial_generation():
+    """
+    Return generation to start from in a new database. It is based on
+    the current time, so that generations used with an earlier
+    database (whose entries may still be cached) are not used again.
+    """
+    return int(time.time() * 1000)
+
+
+def generation(using=DEFAULT_DB_ALIAS):
+    """
+    Return the current generation of the corpus.
+    """
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        values = Generation.objects.using(using).values_list(
+            'value', flat=True)
+        value = values[0] if values else 0
+        cache.add(GENERATION_KEY, value, GENERATION_TIMEOUT)
+    return value
+
+
+def bump(using=DEFAULT_DB_ALIAS):
+    """
+    Advance the generation of the corpus and return the new one.
+    """
+    generations = Generation.objects.using(using)
+    if not generations.update(value=F('value') + 1):
+        generations.create(value=initial_generation())
+    value = generations.values_list('value', flat=True)[0]
+    transaction.commit_unless_managed(using=using)
+    cache.set(GENERATION_KEY, value, GENERATION_TIMEOUT)
+    return value
+
+
+@contextmanager
+def deferred_bump(pending=None):
+    """
+    Context manager collecting all writes to the corpus in its block
+    and advancing the generation only once, when the outermost block
+    is left. Wrapping a transaction in it makes sure that data cached
+    for the new generation is computed from the committed data.
+
+    Blocks are local to a thread. A thread writing on behalf of
+    another one passes the result of pending_bumps() in the other
+    thread as pending, so that its writes are collected by the block
+    of the other thread instead.
+    """
+    depth = getattr(_state, 'depth', 0)
+    if not depth:
+        _state.pending = set() if pending is None else pending
+    _state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _state.depth = depth
+        if not depth and pending is None:
+            for using in _state.pending:
+                bump(using)
+
+
+def deferring_bumps(view):
+    """
+    Decorator advancing the generation of the corpus at most once per
+    call of view, after view returned. Views writing inside a
+    transaction (like those of the admin interface, which use
+    transaction.commit_on_success) thus advance it only after their
+    transaction was committed. Otherwise, other requests might cache
+    data computed from the old data for the new generation.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with deferred_bump():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def pending_bumps():
+    """
+    Return the set of databases whose generations are advanced when
+    the outermost deferred_bump block of this thread is left, or None
+    outside of such blocks.
+    """
+    return _state.pending if getattr(_state, 'depth', 0) else None
+
+
+def corpus_changed(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    if getattr(_state, 'depth', 0):
+        _state.pending.add(using)
+    else:
+        bump(using)
+
+
+def object_written(sender, **kwargs):
+    if issubclass(sender, CORPUS_MODELS):
+        corpus_changed(sender, **kwargs)
+
+
+def relation_written(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, CORPUS_MODELS):
+        corpus_changed(sender, **kwargs)
+
+
+def cache_key(*parts):
+    """
+    Return cache key made from parts and the current generation.
+    """
+    return ':'.join(['regesten_webapp', str(generation())] +
+                    [unicode(part).encode('utf-8') for part in parts])
+
+
+def etag(request, *args, **kwargs):
+    """
+    Return ETag of the response to request for the current generation.
+    """
+    return hashlib.sha1(cache_key(request.get_full_path())).hexdigest()
+
+
+def cached_view(view):
+    """
+    Decorator caching successful responses of view to GET requests
+    for the current generation, and answering requests with an ETag
+    of the current generation with 304 Not Modified.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+        key = cache_key('view', etag(request))
+        response = cache.get(key)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response, VIEW_TIMEOUT)
+        return response
+    return condition(etag_func=etag)(wrapper)
+
+
+for signal in [post_save, post_delete, bulk_written]:
+    signal.connect(object_written, dispatch_uid='regesten_webapp.generation')
+m2m_changed.connect(relation_written,
+                    dispatch_uid='regesten_webapp.generation')
@@ -0,0 +1,238 @@
+"""
+This module provides traversals of the graph formed by regests and
+concepts (including index entries, which are all concepts) and the
+relations between them: related concepts, related index entries,
+members of groups of persons, and concepts mentioned in regests.
+
+Nodes of the graph are (kind, id) pairs, where kind is 'regest' or
+'concept', and index entries are identified by the ids of the
+concepts they are. Relations are followed in both directions.
+
+Traversals read the through tables of the relations directly, with
+one query per hop (for up to BATCH_SIZE nodes), instead of loading
+related objects node by node. For repeated traversals, e.g. for
+displaying graphs, the whole graph can be loaded into memory once
+per generation of the corpus (see generation.py) with graph().
+"""
+
+import threading
+
+from collections import defaultdict
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import get_app, get_models
+from regesten_webapp.generation import generation
+from regesten_webapp.models import Concept, IndexEntry, PersonGroup, Regest
+from regesten_webapp.utils import ancestor_link
+
+# Maximum number of nodes whose neighbours are looked up in one query.
+BATCH_SIZE = 500
+
+# Many-to-many fields whose through tables make up the edges of the
+# graph.
+RELATIONS = [
+    (Concept, 'related_concepts'),
+    (IndexEntry, 'related_entries'),
+    (PersonGroup, 'members'),
+    (Regest, 'mentions'),
+    ]
+
+
+def node(instance):
+    """
+    Return the node representing instance, which must be a regest or
+    a concept (or an index entry, which is also a concept).
+    """
+    if isinstance(instance, Regest):
+        return ('regest', instance.pk)
+    if isinstance(instance, Concept):
+        field = instance._meta.get_field(
+            ancestor_link(type(instance), Concept))
+        return ('concept', getattr(instance, field.attname))
+    raise ValueError('{0} is neither a regest nor a concept'.format(
+            instance))
+
+
+def _entry_models():
+    """
+    Return the models inheriting directly from both IndexEntry and
+    Concept, whose tables link the ids of index entries to the ids of
+    concepts.
+    """
+    return [model for model in get_models(get_app('regesten_webapp'))
+            if IndexEntry in model._meta.parents and
+            Concept in model._meta.parents]
+
+
+def entry_concepts(using=DEFAULT_DB_ALIAS):
+    """
+    Return SQL selecting the ids of all index entries (as entry_id)
+    along with the ids of the concepts they are (as concept_id).
+    """
+    quote_name = connections[using].ops.quote_name
+    return ' UNION ALL '.join(
+        'SELECT {0} AS entry_id, {1} AS concept_id FROM {2}'.format(
+            quote_name(model._meta.parents[IndexEntry].column),
+            quote_name(model._meta.parents[Concept].column),
+            quote_name(model._meta.db_table))
+        for model in _entry_models())
+
+
+def _end(model, column, using):
+    """
+    Return kind of the nodes at one end of an edge stored in column
+    of a through table (known as edge), the SQL expression selecting
+    their ids, and the join needed for the expression (or '').
+    """
+    quote_name = connections[using].ops.quote_name
+    if issubclass(model, Regest):
+        return 'regest', 'edge.{0}'.format(quote_name(column)), ''
+    if not issubclass(model, IndexEntry):
+        return 'concept', 'edge.{0}'.format(quote_name(column)), ''
+    alias = 'edge_{0}'.format(column)
+    return 'concept', '{0}.concept_id'.format(alias), \
+        ' JOIN ({0}) {1} ON {1}.entry_id = edge.{2}'.format(
+        entry_concepts(using), alias, quote_name(column))
+
+
+def edges(using=DEFAULT_DB_ALIAS):
+    """
+    Return the edges of the graph as a list of (source kind, target
+    kind, SQL) triples, where SQL selects the ids of the sources and
+    targets of all edges of that kind (as source and target).
+    """
+    quote_name = connections[using].ops.quote_name
+    result = []
+    for model, name in RELATIONS:
+        field = model._meta.get_field(name)
+        table = quote_name(field.m2m_db_table())
+        columns = [(model, field.m2m_column_name()),
+                   (field.rel.to, field.m2m_reverse_name())]
+        directions = [columns]
+        # Symmetrical relations store every edge in both directions.
+        if not (field.rel.to is model and field.rel.symmetrical):
+            directions.append(columns[::-1])
+        for (source, source_column), (target, target_column) in directions:
+            source_kind, source_id, source_join = _end(
+                source, source_column, using)
+            target_kind, target_id, target_join = _end(
+                target, target_column, using)
+            result.append((
+                    source_kind, target_kind,
+                    'SELECT {0} AS source, {1} AS target '
+                    'FROM {2} edge{3}{4}'.format(
+                        source_id, target_id, table, source_join,
+                        target_join)))
+    return result
+
+
+def neighbours(nodes, using=DEFAULT_DB_ALIAS):
+    """
+    Return set of all nodes adjacent to one of nodes, with a single
+    query.
+    """
+    ids = defaultdict(list)
+    for kind, pk in nodes:
+        ids[kind].append(pk)
+    parts = []
+    params = []
+    for source_kind, target_kind, sql in edges(using):
+        if ids[source_kind]:
+            parts.append(
+                "SELECT '{0}', edges.target FROM ({1}) edges "
+                "WHERE edges.source IN ({2})".format(
+                    target_kind, sql,
+                    ', '.join(['%s'] * len(ids[source_kind]))))
+            params.extend(ids[source_kind])
+    if not parts:
+        return set()
+    cursor = connections[using].cursor()
+    cursor.execute(' UNION '.join(parts), params)
+    return set((kind, pk) for kind, pk in cursor.fetchall())
+
+
+def neighbourhood(start, hops, using=DEFAULT_DB_ALIAS):
+    """
+    Return dict mapping all nodes at most hops edges away from start
+    (a node, see node()) to their distance from start. Every hop costs
+    one query per BATCH_SIZE nodes reached in the previous hop; nodes
+    reached before are not looked up again.
+    """
+    distances = {start: 0}
+    frontier = [start]
+    for hop in range(1, hops + 1):
+        if not frontier:
+            break
+        reached = set()
+        for offset in range(0, len(frontier), BATCH_SIZE):
+            reached.update(neighbours(
+                    frontier[offset:offset + BATCH_SIZE], using))
+        frontier = sorted(reached.difference(distances))
+        for neighbour in frontier:
+            distances[neighbour] = hop
+    return distances
+
+
+class Graph(object):
+    """
+    The Graph class holds the adjacency lists of all nodes of the
+    graph in memory.
+    """
+
+    def __init__(self, adjacency):
+        self.adjacency = adjacency
+
+    @classmethod
+    def load(cls, using=DEFAULT_DB_ALIAS):
+        """
+        Return Graph holding all edges in the database, read with a
+        single query.
+        """
+        cursor = connections[using].cursor()
+        cursor.execute(' UNION '.join(
+                "SELECT '{0}', edges.source, '{1}', edges.target "
+                "FROM ({2}) edges".format(
+                    source_kind, target_kind, sql)
+                for source_kind, target_kind, sql in edges(using)))
+        adjacency = defaultdict(set)
+        for source_kind, source, target_kind, target in cursor.fetchall():
+            adjacency[(source_kind, source)].add((target_kind, target))
+        return cls(dict(adjacency))
+
+    def neighbours(self, nodes):
+        """
+        Return set of all nodes adjacent to one of nodes.
+        """
+        result = set()
+        for node in nodes:
+            result.update(self.adjacency.get(node, ()))
+        return result
+
+    def neighbourhood(self, start, hops):
+        """
+        Return dict mapping all nodes at most hops edges away from
+        start to their distance from start.
+        """
+        distances = {start: 0}
+        frontier = [start]
+        for hop in range(1, hops + 1):
+            frontier = self.neighbours(frontier).difference(distances)
+            for neighbour in frontier:
+                distances[neighbour] = hop
+        return distances
+
+
+_lock = threading.Lock()
+_graphs = {}
+
+
+def graph(using=DEFAULT_DB_ALIAS):
+    """
+    Return Graph holding all edges in database using. The graph is
+    loaded on first use and kept until the generation of the corpus
+    changes.
+    """
+    current = generation(using)
+    with _lock:
+        if using not in _graphs or _graphs[using][0] != current:
+            _graphs[using] = (current, Graph.load(using))
+        return _graphs[using][1]
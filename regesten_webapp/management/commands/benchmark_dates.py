@@ -0,0 +1,26 @@
+"""
+This module makes the benchmarks for queries over regest dates
+available as a Django management command.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from regesten_webapp.benchmarks import benchmark_overlap
+
+class Command(BaseCommand):
+    args = '[scale ...]'
+    help = 'Measures how long it takes to find the regests overlapping ' \
+        'a period in synthetic corpora of the given scales (default: 1, ' \
+        '10, 100). The benchmark runs in a test database.'
+
+    def handle(self, *args, **options):
+        try:
+            scales = [float(scale) for scale in args] or [1, 10, 100]
+        except ValueError:
+            raise CommandError('Usage: benchmark_dates {0}'.format(self.args))
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            benchmark_overlap(scales, self.stdout)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
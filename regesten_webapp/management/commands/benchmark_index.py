@@ -0,0 +1,26 @@
+"""
+This module makes the benchmark of the index extraction available as
+a Django management command.
+"""
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from extraction.index_utils.index_benchmark import SCALES, benchmark
+
+class Command(BaseCommand):
+    args = '[scale ...]'
+    help = 'Runs the index extraction on synthetic indexes of the given ' \
+        'scales (default: {0}) and reports items/second and peak memory ' \
+        'of every stage'.format(', '.join(str(scale) for scale in SCALES))
+    option_list = BaseCommand.option_list + (
+        make_option('--seed', type='int', default=0,
+                    help='Seed for generating the synthetic indexes'),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scales = [float(scale) for scale in args] or SCALES
+        except ValueError:
+            raise CommandError('Usage: benchmark_index {0}'.format(self.args))
+        benchmark(scales, options['seed'], self.stdout)
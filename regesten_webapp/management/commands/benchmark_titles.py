@@ -0,0 +1,16 @@
+"""
+This module makes the benchmarks for regest titles available as a
+Django management command.
+"""
+
+from django.core.management.base import NoArgsCommand
+from regesten_webapp.benchmarks import benchmark_classify
+from regesten_webapp.benchmarks import benchmark_extract_dates
+
+class Command(NoArgsCommand):
+    help = 'Measures how long it takes to classify the regest titles ' \
+        'used in the tests and to extract dates from them'
+
+    def handle_noargs(self, **options):
+        benchmark_classify(out=self.stdout)
+        benchmark_extract_dates(out=self.stdout)
@@ -0,0 +1,30 @@
+"""
+This module makes building the static version of the Sbr Regesten
+website available as a Django management command.
+"""
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from regesten_webapp.static_site import build
+
+class Command(BaseCommand):
+    args = '<output directory>'
+    help = 'Builds the static version of the website in the output ' \
+        'directory, rendering only pages whose data changed since the ' \
+        'last build'
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=None,
+                    help='Number of processes to render in (default: ' \
+                        'number of CPUs)'),
+        make_option('--force', action='store_true', default=False,
+                    help='Render all pages, even unchanged ones'),
+        )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: build_site {0}'.format(self.args))
+        counts = build(args[0], options['processes'], options['force'])
+        self.stdout.write(
+            'Done: {built} pages built, {unchanged} unchanged, '
+            '{deleted} deleted\n'.format(**counts))
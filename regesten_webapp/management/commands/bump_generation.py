@@ -0,0 +1,14 @@
+"""
+This module makes advancing the generation of the corpus available as
+a Django management command.
+"""
+
+from django.core.management.base import NoArgsCommand
+from regesten_webapp.generation import bump
+
+class Command(NoArgsCommand):
+    help = 'Advances the generation of the corpus, invalidating all ' \
+        'cached data and ETags, e.g. after loading data with raw SQL'
+
+    def handle_noargs(self, **options):
+        self.stdout.write('Generation: {0}\n'.format(bump()))
@@ -0,0 +1,20 @@
+"""
+This module makes writing a snapshot of the database available as a
+Django management command.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from regesten_webapp.snapshot import export_snapshot
+
+class Command(BaseCommand):
+    args = '<snapshot file>'
+    help = 'Writes the contents of all regesten_webapp tables to a ' \
+        'snapshot file that can be restored using loadsnapshot'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: dumpsnapshot {0}'.format(self.args))
+        manifest = export_snapshot(args[0])
+        for table in manifest['tables']:
+            self.stdout.write('{0}: {1} rows\n'.format(
+                    table['table'], table['rows']))
@@ -0,0 +1,39 @@
+"""
+This module makes exporting regests or index entries available as a
+Django management command.
+"""
+
+import sys
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from regesten_webapp.export import EXPORTS, FORMATS, ExportError, export
+
+class Command(BaseCommand):
+    args = '<{0}> [file]'.format('|'.join(sorted(EXPORTS)))
+    help = 'Writes all regests (with their dates) or all index entries ' \
+        '(with their relations) to a file, or to standard output if no ' \
+        'file is given'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='jsonl',
+                    help='Format of the export ({0}; default: jsonl)'.format(
+                        ', '.join(FORMATS))),
+        make_option('--gzip', action='store_true', default=False,
+                    help='Compress the export with gzip'),
+        )
+
+    def handle(self, *args, **options):
+        if len(args) not in (1, 2):
+            raise CommandError('Usage: export_corpus {0}'.format(self.args))
+        try:
+            stream = export(args[0], options['format'], options['gzip'])
+        except ExportError as error:
+            raise CommandError(unicode(error))
+        output = open(args[1], 'wb') if len(args) == 2 else sys.stdout
+        try:
+            for chunk in stream:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
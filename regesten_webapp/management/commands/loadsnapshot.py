@@ -0,0 +1,23 @@
+"""
+This module makes restoring the database from a snapshot available as
+a Django management command.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from regesten_webapp.snapshot import restore_snapshot, SnapshotError
+
+class Command(BaseCommand):
+    args = '<snapshot file>'
+    help = 'Replaces the contents of all regesten_webapp tables with ' \
+        'the contents of a snapshot file written by dumpsnapshot'
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: loadsnapshot {0}'.format(self.args))
+        try:
+            manifest = restore_snapshot(args[0])
+        except SnapshotError as e:
+            raise CommandError(e)
+        for table in manifest['tables']:
+            self.stdout.write('{0}: {1} rows\n'.format(
+                    table['table'], table['rows']))
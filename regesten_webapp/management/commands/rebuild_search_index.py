@@ -0,0 +1,16 @@
+"""
+This module makes rebuilding the full-text indexes of regests and
+concepts available as a Django management command.
+"""
+
+from django.core.management.base import NoArgsCommand
+from regesten_webapp.search import rebuild
+
+class Command(NoArgsCommand):
+    help = 'Rebuilds the full-text indexes of regests and concepts, ' \
+        'e.g. after loading data with raw SQL'
+
+    def handle_noargs(self, **options):
+        for model, count in sorted(rebuild().items()):
+            self.stdout.write('{0}: {1} objects indexed\n'.format(
+                    model, count))
@@ -0,0 +1,26 @@
+"""
+This module makes rendering the XML representations of regests and
+index entries to HTML available as a Django management command.
+"""
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from regesten_webapp.rendering import render_all
+
+class Command(NoArgsCommand):
+    help = 'Renders the XML representations of regests and index entries ' \
+        'that were not rendered yet to HTML, and deletes renderings that ' \
+        'are no longer used'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', type='int', default=None,
+                    help='Number of processes to render in (default: ' \
+                        'number of CPUs)'),
+        )
+
+    def handle_noargs(self, **options):
+        count = render_all(
+            options['processes'], lambda count: self.stdout.write(
+                '{0} representations rendered\n'.format(count)))
+        self.stdout.write('Done: {0} representations rendered\n'.format(
+                count))
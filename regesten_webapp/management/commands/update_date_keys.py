@@ -0,0 +1,15 @@
+"""
+This module makes recomputing the chronological sort keys of all
+regests available as a Django management command.
+"""
+
+from django.core.management.base import NoArgsCommand
+from regesten_webapp.models import Regest
+
+class Command(NoArgsCommand):
+    help = 'Recomputes earliest start, latest end and exactness of all ' \
+        'regests from their dates'
+
+    def handle_noargs(self, **options):
+        changed = Regest.objects.update_date_keys()
+        self.stdout.write('{0} regests updated\n'.format(changed))
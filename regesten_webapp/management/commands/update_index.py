@@ -0,0 +1,14 @@
+"""
+This module makes an incremental re-import of the index available as
+a Django management command.
+"""
+
+from django.core.management.base import NoArgsCommand
+from extraction.index_utils.index_to_db import index_to_db
+
+class Command(NoArgsCommand):
+    help = 'Updates the index in the database from sbr-regesten.xml, ' \
+        'touching only entries that were added, changed or removed'
+
+    def handle_noargs(self, **options):
+        index_to_db(incremental=True)
@@ -6,13 +6,141 @@ Author: Tim Krones <tkrones@coli.uni-saarland.de>
 
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.core.management.color import no_style
+from django.db import connections, models, transaction
+from django.dispatch import Signal
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy
 
-from regesten_webapp import AUTHORS, COUNTRIES, OFFSET_TYPES, REGION_TYPES
-from regesten_webapp import RegestTitleType
+from datetime import timedelta
+
+from regesten_webapp import AUTHORS, COUNTRIES, OFFSET_MARGINS, OFFSET_TYPES
+from regesten_webapp import REGION_TYPES
 from regesten_webapp.utils import RegestTitleAnalyzer, RegestDateExtractor
+from regesten_webapp.utils import ancestor_link, content_hash, name_key
+from regesten_webapp.utils import name_key_range, split_names
+
+
+# Sent after objects were written in bulk (bulk_create, raw SQL), which
+# does not send post_save or post_delete signals. The sender is the
+# model of the objects, instances is a list of the objects written, or
+# None if any object of the model may have changed.
+bulk_written = Signal(providing_args=['instances', 'using'])
+
+
+class RegestManager(models.Manager):
+    """
+    Manager for Regest objects. Provides bulk import of regests,
+    recomputation of the chronological sort keys of all regests, and
+    lookup of regests by period.
+    """
+
+    def overlapping(self, start, end, offsets=True):
+        """
+        Return regests with at least one date overlapping the period
+        from start to end (see RegestDateManager.overlapping).
+        """
+        return self.filter(id__in=RegestDate.objects.overlapping(
+                start, end, offsets).values('regest'))
+
+    def bulk_import(self, regests, chunk_size=500, progress=None):
+        """
+        Create Regest objects from an iterable of dicts mapping field
+        names to values, together with their RegestDate objects.
+
+        Unlike Regest.save, this writes each chunk of chunk_size
+        regests (or all regests if chunk_size is None) with a single
+        bulk insert for the Regest objects and another one for their
+        RegestDate objects. Every chunk is imported in its own
+        transaction. If progress is given, it is called with the
+        number of regests imported so far after each chunk.
+
+        Return the number of imported regests.
+        """
+        imported = 0
+        chunk = []
+        with generation.deferred_bump():
+            for values in regests:
+                chunk.append(self.model(**values))
+                if len(chunk) == chunk_size:
+                    imported += self.__import_chunk(chunk)
+                    chunk = []
+                    if progress:
+                        progress(imported)
+            if chunk:
+                imported += self.__import_chunk(chunk)
+                if progress:
+                    progress(imported)
+        return imported
+
+    def __import_chunk(self, regests):
+        """
+        Write a list of unsaved Regest objects and their RegestDate
+        objects to the database.
+        """
+        with transaction.commit_on_success(using=self.db):
+            # Objects created by bulk_create do not get their ids set,
+            # so ids are assigned up front to be able to refer to the
+            # regests from their dates.
+            next_id = (self.aggregate(
+                    models.Max('id'))['id__max'] or 0) + 1
+            for regest in regests:
+                if regest.id is None:
+                    regest.id = next_id
+                    next_id += 1
+
+            dates = {}
+            regest_dates = []
+            for regest in regests:
+                regest.xml_hash = content_hash(regest.xml_repr) \
+                    if regest.xml_repr else ''
+                if regest.title not in dates:
+                    dates[regest.title] = Regest.extract_dates(regest.title)
+                regest.update_date_keys(dates[regest.title])
+                regest_dates.extend(regest.build_dates(dates[regest.title]))
+            self.bulk_create(regests)
+            RegestDate.objects.using(self.db).bulk_create(regest_dates)
+            bulk_written.send(
+                sender=Regest, instances=regests, using=self.db)
+            bulk_written.send(
+                sender=RegestDate, instances=regest_dates, using=self.db)
+
+            cursor = connections[self.db].cursor()
+            for statement in connections[self.db].ops.sequence_reset_sql(
+                    no_style(), [Regest]):
+                cursor.execute(statement)
+        return len(regests)
+
+    def update_date_keys(self):
+        """
+        Recompute earliest_start, latest_end and is_exact of all
+        regests from the RegestDate objects stored in the database.
+        This is only needed for regests whose dates were written
+        without going through Regest.save or bulk_import.
+
+        Return the number of regests whose values changed.
+        """
+        dates = RegestDate.objects.using(self.db)
+        with transaction.commit_on_success(using=self.db):
+            keys = dict(
+                (row['regest'], (row['earliest_start'], row['latest_end']))
+                for row in dates.values('regest').annotate(
+                    earliest_start=models.Min('start'),
+                    latest_end=models.Max('end')))
+            inexact = set(dates.exclude(start_offset='', end_offset='')
+                          .values_list('regest', flat=True))
+            changed = 0
+            for regest_id, earliest_start, latest_end, is_exact in \
+                    self.values_list(
+                    'id', 'earliest_start', 'latest_end', 'is_exact'):
+                start, end = keys.get(regest_id, (None, None))
+                exact = regest_id in keys and regest_id not in inexact
+                if (start, end, exact) != \
+                        (earliest_start, latest_end, is_exact):
+                    self.filter(id=regest_id).update(
+                        earliest_start=start, latest_end=end, is_exact=exact)
+                    changed += 1
+        return changed
 
 
 class Regest(models.Model):
@@ -28,7 +156,7 @@ class Regest(models.Model):
 
     issuer = models.ForeignKey(
         'Person', related_name='regests_issued', verbose_name=_('issuer'),
-        null=True, blank=True)
+        null=True, blank=True, on_delete=models.SET_NULL)
     mentions = models.ManyToManyField(
         'Concept', related_name='mentioned_in', verbose_name=_('mentions'),
         null=True, blank=True)
@@ -45,19 +173,69 @@ class Regest(models.Model):
     quotes = generic.GenericRelation('Quote')
 
     xml_repr = models.TextField(_('XML representation'))
+    xml_hash = models.CharField(
+        _('XML hash'), max_length=40, blank=True, editable=False,
+        db_index=True)
+
+    # Chronological sort keys, derived from the RegestDate objects of
+    # the regest (see update_date_keys).
+    earliest_start = models.DateField(
+        _('earliest start'), null=True, blank=True, editable=False,
+        db_index=True)
+    latest_end = models.DateField(
+        _('latest end'), null=True, blank=True, editable=False,
+        db_index=True)
+    is_exact = models.BooleanField(
+        _('exact'), default=False, editable=False, db_index=True)
+
+    objects = RegestManager()
+
+    def __init__(self, *args, **kwargs):
+        super(Regest, self).__init__(*args, **kwargs)
+        # Title as loaded from the database. Deferred titles are not
+        # loaded here, as that would cost an extra query per instance.
+        self._loaded_title = self.__dict__.get('title')
+
+    @property
+    def title_changed(self):
+        """
+        Whether or not the title of the Regest instance differs from
+        the one stored in the database. Regests that were not saved yet
+        (even if their primary keys are set) always count as changed.
+        """
+        return self._state.adding or ('title' in self.__dict__ and
+                                      self.title != self._loaded_title)
 
     def save(self, *args, **kwargs):
         """
         Save Regest instance to database and trigger generation of
         RegestDate objects to associate with it.
-        """
-        super(Regest, self).save(*args, **kwargs)
-        self._generate_dates()
 
-    def _generate_dates(self):
-        """
-        Generate RegestDate objects for Regest instance based on value
-        of title attribute.
+        RegestDate objects are only regenerated if the title of the
+        Regest instance changed, unless force_dates=True is passed.
+        The Regest instance and its RegestDate objects are saved in a
+        single transaction, after which the generation of the corpus
+        is advanced once (see generation.py). A hash of the XML
+        representation is stored along with the Regest instance, to
+        look up the HTML rendered from it (see rendering.py).
+        """
+        force_dates = kwargs.pop('force_dates', False)
+        self.xml_hash = content_hash(self.xml_repr) if self.xml_repr else ''
+        dates = None
+        if force_dates or self.title_changed:
+            dates = self.extract_dates(self.title)
+            self.update_date_keys(dates)
+        with generation.deferred_bump():
+            with transaction.commit_on_success():
+                super(Regest, self).save(*args, **kwargs)
+                if dates is not None:
+                    self._generate_dates(dates)
+        self._loaded_title = self.__dict__.get('title')
+
+    def _generate_dates(self, dates):
+        """
+        Generate RegestDate objects for Regest instance based on date
+        information extracted from its title.
 
         With the help of RegestTitleAnalyzer and RegestDateExtractor
         (defined in utils.py), this method generates RegestDate
@@ -66,41 +244,59 @@ class Regest(models.Model):
         information is removed when updating a specific Regest from
         the Admin Interface it also deletes all existing RegestDate
         objects associated with the Regest instance.
+
+        Existing RegestDate objects are deleted and new ones are
+        created in bulk, so the number of queries does not depend on
+        the number of dates.
         """
-        if RegestTitleAnalyzer.contains_simple_additions(self.title):
-            dates = RegestDateExtractor.extract_dates(
-                self.title, RegestTitleType.SIMPLE_ADDITIONS)
-        elif RegestTitleAnalyzer.contains_elliptical_additions(self.title):
-            dates = RegestDateExtractor.extract_dates(
-                self.title, RegestTitleType.ELLIPTICAL_ADDITIONS)
-        elif RegestTitleAnalyzer.contains_simple_alternatives(self.title):
-            dates = RegestDateExtractor.extract_dates(
-                self.title, RegestTitleType.SIMPLE_ALTERNATIVES)
-        elif RegestTitleAnalyzer.contains_elliptical_alternatives(self.title):
-            dates = RegestDateExtractor.extract_dates(
-                self.title, RegestTitleType.ELLIPTICAL_ALTERNATIVES)
-        elif RegestTitleAnalyzer.is_simple_range(self.title):
-            dates = RegestDateExtractor.extract_dates(
-                self.title, RegestTitleType.SIMPLE_RANGE)
-        elif RegestTitleAnalyzer.is_elliptical_range(self.title):
-            dates = RegestDateExtractor.extract_dates(
-                self.title, RegestTitleType.ELLIPTICAL_RANGE)
-        else:
-            dates = RegestDateExtractor.extract_dates(
-                self.title, RegestTitleType.REGULAR)
         self.__delete_existing_dates()
-        for start, end, start_offset, end_offset, alt_date in dates:
-            RegestDate.objects.create(
-                regest=self, start=start, end=end, start_offset=start_offset,
-                end_offset=end_offset, alt_date=alt_date)
+        regest_dates = self.build_dates(dates)
+        RegestDate.objects.bulk_create(regest_dates)
+        bulk_written.send(
+            sender=RegestDate, instances=regest_dates, using=self._state.db)
+
+    @staticmethod
+    def extract_dates(title):
+        """
+        Return date information for a regest title as a tuple of
+        (start, end, start_offset, end_offset, alt_date) tuples.
+        """
+        return RegestDateExtractor.extract_dates(
+            title, RegestTitleAnalyzer.classify(title))
+
+    def update_date_keys(self, dates):
+        """
+        Set earliest_start, latest_end and is_exact of Regest instance
+        from date information as returned by extract_dates.
+
+        A regest is exact if it has at least one date and none of its
+        dates have offsets.
+        """
+        if dates:
+            starts, ends, start_offsets, end_offsets, alt_dates = zip(*dates)
+            self.earliest_start = min(starts)
+            self.latest_end = max(ends)
+            self.is_exact = not any(start_offsets + end_offsets)
+        else:
+            self.earliest_start = self.latest_end = None
+            self.is_exact = False
+
+    def build_dates(self, dates):
+        """
+        Return unsaved RegestDate objects for Regest instance from
+        date information as returned by extract_dates.
+        """
+        return [RegestDate(regest=self, start=start, end=end,
+                           start_offset=start_offset, end_offset=end_offset,
+                           alt_date=alt_date)
+                for start, end, start_offset, end_offset, alt_date in dates]
 
     def __delete_existing_dates(self):
         """
         Delete all existing RegestDate objects associated with Regest
         instance.
         """
-        for regest_date in self.regestdate_set.all():
-            regest_date.delete()
+        self.regestdate_set.all().delete()
 
     def __unicode__(self):
         return u'Regest {0}: {1}'.format(self.id, self.title)
@@ -133,6 +329,43 @@ class Archive(models.Model):
         verbose_name_plural = ugettext_lazy('archives')
 
 
+class RegestDateManager(models.Manager):
+    """
+    Manager for RegestDate objects. Provides lookup of dates by
+    period.
+    """
+
+    def overlapping(self, start, end, offsets=True):
+        """
+        Return dates overlapping the period from start to end
+        (inclusive).
+
+        If offsets is True, dates with offsets are widened by the
+        margins defined in OFFSET_MARGINS before checking for
+        overlap, so e.g. 'vor 1420' overlaps 1419 as well. The query
+        first restricts start and end by the widest margins, which
+        can be answered from the index on (start, end), and then
+        checks the margin of each offset separately.
+        """
+        if not offsets:
+            return self.filter(start__lte=end, end__gte=start)
+        before = lambda offset: timedelta(OFFSET_MARGINS[offset][0])
+        after = lambda offset: timedelta(OFFSET_MARGINS[offset][1])
+        starts_before_end = models.Q(start__lte=end) & \
+            ~models.Q(start_offset__in=OFFSET_MARGINS.keys())
+        ends_after_start = models.Q(end__gte=start) & \
+            ~models.Q(end_offset__in=OFFSET_MARGINS.keys())
+        for offset in OFFSET_MARGINS:
+            starts_before_end |= models.Q(
+                start_offset=offset, start__lte=end + before(offset))
+            ends_after_start |= models.Q(
+                end_offset=offset, end__gte=start - after(offset))
+        return self.filter(
+            starts_before_end, ends_after_start,
+            start__lte=end + max(map(before, OFFSET_MARGINS)),
+            end__gte=start - max(map(after, OFFSET_MARGINS)))
+
+
 class RegestDate(models.Model):
     """
     The RegestDate model represents a date or a date range associated
@@ -148,6 +381,8 @@ class RegestDate(models.Model):
         _('end offset'), max_length=20, choices=OFFSET_TYPES)
     alt_date = models.BooleanField(_('alternative date'))
 
+    objects = RegestDateManager()
+
     @property
     def exact(self):
         """
@@ -247,11 +482,119 @@ class IndexEntry(models.Model):
     related_entries = models.ManyToManyField(
         'self', verbose_name=_('related entries'), null=True, blank=True)
     xml_repr = models.TextField(_('XML representation'), blank=True)
+    xml_hash = models.CharField(
+        _('XML hash'), max_length=40, blank=True, editable=False,
+        db_index=True)
+
+    def save(self, *args, **kwargs):
+        """
+        Save IndexEntry instance to database, storing a hash of its
+        XML representation along with it.
+
+        The hash allows an incremental re-import of the index to skip
+        entries whose XML has not changed.
+        """
+        self.xml_hash = content_hash(self.xml_repr) if self.xml_repr else ''
+        super(IndexEntry, self).save(*args, **kwargs)
 
     def __unicode__(self):
         return ugettext_lazy('Index entry') + ' {0}'.format(self.id)
 
 
+# Fields holding names of concepts (or of objects of subclasses of
+# Concept), which are all looked up by their keys (see NameKey).
+NAME_FIELDS = ['name', 'additional_names', 'forename', 'surname']
+
+
+def name_keys(values):
+    """
+    Return set of (field, key) pairs for the names held by the fields
+    in NAME_FIELDS of a concept, given as a dict mapping (some of) the
+    fields to their values. Besides the whole value of a field, each
+    of the names in it (see utils.split_names) gets a pair, so that
+    e.g. u'Meyer, Johann' is found by u'Meyer', and every additional
+    name is found on its own.
+    """
+    keys = set()
+    for field in NAME_FIELDS:
+        value = values.get(field) or u''
+        for name in [value] + split_names(value):
+            key = name_key(name)
+            if key:
+                keys.add((field, key))
+    return keys
+
+
+def name_lookup(name, prefix=False, model=None):
+    """
+    Return Q object matching concepts (or objects of model, a subclass
+    of Concept) with a name (see NAME_FIELDS) that has the same key as
+    name (see utils.name_key), or a key starting with the key of name
+    if prefix is True. Both are answered from the index of NameKey.
+    """
+    if not prefix:
+        keys = NameKey.objects.filter(key=name_key(name))
+    else:
+        bounds = name_key_range(name)
+        if bounds is None:
+            return models.Q(pk__in=[])
+        keys = NameKey.objects.filter(key__gte=bounds[0], key__lt=bounds[1])
+    return models.Q(**{ancestor_link(model or Concept, Concept) + '__in':
+                           keys.values('concept')})
+
+
+class ConceptManager(models.Manager):
+    """
+    Manager for Concept objects. Provides lookup of concepts by the
+    keys of their names, and recomputation of these keys.
+    """
+
+    def named(self, name, prefix=False):
+        """
+        Return concepts with a name matching name (see name_lookup).
+        """
+        return self.filter(name_lookup(name, prefix))
+
+    def update_name_keys(self, chunk_size=500):
+        """
+        Recompute the name keys of all concepts, e.g. after changing
+        utils.name_key or writing names with update(). Concepts are
+        read in chunks of chunk_size, and only concepts whose keys
+        changed are written.
+
+        Return the number of concepts whose keys changed.
+        """
+        changed = 0
+        concepts = self.order_by('pk').values(
+            'pk', 'name', 'additional_names')
+        last = None
+        with transaction.commit_on_success(using=self.db):
+            while True:
+                chunk = list((concepts if last is None else concepts.filter(
+                            pk__gt=last))[:chunk_size])
+                if not chunk:
+                    return changed
+                last = chunk[-1]['pk']
+                pks = [concept['pk'] for concept in chunk]
+                persons = dict(
+                    (person.pop('concept_ptr'), person)
+                    for person in Person.objects.using(self.db).filter(
+                        concept_ptr__in=pks).values(
+                        'concept_ptr', 'forename', 'surname'))
+                stored = dict((pk, set()) for pk in pks)
+                for concept, field, key in NameKey.objects.using(
+                        self.db).filter(concept__in=pks).values_list(
+                        'concept', 'field', 'key'):
+                    stored[concept].add((field, key))
+                for concept in chunk:
+                    concept.update(persons.get(concept['pk'], {}))
+                    keys = name_keys(concept)
+                    if keys != stored[concept['pk']]:
+                        NameKey.objects.db_manager(self.db).write(
+                            concept['pk'], keys)
+                        changed += 1
+
+
 class Concept(models.Model):
     """
     The Concept model groups attributes common to all types of
@@ -268,6 +611,26 @@ class Concept(models.Model):
 
     quotes = generic.GenericRelation('Quote')
 
+    objects = ConceptManager()
+
+    def save(self, *args, **kwargs):
+        """
+        Save Concept instance to database, storing the keys of all of
+        its names (see NAME_FIELDS) as NameKey objects along with it.
+        Stored keys are only rewritten if they changed.
+        """
+        adding = self._state.adding
+        super(Concept, self).save(*args, **kwargs)
+        concept_id = getattr(self, self._meta.get_field(
+                ancestor_link(type(self), Concept)).attname)
+        keys = name_keys(dict(
+                (field, getattr(self, field, None)) for field in NAME_FIELDS))
+        name_keys_manager = NameKey.objects.db_manager(self._state.db)
+        if adding:
+            name_keys_manager.add(concept_id, keys)
+        elif keys != name_keys_manager.stored(concept_id):
+            name_keys_manager.write(concept_id, keys)
+
     def __unicode__(self):
         return ugettext_lazy('Concept') + u' {0}: {1}'.format(
             self.id, self.name)
@@ -280,6 +643,65 @@ class Concept(models.Model):
         verbose_name_plural = ugettext_lazy('Concepts')
 
 
+class NameKeyManager(models.Manager):
+    """
+    Manager for NameKey objects. Provides storing and replacing the
+    keys of a concept.
+    """
+
+    def stored(self, concept_id):
+        """
+        Return set of (field, key) pairs stored for the concept with
+        the given id.
+        """
+        return set(self.filter(concept=concept_id).values_list(
+                'field', 'key'))
+
+    def add(self, concept_id, keys):
+        """
+        Store NameKey objects for keys, a set of (field, key) pairs (see
+        name_keys), for the concept with the given id, with a single
+        bulk insert.
+        """
+        self.bulk_create([
+                NameKey(concept_id=concept_id, field=field, key=key)
+                for field, key in sorted(keys)])
+
+    def write(self, concept_id, keys):
+        """
+        Replace the NameKey objects of the concept with the given id
+        by objects for keys, with one delete and one bulk insert.
+        """
+        self.filter(concept=concept_id).delete()
+        self.add(concept_id, keys)
+
+
+class NameKey(models.Model):
+    """
+    The NameKey model stores the key (see utils.name_key) of one of
+    the names of a concept (see NAME_FIELDS), so that concepts can be
+    looked up by any of their names, variants, or parts of names with
+    the index of keys.
+    """
+
+    concept = models.ForeignKey(
+        'Concept', related_name='name_keys', verbose_name=_('concept'))
+    field = models.CharField(_('field'), max_length=30)
+    key = models.CharField(_('key'), max_length=140, db_index=True)
+
+    objects = NameKeyManager()
+
+    def __unicode__(self):
+        return u'{0}: {1}'.format(self.field, self.key)
+
+    class Meta:
+        """
+        Specifies metadata for the NameKey model.
+        """
+        verbose_name = ugettext_lazy('name key')
+        verbose_name_plural = ugettext_lazy('name keys')
+
+
 class Landmark(IndexEntry, Concept):
     """
     The landmark model represents a single landmark listed or
@@ -367,7 +789,8 @@ class Person(IndexEntry, Concept):
     profession = models.CharField(
         _('profession'), max_length=30, blank=True)
     resident_of = models.ForeignKey(
-        'Location', verbose_name=_('resident of'), null=True, blank=True)
+        'Location', verbose_name=_('resident of'), null=True, blank=True,
+        on_delete=models.SET_NULL)
 
     def __unicode__(self):
         return u'Person {0}: {1}'.format(self.id, self.name)
@@ -406,7 +829,7 @@ class Family(PersonGroup):
 
     location = models.ForeignKey(
         'Location', verbose_name=_('location'), null=True,
-        blank=True, help_text=ugettext_lazy(
+        blank=True, on_delete=models.SET_NULL, help_text=ugettext_lazy(
             'Location associated with this family'))
 
     def __unicode__(self):
@@ -439,3 +862,49 @@ class Region(models.Model):
         """
         verbose_name = ugettext_lazy('Region')
         verbose_name_plural = ugettext_lazy('Regions')
+
+
+class Rendering(models.Model):
+    """
+    The Rendering model stores the HTML for displaying an XML
+    representation (of a regest or an index entry), identified by
+    the hash of the XML (see rendering.py).
+    """
+
+    xml_hash = models.CharField(
+        _('XML hash'), max_length=40, primary_key=True)
+    html = models.TextField(_('HTML'))
+
+    def __unicode__(self):
+        return u'{0}'.format(self.xml_hash)
+
+    class Meta:
+        """
+        Specifies metadata for the Rendering model.
+        """
+        verbose_name = ugettext_lazy('rendering')
+        verbose_name_plural = ugettext_lazy('renderings')
+
+
+class Generation(models.Model):
+    """
+    The Generation model stores the generation of the corpus (see
+    generation.py). The database holds a single Generation object.
+    """
+
+    value = models.BigIntegerField(_('value'))
+
+    def __unicode__(self):
+        return u'{0}'.format(self.value)
+
+    class Meta:
+        """
+        Specifies metadata for the Generation model.
+        """
+        verbose_name = ugettext_lazy('generation')
+        verbose_name_plural = ugettext_lazy('generations')
+
+
+# Connect the signal handlers keeping the full-text indexes and the
+# generation of the corpus up to date.
+from regesten_webapp import generation, search
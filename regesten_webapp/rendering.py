@@ -0,0 +1,167 @@
+"""
+This module turns the XML representations of regests and index
+entries into HTML for displaying them.
+
+Rendered HTML is stored in the Rendering table under the hash of the
+XML it was rendered from (see Regest.xml_hash and IndexEntry.xml_hash),
+so XML is only rendered again when it changes, and objects with
+identical XML share a single rendering. HTML is rendered on first use,
+or for all objects at once with the render_xml command, which renders
+in a pool of processes.
+"""
+
+from multiprocessing import Pool
+
+from bs4 import BeautifulSoup, NavigableString
+from bs4.element import PreformattedString
+from django.db import transaction
+from django.utils.html import escape
+from regesten_webapp.models import IndexEntry, Regest, Rendering
+
+# HTML elements representing XML elements. XML elements not listed
+# here are represented by span elements. All HTML elements get the
+# name of their XML element as class.
+HTML_ELEMENTS = {
+    'item': 'div',
+    'location-header': 'div',
+    'landmark-header': 'div',
+    'person-header': 'div',
+    'persongroup-header': 'div',
+    'family-header': 'div',
+    'concept-body': 'div',
+    'related-concepts': 'div',
+    'concept': 'div',
+    'quote': 'q',
+    }
+
+# Number of XML representations rendered and stored at a time.
+BATCH_SIZE = 500
+
+# Models whose XML representations are rendered.
+RENDERED_MODELS = [Regest, IndexEntry]
+
+
+def render(xml):
+    """
+    Return HTML for XML. XML attributes become data attributes of the
+    HTML elements.
+    """
+    soup = BeautifulSoup(xml, 'html.parser')
+    return u''.join(_render_node(node) for node in soup.contents)
+
+
+def _render_node(node):
+    if isinstance(node, PreformattedString):
+        return u''
+    if isinstance(node, NavigableString):
+        return escape(node)
+    element = HTML_ELEMENTS.get(node.name, 'span')
+    attributes = u''.join(
+        u' data-{0}="{1}"'.format(
+            name, escape(u' '.join(value) if isinstance(value, list)
+                         else value))
+        for name, value in sorted(node.attrs.items()))
+    return u'<{0} class="{1}"{2}>{3}</{0}>'.format(
+        element, node.name, attributes,
+        u''.join(_render_node(child) for child in node.contents))
+
+
+def _render_item(item):
+    xml_hash, xml = item
+    return xml_hash, render(xml)
+
+
+def html(instance):
+    """
+    Return HTML for the XML representation of instance (a Regest or
+    an IndexEntry), rendering it if it was not rendered before.
+    """
+    if not instance.xml_hash:
+        return u''
+    try:
+        return Rendering.objects.get(xml_hash=instance.xml_hash).html
+    except Rendering.DoesNotExist:
+        rendering, created = Rendering.objects.get_or_create(
+            xml_hash=instance.xml_hash,
+            defaults={'html': render(instance.xml_repr)})
+        return rendering.html
+
+
+def missing_hashes():
+    """
+    Return hashes of all XML representations that were not rendered
+    yet.
+    """
+    hashes = set()
+    for model in RENDERED_MODELS:
+        hashes.update(model.objects.exclude(xml_hash='').values_list(
+                'xml_hash', flat=True).distinct().iterator())
+    hashes.difference_update(
+        Rendering.objects.values_list('xml_hash', flat=True).iterator())
+    return sorted(hashes)
+
+
+def xml_for(hashes):
+    """
+    Return a list of (hash, XML) pairs for the given hashes.
+    """
+    remaining = set(hashes)
+    items = []
+    for model in RENDERED_MODELS:
+        if not remaining:
+            break
+        for xml_hash, xml in model.objects.filter(
+                xml_hash__in=list(remaining)).values_list(
+                'xml_hash', 'xml_repr').iterator():
+            if xml_hash in remaining:
+                remaining.remove(xml_hash)
+                items.append((xml_hash, xml))
+    return items
+
+
+def render_all(processes=None, progress=None):
+    """
+    Render all XML representations that were not rendered yet, using
+    a pool of processes (as many as there are CPUs, unless processes
+    is given; with processes=1, everything is rendered in this
+    process). If progress is given, it is called with the number of
+    representations rendered so far after each batch.
+
+    Renderings of XML no longer used by any object are deleted.
+    Return the number of representations rendered.
+    """
+    hashes = missing_hashes()
+    pool = Pool(processes) if processes != 1 and hashes else None
+    rendered = 0
+    try:
+        for start in range(0, len(hashes), BATCH_SIZE):
+            items = xml_for(hashes[start:start + BATCH_SIZE])
+            if pool:
+                results = pool.map(_render_item, items, chunksize=10)
+            else:
+                results = map(_render_item, items)
+            with transaction.commit_on_success():
+                Rendering.objects.bulk_create(
+                    Rendering(xml_hash=xml_hash, html=html)
+                    for xml_hash, html in results)
+            rendered += len(results)
+            if progress:
+                progress(rendered)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    prune()
+    return rendered
+
+
+def prune():
+    """
+    Delete renderings of XML that is no longer used by any object.
+    """
+    with transaction.commit_on_success():
+        renderings = Rendering.objects.all()
+        for model in RENDERED_MODELS:
+            renderings = renderings.exclude(
+                xml_hash__in=model.objects.values('xml_hash'))
+        renderings.delete()
@@ -0,0 +1,309 @@
+"""
+This module provides full-text search over regests and concepts.
+
+Regests (title, content, original, translation) and concepts (name,
+description, additional names) are indexed in SQLite FTS5 tables (see
+sql/regest.sqlite3.sql and sql/concept.sqlite3.sql), which are kept
+in sync with the database by the signal handlers defined below.
+Umlauts and sharp s are folded (see utils.fold_german) before text is
+indexed or searched, and the tokenizer removes all other diacritics,
+so that e.g. "Saarbruecken" also finds the spelling with an umlaut,
+and vice versa.
+
+On databases other than SQLite, and on SQLite databases lacking the
+tables of the indexes (e.g. because SQLite was built without FTS5),
+nothing is indexed and searches fall back to case-insensitive
+substring matching.
+"""
+
+import operator
+import re
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from regesten_webapp.models import Concept, Regest, bulk_written
+from regesten_webapp.utils import ancestor_link, fold_german
+
+# Number of rows written to a full-text index at a time.
+BATCH_SIZE = 500
+
+WORD_PATTERN = re.compile('\w+', re.UNICODE)
+
+
+def fts_tables(using, refresh=False):
+    """
+    Return set of the names of the tables in database using, or an
+    empty set if it is not an SQLite database. The full-text index
+    tables are missing if SQLite lacks FTS5 (see sql/*.sqlite3.sql).
+    Tables are only looked up once per connection (unless refresh is
+    True).
+    """
+    wrapper = connections[using]
+    if wrapper.vendor != 'sqlite':
+        return set()
+    # Make sure the connection is open, without counting a query.
+    wrapper.cursor()
+    cached = getattr(wrapper, '_fts_tables', None)
+    if refresh or cached is None or cached[0] is not wrapper.connection:
+        tables = set(row[0] for row in wrapper.connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"))
+        wrapper._fts_tables = cached = (wrapper.connection, tables)
+    return cached[1]
+
+
+class FullTextIndex(object):
+    """
+    The FullTextIndex class represents the full-text index of a
+    model. Objects of subclasses of the model (e.g. Person for
+    Concept) are indexed under the primary key of the model.
+    """
+
+    def __init__(self, model, table, fields, weights):
+        self.model = model
+        self.table = table
+        self.fields = fields
+        self.weights = weights
+
+    def enabled(self, using):
+        """
+        Return whether or not the table of the index exists in database
+        using (see fts_tables).
+        """
+        return self.table in fts_tables(using)
+
+    @staticmethod
+    def words(text):
+        """
+        Return the words of text, with umlauts and sharp s folded.
+        """
+        return WORD_PATTERN.findall(fold_german(text))
+
+    def query(self, text, columns=None):
+        """
+        Return FTS5 query matching all documents that contain every
+        word of text as a prefix of one of their words (in one of the
+        given columns, if any), or None if text contains no words.
+        """
+        words = self.words(text)
+        if not words:
+            return None
+        query = u' '.join(u'"{0}"*'.format(word) for word in words)
+        if columns:
+            query = u'{{{0}}} : ({1})'.format(u' '.join(columns), query)
+        return query
+
+    def link(self, model):
+        """
+        Return the name of the field holding the primary key of
+        self.model for objects of model.
+        """
+        return ancestor_link(model, self.model)
+
+    def key(self, instance):
+        """
+        Return primary key of self.model for instance.
+        """
+        return getattr(instance, instance._meta.get_field(
+                self.link(type(instance))).attname)
+
+    def document(self, instance):
+        """
+        Return the text of instance to index as a list holding one
+        string per field.
+        """
+        return [fold_german(getattr(instance, field) or u'')
+                for field in self.fields]
+
+    def update(self, instances, using):
+        """
+        Add instances to the index, replacing any earlier versions
+        of them.
+        """
+        if not self.enabled(using):
+            return
+        rows = [[self.key(instance)] + self.document(instance)
+                for instance in instances]
+        connections[using].cursor().executemany(
+            self.__insert(replace=True), rows)
+        transaction.commit_unless_managed(using=using)
+
+    def delete(self, keys, using):
+        """
+        Remove the objects with the given primary keys from the
+        index.
+        """
+        if not self.enabled(using):
+            return
+        cursor = connections[using].cursor()
+        cursor.executemany(
+            'DELETE FROM {0} WHERE rowid = %s'.format(self.table),
+            [[key] for key in keys])
+        transaction.commit_unless_managed(using=using)
+
+    def rebuild(self, using='default'):
+        """
+        Replace the contents of the index with all objects of
+        self.model in the database. Return the number of objects
+        indexed.
+        """
+        if self.table not in fts_tables(using, refresh=True):
+            return 0
+        cursor = connections[using].cursor()
+        count = 0
+        with transaction.commit_on_success(using=using):
+            cursor.execute('DELETE FROM {0}'.format(self.table))
+            rows = []
+            for row in self.model._default_manager.using(using).values_list(
+                    'pk', *self.fields).iterator():
+                rows.append([row[0]] + [fold_german(value or u'')
+                                        for value in row[1:]])
+                if len(rows) == BATCH_SIZE:
+                    cursor.executemany(self.__insert(), rows)
+                    count += len(rows)
+                    rows = []
+            cursor.executemany(self.__insert(), rows)
+            count += len(rows)
+        return count
+
+    def matching(self, text, using='default', columns=None):
+        """
+        Return a queryset of the primary keys of all objects of
+        self.model matching text (in the given indexed fields, if
+        any).
+        """
+        # The column is not qualified with its table, because Django
+        # renames the table when nesting the queryset in another one.
+        return self.model._default_manager.using(using).extra(
+            where=['{0} IN (SELECT rowid FROM {1} WHERE {1} MATCH %s)'
+                   .format(connections[using].ops.quote_name(
+                            self.model._meta.pk.column), self.table)],
+            params=[self.query(text, columns)]).values('pk')
+
+    def filter(self, queryset, text, fields=(), columns=None):
+        """
+        Restrict queryset to objects of self.model (or a subclass)
+        that match every word of text, either in the index (in the
+        given indexed fields, if any) or (case-insensitively) in one
+        of the additional fields.
+        """
+        link = self.link(queryset.model)
+        for word in text.split():
+            if self.enabled(queryset.db):
+                if not self.words(word):
+                    continue
+                queries = [Q(**{link + '__in': self.matching(
+                                word, queryset.db, columns)})]
+            else:
+                queries = [Q(**{field + '__icontains': word})
+                           for field in columns or self.fields]
+            queries.extend(Q(**{field + '__icontains': word})
+                           for field in fields)
+            queryset = queryset.filter(reduce(operator.or_, queries))
+        return queryset
+
+    def search(self, text, queryset=None):
+        """
+        Return objects of self.model (or of queryset, which must
+        hold objects of self.model) matching every word of text,
+        ordered by relevance. Matches in fields with higher weights
+        count more.
+        """
+        if queryset is None:
+            queryset = self.model._default_manager.all()
+        query = self.query(text)
+        if query is None:
+            return queryset.none()
+        if not self.enabled(queryset.db):
+            return self.filter(queryset, text)
+        return queryset.extra(
+            select={'rank': 'bm25({0}, {1})'.format(
+                    self.table, ', '.join(
+                        str(weight) for weight in self.weights))},
+            tables=[self.table],
+            where=['{0}.rowid = {1}'.format(
+                    self.table, self.__pk_column(queryset.db)),
+                   '{0} MATCH %s'.format(self.table)],
+            params=[query], order_by=['rank'])
+
+    def __insert(self, replace=False):
+        return 'INSERT {0}INTO {1} (rowid, {2}) VALUES (%s, {3})'.format(
+            'OR REPLACE ' if replace else '', self.table,
+            ', '.join(self.fields),
+            ', '.join(['%s'] * len(self.fields)))
+
+    def __pk_column(self, using):
+        quote_name = connections[using].ops.quote_name
+        return '{0}.{1}'.format(quote_name(self.model._meta.db_table),
+                                quote_name(self.model._meta.pk.column))
+
+
+REGEST_INDEX = FullTextIndex(
+    Regest, 'regesten_webapp_regest_fts',
+    ['title', 'content', 'original', 'translation'], [10, 1, 1, 1])
+CONCEPT_INDEX = FullTextIndex(
+    Concept, 'regesten_webapp_concept_fts',
+    ['name', 'description', 'additional_names'], [10, 1, 5])
+
+INDEXES = [REGEST_INDEX, CONCEPT_INDEX]
+
+
+def index_for(model):
+    """
+    Return the full-text index holding objects of model, or None if
+    objects of model are not indexed.
+    """
+    for index in INDEXES:
+        if issubclass(model, index.model):
+            return index
+    return None
+
+
+def search_regests(text):
+    """
+    Return regests matching every word of text, best matches first.
+    """
+    return REGEST_INDEX.search(text)
+
+
+def search_concepts(text):
+    """
+    Return concepts matching every word of text, best matches first.
+    """
+    return CONCEPT_INDEX.search(text)
+
+
+def rebuild(using='default'):
+    """
+    Rebuild all full-text indexes. Return a dict mapping names of the
+    indexed models to the number of objects indexed.
+    """
+    return dict((index.model.__name__, index.rebuild(using))
+                for index in INDEXES)
+
+
+def update_index(sender, instance, using='default', **kwargs):
+    index = index_for(sender)
+    if index is not None:
+        index.update([instance], using)
+
+
+def delete_from_index(sender, instance, using='default', **kwargs):
+    index = index_for(sender)
+    if index is not None:
+        index.delete([index.key(instance)], using)
+
+
+def update_index_in_bulk(sender, instances, using='default', **kwargs):
+    index = index_for(sender)
+    if index is not None:
+        if instances is None:
+            index.rebuild(using)
+        else:
+            index.update(instances, using)
+
+
+post_save.connect(update_index, dispatch_uid='regesten_webapp.search')
+post_delete.connect(delete_from_index, dispatch_uid='regesten_webapp.search')
+bulk_written.connect(update_index_in_bulk,
+                     dispatch_uid='regesten_webapp.search')
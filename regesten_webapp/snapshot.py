@@ -0,0 +1,205 @@
+"""
+This module provides functions for writing the contents of the Sbr
+Regesten database to a snapshot file and for restoring the database
+from such a file.
+
+A snapshot is a zip archive containing one JSON Lines file per table
+of the regesten_webapp app (including the tables of parent models and
+of many-to-many relations) plus a manifest. Each line holds the values
+of a single row in the order of the columns listed in the manifest.
+Rows are read and written with raw SQL, which is considerably faster
+than going through the serialization framework (dumpdata/loaddata).
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from contextlib import closing
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import get_app, get_models
+
+SNAPSHOT_FORMAT = 1
+BATCH_SIZE = 500
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot can not be restored, e.g. because it was
+    written from a database with a different schema.
+    """
+    pass
+
+
+def snapshot_models():
+    """
+    Return all models whose tables are included in a snapshot.
+
+    The generation of the corpus is not included: Restoring a
+    snapshot advances it instead, so that cached data computed for
+    generations of the snapshot is not used again.
+    """
+    from regesten_webapp.models import Generation
+    return [model for model in get_models(
+            get_app('regesten_webapp'), include_auto_created=True)
+            if model is not Generation]
+
+
+def _columns(model):
+    return [field.column for field in model._meta.local_fields]
+
+
+def _content_type_columns(model):
+    """
+    Return positions of columns of model that reference content
+    types. Content type ids are not guaranteed to be the same across
+    databases, so they are translated when restoring a snapshot.
+    """
+    return [position for position, field in
+            enumerate(model._meta.local_fields)
+            if field.rel and field.rel.to is ContentType]
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    elif isinstance(value, Decimal):
+        return str(value)
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+def export_snapshot(path):
+    """
+    Write all rows of all tables of the regesten_webapp app to a
+    snapshot file at path and return the manifest of the snapshot.
+    """
+    quote_name = connection.ops.quote_name
+    cursor = connection.cursor()
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'tables': [],
+        'content_types': dict(
+            (content_type.id, [content_type.app_label, content_type.model])
+            for content_type in ContentType.objects.all()),
+        }
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        with closing(zipfile.ZipFile(
+                path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)) as archive:
+            for model in snapshot_models():
+                table = model._meta.db_table
+                columns = _columns(model)
+                cursor.execute('SELECT {0} FROM {1} ORDER BY {2}'.format(
+                        ', '.join(quote_name(column) for column in columns),
+                        quote_name(table), quote_name(model._meta.pk.column)))
+                tmp_path = os.path.join(tmp_dir, table + '.jsonl')
+                count = 0
+                with open(tmp_path, 'wb') as tmp_file:
+                    rows = cursor.fetchmany(BATCH_SIZE)
+                    while rows:
+                        for row in rows:
+                            tmp_file.write(
+                                json.dumps(row, default=_encode_value) + '\n')
+                        count += len(rows)
+                        rows = cursor.fetchmany(BATCH_SIZE)
+                archive.write(tmp_path, table + '.jsonl')
+                manifest['tables'].append(
+                    {'table': table, 'columns': columns, 'rows': count})
+            archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return manifest
+
+
+def restore_snapshot(path):
+    """
+    Replace the contents of all tables of the regesten_webapp app
+    with the rows stored in the snapshot file at path and return the
+    manifest of the snapshot.
+
+    Rows keep their ids. All tables are restored in a single
+    transaction, so the database is left untouched if restoring
+    fails.
+    """
+    with closing(zipfile.ZipFile(path)) as archive:
+        manifest = json.loads(archive.read('manifest.json'))
+        if manifest.get('format') != SNAPSHOT_FORMAT:
+            raise SnapshotError(
+                'Unsupported snapshot format: {0}'.format(
+                    manifest.get('format')))
+
+        models = dict((model._meta.db_table, model)
+                      for model in snapshot_models())
+        tables = dict((table['table'], table) for table in manifest['tables'])
+        if set(tables) != set(models):
+            raise SnapshotError(
+                'Snapshot tables do not match database tables: {0}'.format(
+                    ', '.join(sorted(set(tables) ^ set(models)))))
+        for table, model in models.items():
+            if tables[table]['columns'] != _columns(model):
+                raise SnapshotError(
+                    'Snapshot columns do not match columns of table ' \
+                        '{0}'.format(table))
+
+        content_types = {}
+        for content_type_id, natural_key in \
+                manifest['content_types'].items():
+            try:
+                content_types[int(content_type_id)] = \
+                    ContentType.objects.get_by_natural_key(*natural_key).id
+            except ContentType.DoesNotExist:
+                pass
+
+        quote_name = connection.ops.quote_name
+        cursor = connection.cursor()
+        with transaction.commit_on_success():
+            for table in models:
+                cursor.execute('DELETE FROM {0}'.format(quote_name(table)))
+            for table in manifest['tables']:
+                model = models[table['table']]
+                content_type_columns = _content_type_columns(model)
+                insert = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                    quote_name(table['table']),
+                    ', '.join(quote_name(column)
+                              for column in table['columns']),
+                    ', '.join(['%s'] * len(table['columns'])))
+                batch = []
+                with closing(archive.open(table['table'] + '.jsonl')) \
+                        as table_file:
+                    for line in table_file:
+                        row = json.loads(line)
+                        for position in content_type_columns:
+                            if row[position] is None:
+                                continue
+                            if row[position] not in content_types:
+                                raise SnapshotError(
+                                    'Unknown content type: {0}'.format(
+                                        manifest['content_types'][
+                                            str(row[position])]))
+                            row[position] = content_types[row[position]]
+                        batch.append(row)
+                        if len(batch) == BATCH_SIZE:
+                            cursor.executemany(insert, batch)
+                            batch = []
+                if batch:
+                    cursor.executemany(insert, batch)
+            for statement in connection.ops.sequence_reset_sql(
+                    no_style(), models.values()):
+                cursor.execute(statement)
+    # Rows of subclasses are restored along with the rows of their
+    # parents, so only models without parents are signalled.
+    from regesten_webapp.generation import deferred_bump
+    from regesten_webapp.models import bulk_written
+    with deferred_bump():
+        for model in models.values():
+            if not model._meta.parents:
+                bulk_written.send(sender=model, instances=None,
+                                  using=connection.alias)
+    return manifest
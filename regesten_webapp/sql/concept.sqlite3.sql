@@ -0,0 +1,8 @@
+-- Full-text index over concepts (see regesten_webapp.search). Rows use
+-- the id of their concept as rowid. Django runs this file after
+-- creating the table. To add the index to an existing database, run
+-- it against the database directly, followed by the
+-- rebuild_search_index command.
+CREATE VIRTUAL TABLE IF NOT EXISTS regesten_webapp_concept_fts USING fts5(
+    name, description, additional_names,
+    tokenize = 'unicode61 remove_diacritics 2');
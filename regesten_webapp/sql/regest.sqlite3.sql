@@ -0,0 +1,8 @@
+-- Full-text index over regests (see regesten_webapp.search). Rows use
+-- the id of their regest as rowid. Django runs this file after
+-- creating the table. To add the index to an existing database, run
+-- it against the database directly, followed by the
+-- rebuild_search_index command.
+CREATE VIRTUAL TABLE IF NOT EXISTS regesten_webapp_regest_fts USING fts5(
+    title, content, original, translation,
+    tokenize = 'unicode61 remove_diacritics 2');
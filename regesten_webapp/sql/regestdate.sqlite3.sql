@@ -0,0 +1,9 @@
+-- Composite indexes for looking up dates by period (see
+-- RegestDateManager.overlapping) and for listing the dates of a
+-- regest in chronological order. Django runs this file after creating
+-- the table. To add the indexes to an existing database, run it
+-- against the database directly.
+CREATE INDEX IF NOT EXISTS regesten_webapp_regestdate_start_end
+    ON regesten_webapp_regestdate (start, "end");
+CREATE INDEX IF NOT EXISTS regesten_webapp_regestdate_regest_start
+    ON regesten_webapp_regestdate (regest_id, start);
@@ -0,0 +1,72 @@
+/*
+ * Autocompletion for AutocompleteSelectMultiple widgets (see
+ * widgets.py): While typing into the search field of a widget, objects
+ * matching the text are looked up with the autocomplete view and
+ * listed below the field. Clicking one of them adds it to the selected
+ * objects of the widget.
+ *
+ * Written against the version of jQuery bundled with the admin
+ * interface of Django 1.4 (1.4.2).
+ */
+
+(function($) {
+    // Number of milliseconds to wait after the last key stroke before
+    // looking up matching objects.
+    var DELAY = 250;
+
+    function setUp(input) {
+        var select = $('#' + input.attr('data-select'));
+        var results = $('<ul class="autocomplete-results"></ul>');
+        var timeout = null;
+        var lastText = null;
+        input.after(results);
+
+        function lookUp() {
+            var text = $.trim(input.val());
+            if (text === lastText) {
+                return;
+            }
+            lastText = text;
+            results.empty();
+            if (!text) {
+                return;
+            }
+            $.getJSON(input.attr('data-url'), {q: text}, function(data) {
+                if (text !== lastText) {
+                    return;
+                }
+                results.empty();
+                $.each(data.results, function(i, result) {
+                    $('<li></li>').text(result.text).data('id', result.id)
+                        .appendTo(results);
+                });
+            });
+        }
+
+        input.keyup(function() {
+            window.clearTimeout(timeout);
+            timeout = window.setTimeout(lookUp, DELAY);
+        });
+        results.delegate('li', 'click', function() {
+            var item = $(this);
+            var id = String(item.data('id'));
+            var option = select.find('option').filter(function() {
+                return this.value === id;
+            });
+            if (!option.length) {
+                option = $('<option></option>').val(id).text(item.text())
+                    .appendTo(select);
+            }
+            option.attr('selected', 'selected');
+            results.empty();
+            input.val('');
+            lastText = null;
+        });
+    }
+
+    $(function() {
+        $('input.autocomplete').each(function() {
+            setUp($(this));
+        });
+    });
+})(django.jQuery);
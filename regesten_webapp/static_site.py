@@ -0,0 +1,265 @@
+"""
+This module builds a static version of the Sbr Regesten website, to be
+served without Django: one page per regest and per index entry, plus
+alphabetical lists of index entries and timeline pages listing the
+regests of every decade.
+
+Builds are incremental: Every page is identified by a fingerprint of
+the data it shows (including the hashes of the XML representations
+it displays, see rendering.py) and of the templates, and only pages
+whose fingerprints changed since the last build are rendered again.
+Fingerprints are stored in a manifest in the output directory.
+Templates are rendered and pages written in a pool of processes, while
+this process reads the database.
+"""
+
+import hashlib
+import json
+import os
+
+from collections import defaultdict
+from multiprocessing import Pool
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+from django.utils.translation import ugettext as _
+from regesten_webapp.export import entry_records, regest_records
+from regesten_webapp.models import Concept, IndexEntry, Regest, Rendering
+from regesten_webapp.rendering import render_all
+from regesten_webapp.utils import fold_german
+
+# Name of the file in the output directory holding the fingerprints of
+# all pages built.
+MANIFEST = '.manifest.json'
+
+# Number of pages rendered and written at a time.
+BATCH_SIZE = 200
+
+# Directory holding the templates of the pages.
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'templates', 'site')
+
+
+def templates_hash():
+    """
+    Return hash of the contents of all templates of the site, so that
+    changing a template causes all pages to be built again.
+    """
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        digest.update(name)
+        with open(os.path.join(TEMPLATE_DIR, name), 'rb') as template:
+            digest.update(template.read())
+    return digest.hexdigest()
+
+
+def fingerprint(template, context, base):
+    """
+    Return fingerprint of the page rendered from template and context,
+    given the hash of all templates (base).
+    """
+    return hashlib.sha1(json.dumps(
+            [base, template, context], cls=DjangoJSONEncoder,
+            sort_keys=True)).hexdigest()
+
+
+def regest_path(regest_id):
+    return 'regests/{0}.html'.format(regest_id)
+
+
+def entry_path(entry_id):
+    return 'index/{0}.html'.format(entry_id)
+
+
+def letter(name):
+    """
+    Return letter under which name is listed alphabetically.
+    """
+    initial = fold_german(name.strip())[:1].upper()
+    return initial if initial.isalpha() else '_'
+
+
+def decade(earliest_start):
+    return earliest_start.year // 10 * 10 if earliest_start else None
+
+
+def pages():
+    """
+    Yield (path, template, context) triples for all pages of the site.
+    Contexts of pages displaying XML representations hold their hashes
+    (as xml_hash) instead of the rendered HTML.
+    """
+    concept_names = dict(Concept.objects.values_list('id', 'name').iterator())
+    entries = list(entry_records())
+    entry_hashes = dict(IndexEntry.objects.values_list('id', 'xml_hash'))
+    entry_names = dict((entry['id'], entry['name']) for entry in entries)
+    entry_links = dict((entry['concept'], entry_path(entry['id']))
+                       for entry in entries)
+
+    def concept(concept_id):
+        return {'name': concept_names.get(concept_id, ''),
+                'link': entry_links.get(concept_id)}
+
+    def entry_item(entry_id):
+        return {'name': entry_names.get(entry_id, ''),
+                'link': entry_path(entry_id)}
+
+    regest_hashes = dict(Regest.objects.values_list('id', 'xml_hash'))
+    mentioned_in = defaultdict(list)
+    decades = defaultdict(list)
+    for regest in regest_records():
+        path = regest_path(regest['id'])
+        item = {'name': regest['title'], 'link': path}
+        for concept_id in regest['mentions']:
+            mentioned_in[concept_id].append(item)
+        decades[decade(regest['earliest_start'])].append(
+            (regest['earliest_start'], regest['id'], item))
+        yield path, 'site/regest.html', {
+            'regest': regest, 'xml_hash': regest_hashes[regest['id']],
+            'mentions': [concept(concept_id)
+                         for concept_id in regest['mentions']]}
+
+    letters = defaultdict(list)
+    for entry in entries:
+        path = entry_path(entry['id'])
+        letters[letter(entry['name'])].append(
+            (fold_german(entry['name']).lower(), entry['id'],
+             {'name': entry['name'], 'link': path}))
+        sections = [
+            (_('Related entries'), [
+                    entry_item(entry_id)
+                    for entry_id in entry['related_entries']]),
+            (_('Related concepts'), [
+                    concept(concept_id)
+                    for concept_id in entry['related_concepts']]),
+            (_('Members'), [entry_item(person_id)
+                            for person_id in entry.get('members', [])]),
+            (_('Mentioned in'), mentioned_in.get(entry['concept'], []))]
+        yield path, 'site/entry.html', {
+            'entry': entry, 'xml_hash': entry_hashes[entry['id']],
+            'sections': [{'title': title, 'items': items}
+                         for title, items in sections]}
+
+    letter_pages = [{'name': initial, 'link': 'alphabet/{0}.html'.format(
+                initial)} for initial in sorted(letters)]
+    yield 'alphabet/index.html', 'site/list.html', {
+        'title': _('Index'), 'pages': letter_pages, 'items': []}
+    for initial, items in sorted(letters.items()):
+        yield 'alphabet/{0}.html'.format(initial), 'site/list.html', {
+            'title': initial, 'pages': letter_pages,
+            'items': [item for key, pk, item in sorted(items)]}
+
+    decade_pages = [
+        {'name': unicode(start) if start is not None else _('Undated'),
+         'link': 'timeline/{0}.html'.format(
+                start if start is not None else 'undated')}
+        for start in sorted(decades)]
+    yield 'timeline/index.html', 'site/list.html', {
+        'title': _('Timeline'), 'pages': decade_pages, 'items': []}
+    for start, page in zip(sorted(decades), decade_pages):
+        yield page['link'], 'site/list.html', {
+            'title': page['name'], 'pages': decade_pages,
+            'items': [item for key, pk, item in sorted(
+                    decades[start], key=lambda item: item[:2])]}
+
+    yield 'index.html', 'site/home.html', {
+        'regest_count': len(regest_hashes), 'entry_count': len(entries)}
+
+
+def _write_page(item):
+    """
+    Render page from template and context and write it to path in
+    the output directory.
+    """
+    output, path, template, context = item
+    context['root'] = '../' * path.count('/')
+    content = render_to_string(template, context).encode('utf-8')
+    filename = os.path.join(output, *path.split('/'))
+    directory = os.path.dirname(filename)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Another process created the directory in the meantime.
+            if not os.path.isdir(directory):
+                raise
+    with open(filename + '.tmp', 'wb') as page:
+        page.write(content)
+    os.rename(filename + '.tmp', filename)
+    return path
+
+
+def _load_manifest(output):
+    try:
+        with open(os.path.join(output, MANIFEST)) as manifest:
+            return json.load(manifest)
+    except IOError:
+        return {}
+
+
+def _save_manifest(output, fingerprints):
+    filename = os.path.join(output, MANIFEST)
+    with open(filename + '.tmp', 'w') as manifest:
+        json.dump(fingerprints, manifest, sort_keys=True, indent=0)
+    os.rename(filename + '.tmp', filename)
+
+
+def build(output, processes=None, force=False):
+    """
+    Build the static site in directory output, rendering only pages
+    whose fingerprints changed since the last build (or all pages if
+    force is True), in a pool of processes (as many as there are CPUs,
+    unless processes is given; with processes=1, everything is done
+    in this process). Pages that no longer exist are deleted.
+
+    Return a dict holding the numbers of pages built, unchanged, and
+    deleted.
+    """
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    render_all(processes)
+    previous = _load_manifest(output)
+    base = templates_hash()
+    fingerprints = {}
+    counts = {'built': 0, 'unchanged': 0, 'deleted': 0}
+    pool = Pool(processes) if processes != 1 else None
+    batch = []
+
+    def flush():
+        hashes = [context['xml_hash'] for path, template, context in batch
+                  if context.get('xml_hash')]
+        html = dict(Rendering.objects.filter(
+                xml_hash__in=hashes).values_list('xml_hash', 'html'))
+        items = []
+        for path, template, context in batch:
+            context['html'] = html.get(context.get('xml_hash'), '')
+            items.append((output, path, template, context))
+        if pool:
+            pool.map(_write_page, items)
+        else:
+            map(_write_page, items)
+        counts['built'] += len(items)
+        del batch[:]
+
+    try:
+        for path, template, context in pages():
+            fingerprints[path] = fingerprint(template, context, base)
+            if not force and previous.get(path) == fingerprints[path] and \
+                    os.path.exists(os.path.join(output, *path.split('/'))):
+                counts['unchanged'] += 1
+                continue
+            batch.append((path, template, context))
+            if len(batch) == BATCH_SIZE:
+                flush()
+        flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    for path in set(previous).difference(fingerprints):
+        filename = os.path.join(output, *path.split('/'))
+        if os.path.exists(filename):
+            os.remove(filename)
+        counts['deleted'] += 1
+    _save_manifest(output, fingerprints)
+    return counts
@@ -9,10 +9,38 @@ They can be run via
 Author: Tim Krones <tkrones@coli.uni-saarland.de>
 """
 
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+from StringIO import StringIO
 from collections import namedtuple
 from datetime import date
-from django.test import TestCase
-from regesten_webapp.models import Regest
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from extraction.index_utils.index_to_db import index_to_db, iter_items
+from extraction.index_utils.index_to_db import pipelined_items_to_db
+from regesten_webapp import analytics, facets, generation, rendering, search
+from regesten_webapp import export, graph, static_site, views
+from regesten_webapp.models import Archive, Concept, Family, Generation
+from regesten_webapp.models import IndexEntry
+from regesten_webapp.models import Landmark, Location, Person, PersonGroup
+from regesten_webapp.models import NameKey, Quote, Regest, Rendering
+from regesten_webapp.models import name_lookup
+from regesten_webapp.models import RegestDate, Region
+from regesten_webapp.benchmarks import classify_by_cascade, title_corpus
+from regesten_webapp.snapshot import export_snapshot, restore_snapshot
+from regesten_webapp.utils import LRUCache, RegestDateExtractor, name_key
+from regesten_webapp.utils import RegestTitleAnalyzer
 
 
 class RegestTest(TestCase):
@@ -2165,3 +2193,1026 @@ class RegestTest(TestCase):
         self.__create_and_check_dates(
             '1419-05 bis 06 (Mai bis Juli)', self.RegestDate(
                 date(1419, 05, 01), date(1419, 06, 01), '', '', False))
+
+
+    def test_save_queries(self):
+        """
+        Check whether or not the number of queries needed for saving a
+        Regest is independent of the number of dates associated with
+        it.
+        """
+        generation.bump()
+        with self.assertNumQueries(6):
+            regest = Regest.objects.create(title='1520')
+        with self.assertNumQueries(6):
+            Regest.objects.create(title='1520 bzw. 1519 bzw. 1518')
+        regest.title = '1520-02-18 bzw. 1519-03-06 bzw. 1518-04-23'
+        with self.assertNumQueries(8):
+            regest.save()
+        self.assertEqual(regest.regestdate_set.count(), 3)
+        regest.title = '1520'
+        with self.assertNumQueries(8):
+            regest.save()
+        self.assertEqual(regest.regestdate_set.count(), 1)
+
+    def test_save_unchanged_title(self):
+        """
+        Check whether or not dates are only regenerated when the title
+        of a Regest changes or regeneration is forced.
+        """
+        regest = Regest.objects.create(title='1520 bzw. 1519')
+        regest.regestdate_set.all().delete()
+        regest.content = 'Content'
+        with self.assertNumQueries(5):
+            regest.save()
+        regest = Regest.objects.get(id=regest.id)
+        with self.assertNumQueries(5):
+            regest.save()
+        self.assertEqual(regest.regestdate_set.count(), 0)
+        regest.save(force_dates=True)
+        self.assertEqual(regest.regestdate_set.count(), 2)
+        regest.title = '1520'
+        regest.save()
+        self.assertEqual(regest.regestdate_set.count(), 1)
+
+    def test_save_new_regest_with_id(self):
+        """
+        Check whether or not dates and chronological sort keys are
+        generated for new regests saved with an explicit id.
+        """
+        Regest(id=5, title='1520-02-18').save()
+        regest = Regest.objects.get(id=5)
+        self.assertEqual(regest.regestdate_set.count(), 1)
+        self.assertEqual(regest.earliest_start, date(1520, 2, 18))
+
+    def test_bulk_import(self):
+        """
+        Check whether or not bulk import creates Regest objects along
+        with the same dates as saving them one at a time.
+        """
+        titles = ['1520 bzw. 1519', '1419-05 bis 06 (Mai bis Juli)',
+                  '1520 bzw. 1519', '1502-11-22 (1503-02-07) St. Arnual']
+        Regest.objects.create(title=titles[0])
+        progress = []
+        imported = Regest.objects.bulk_import(
+            [{'title': title, 'content': str(i)}
+             for i, title in enumerate(titles)],
+            chunk_size=3, progress=progress.append)
+        self.assertEqual(imported, 4)
+        self.assertEqual(progress, [3, 4])
+        self.assertEqual(Regest.objects.count(), 5)
+        for i, title in enumerate(titles):
+            regest = Regest.objects.get(content=str(i))
+            self.assertEqual(regest.title, title)
+            self.assertEqual(
+                sorted(regest.regestdate_set.values_list(
+                        'start', 'end', 'start_offset', 'end_offset',
+                        'alt_date')),
+                sorted(Regest.extract_dates(title)))
+
+    def test_classify(self):
+        """
+        Check whether or not classifying a title with a single pattern
+        yields the same type as checking each type separately.
+        """
+        for title in title_corpus():
+            self.assertEqual(RegestTitleAnalyzer.classify(title),
+                             classify_by_cascade(title), msg=title)
+
+    def test_date_cache(self):
+        """
+        Check whether or not the cache for extracted dates returns the
+        same dates as extracting them again and discards the least
+        recently used dates once it is full.
+        """
+        titles = ['1520 bzw. 1519', '1419-05 bis 06', '1524-1525']
+        cache = RegestDateExtractor.cache
+        cache.clear()
+        cached = [Regest.extract_dates(title) for title in titles * 2]
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(cache.stats()['misses'], 3)
+        cache.enabled = False
+        try:
+            self.assertEqual(
+                [Regest.extract_dates(title) for title in titles * 2], cached)
+        finally:
+            cache.enabled = True
+        self.assertEqual(cache.stats()['hits'], 3)
+
+        cache = LRUCache(maxsize=2)
+        for key in ['a', 'b', 'a', 'c', 'a', 'b']:
+            cache.get(key, lambda: key.upper())
+        self.assertEqual(cache.stats(), {
+                'hits': 2, 'misses': 4, 'evictions': 2, 'size': 2,
+                'maxsize': 2})
+        self.assertEqual(cache.values.keys(), ['a', 'b'])
+
+    def test_date_keys(self):
+        """
+        Check whether or not the chronological sort keys of a Regest
+        are kept in sync with its dates and can be recomputed from
+        them.
+        """
+        regest = Regest.objects.create(title='1520 bzw. 1519 bzw. 1518')
+        self.assertEqual(regest.earliest_start, date(1518, 01, 01))
+        self.assertEqual(regest.latest_end, date(1520, 01, 01))
+        self.assertTrue(regest.is_exact)
+        regest.title = '1419-05 bis 06 (vor)'
+        regest.save()
+        regest = Regest.objects.get(id=regest.id)
+        self.assertEqual(regest.earliest_start, date(1419, 05, 01))
+        self.assertEqual(regest.latest_end, date(1419, 06, 01))
+        self.assertFalse(regest.is_exact)
+
+        Regest.objects.bulk_import([{'title': '1524/1525'}])
+        Regest.objects.update(earliest_start=None, latest_end=None,
+                              is_exact=False)
+        self.assertEqual(Regest.objects.update_date_keys(), 2)
+        self.assertEqual(Regest.objects.update_date_keys(), 0)
+        self.assertEqual(
+            list(Regest.objects.order_by('earliest_start').values_list(
+                    'earliest_start', 'latest_end', 'is_exact')),
+            [(date(1419, 05, 01), date(1419, 06, 01), False),
+             (date(1524, 01, 01), date(1525, 01, 01), True)])
+
+    def test_overlapping(self):
+        """
+        Check whether or not looking up regests by period finds exactly
+        the regests with a date overlapping the period, taking into
+        account that offsets widen dates.
+        """
+        titles = ['1425', '1431-06-01 (vor)', '1419-06-01 (vor)',
+                  '1419-06-01 (nach)', '1431-06-01 (nach)', '1410-1415',
+                  '1410-1440']
+        for title in titles:
+            Regest.objects.create(title=title)
+        start, end = date(1420, 01, 01), date(1430, 12, 31)
+        self.assertEqual(
+            sorted(Regest.objects.overlapping(start, end).values_list(
+                    'title', flat=True)),
+            ['1410-1440', '1419-06-01 (nach)', '1425', '1431-06-01 (vor)'])
+        self.assertEqual(
+            sorted(Regest.objects.overlapping(
+                    start, end, offsets=False).values_list(
+                    'title', flat=True)),
+            ['1410-1440', '1425'])
+
+    def test_analytics(self):
+        """
+        Check whether or not the date arrays used for corpus-wide
+        statistics match the RegestDate objects in the database, and
+        are reloaded after RegestDate objects are written.
+        """
+        for title in ['1425', '1431-06-01 (vor)', '1419-06-01 (nach)',
+                      '1410-1440']:
+            Regest.objects.create(title=title)
+        arrays = analytics.date_arrays()
+        self.assertEqual(len(arrays), 4)
+        self.assertEqual(arrays.exact_counts(),
+                         {'exact': 2, 'approximate': 2})
+        self.assertEqual(arrays.offset_counts(),
+                         {'': 2, 'vor': 1, 'nach': 1})
+        bins, counts = arrays.histogram('decade')
+        self.assertEqual(bins.tolist(), [1410, 1420, 1430])
+        self.assertEqual(counts.tolist(), [2, 1, 1])
+        bins, counts = arrays.histogram('year', exact=True)
+        self.assertEqual(bins[[0, -1]].tolist(), [1410, 1425])
+        self.assertEqual(counts.sum(), 2)
+        bins, counts = arrays.histogram('month')
+        self.assertEqual(str(bins[0]), '1410-01')
+        self.assertEqual(len(bins), 12 * 21 + 6)
+        bins, counts = arrays.overlap_histogram('decade', offsets=False)
+        self.assertEqual(bins.tolist(), [1410, 1420, 1430, 1440])
+        self.assertEqual(counts.tolist(), [2, 2, 2, 1])
+        start, end = date(1420, 01, 01), date(1430, 12, 31)
+        self.assertEqual(arrays.count_overlapping(start, end),
+                         Regest.objects.overlapping(start, end).count())
+        self.assertEqual(
+            arrays.count_overlapping(start, end, offsets=False),
+            Regest.objects.overlapping(start, end, offsets=False).count())
+        self.assertIs(analytics.date_arrays(), arrays)
+
+        Regest.objects.create(title='1500')
+        self.assertEqual(len(analytics.date_arrays()), 5)
+        RegestDate.objects.filter(start__year=1500).delete()
+        self.assertEqual(len(analytics.date_arrays()), 4)
+
+    def test_analytics_of_other_process(self):
+        """
+        Check whether or not the date arrays are reloaded after another
+        process wrote RegestDate objects and advanced the generation of
+        the corpus.
+        """
+        Regest.objects.create(title='1425')
+        arrays = analytics.date_arrays()
+        self.assertEqual(len(arrays), 1)
+        # Written by another process, whose signals and cache writes are
+        # not seen by this one
+        RegestDate.objects.filter(start__year=1425).update(
+            start=date(1426, 1, 1))
+        Generation.objects.update(value=F('value') + 1)
+        self.assertIs(analytics.date_arrays(), arrays)
+        cache.clear()
+        arrays = analytics.date_arrays()
+        self.assertEqual(arrays.histogram('year')[0].tolist(), [1426])
+
+
+class SearchTest(TestCase):
+    def test_search(self):
+        """
+        Check whether or not the full-text indexes find regests and
+        concepts by any spelling of umlauts, rank matches in titles
+        and names first, and are updated when objects are saved or
+        deleted.
+        """
+        first = Regest.objects.create(
+            title='1425', content=u'Urkunde aus Saarbr\xfccken')
+        second = Regest.objects.create(
+            title='1426', content='Urkunde', original='Saarbruecken')
+        self.assertEqual(set(search.search_regests('saarbr')),
+                         set([first, second]))
+        self.assertEqual(list(search.search_regests('urkunde 1426')),
+                         [second])
+        self.assertEqual(list(search.search_regests('-')), [])
+        first.content = 'Urkunde'
+        first.save()
+        self.assertEqual(list(search.search_regests(u'Saarbr\xfccken')),
+                         [second])
+        second.delete()
+        self.assertEqual(list(search.search_regests('saarbruecken')), [])
+
+        person = Person.objects.create(
+            name=u'Stra\xdfburg, Hans von', forename='Hans',
+            surname='von Strassburg')
+        concept = Concept.objects.create(
+            name='Burg', description=u'bei Stra\xdfburg')
+        self.assertEqual(
+            [concept.id for concept in search.search_concepts('strassburg')],
+            [person.concept_ptr_id, concept.id])
+        self.assertEqual(
+            list(search.CONCEPT_INDEX.filter(
+                    Person.objects.all(), 'strassburg hans')), [person])
+        Regest.objects.bulk_import([{'title': '1427', 'content': 'Burg'}])
+        self.assertEqual(len(search.search_regests('burg')), 1)
+
+    def test_missing_index(self):
+        """
+        Check whether or not indexes whose tables are missing (e.g.
+        because SQLite lacks FTS5) are skipped when objects are
+        saved, and searches fall back to substring matching.
+        """
+        index = search.FullTextIndex(
+            Concept, 'regesten_webapp_missing_fts', ['name'], [1])
+        self.assertTrue(search.CONCEPT_INDEX.enabled('default'))
+        self.assertFalse(index.enabled('default'))
+        concept = Concept.objects.create(name='Saarbruecken')
+        index.update([concept], 'default')
+        index.delete([concept.id], 'default')
+        self.assertEqual(index.rebuild(), 0)
+        self.assertEqual(list(index.search('bruecken')), [concept])
+        self.assertEqual(list(index.search('burg')), [])
+
+
+class ApiTest(TestCase):
+    def test_api(self):
+        """
+        Check whether or not the search API returns matching regests
+        in chronological order, page by page, with the same number of
+        queries for every page.
+        """
+        titles = ['1430', '1420', '1425 (vor)', '1425', '1500', '1400']
+        for title in titles:
+            Regest.objects.create(
+                title=title, author='He' if title < '1450' else 'Kl',
+                content='Urkunde')
+        undated = Regest.objects.create(title='1600', content='Urkunde')
+        undated.regestdate_set.all().delete()
+        Regest.objects.update_date_keys()
+        pages = []
+        url = '/api/regests/?limit=2&q=urkunde'
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            pages.append([regest['title'] for regest in data['results']])
+            url = data['next']
+        self.assertEqual(pages, [['1600', '1400'],
+                                 ['1420', '1425 (vor)'],
+                                 ['1425', '1430'], ['1500']])
+
+        response = self.client.get(
+            '/api/regests/', {'author': 'He', 'start': '1420',
+                              'end': '1430-01'})
+        data = json.loads(response.content)
+        self.assertEqual([regest['title'] for regest in data['results']],
+                         ['1420', '1425 (vor)', '1425', '1430'])
+        self.assertEqual(data['results'][-1]['dates'][0]['start'],
+                         '1430-01-01')
+        self.assertIsNone(data['next'])
+        for parameters in [{'start': '1430-02-30'}, {'limit': 'all'},
+                           {'after': '1425'}]:
+            response = self.client.get('/api/regests/', parameters)
+            self.assertEqual(response.status_code, 400)
+
+        location = Location.objects.create(name='Saarbruecken')
+        Concept.objects.create(name='Burg')
+        Regest.objects.get(title='1500').mentions.add(location.concept_ptr)
+        response = self.client.get('/api/concepts/', {'start': '1500'})
+        self.assertEqual(
+            [concept['name'] for concept in
+             json.loads(response.content)['results']], ['Saarbruecken'])
+        response = self.client.get('/api/concepts/', {'q': 'burg'})
+        self.assertEqual(
+            [concept['name'] for concept in
+             json.loads(response.content)['results']], ['Burg'])
+
+
+class FacetTest(TestCase):
+    def test_facets(self):
+        """
+        Check whether or not facet counts are computed for matching
+        regests only, cached, and recomputed after regests are
+        written.
+        """
+        cache.clear()
+        archive = Archive.objects.create(info='Landesarchiv Saarbruecken')
+        for title, author, location in [
+                ('1420', 'He', 'Saarbruecken'), ('1425', 'He', 'Metz'),
+                ('1431', 'Kl', 'Saarbruecken'), ('1500', 'Kl', 'Metz')]:
+            regest = Regest.objects.create(
+                title=title, author=author, location=location)
+            if title < '1450':
+                regest.archives.add(archive)
+        counts = facets.facet_counts({'end': '1450'})
+        self.assertEqual(counts['author'], [('He', 2), ('Kl', 1)])
+        self.assertEqual(counts['location'],
+                         [('Saarbruecken', 2), ('Metz', 1)])
+        self.assertEqual(counts['decade'], [(1420, 2), (1430, 1)])
+        self.assertEqual(counts['archive'],
+                         [('Landesarchiv Saarbruecken', 3)])
+        with self.assertNumQueries(0):
+            self.assertEqual(facets.facet_counts({'end': '1450'}), counts)
+        regest.author = 'He'
+        regest.save()
+        self.assertEqual(facets.facet_counts({})['author'],
+                         [('He', 3), ('Kl', 1)])
+        response = self.client.get(
+            '/api/regests/facets/', {'location': 'Metz'})
+        self.assertEqual(json.loads(response.content)['author'],
+                         [['He', 2]])
+
+
+class GenerationTest(TestCase):
+    def test_generation(self):
+        """
+        Check whether or not writing regests, concepts, and their
+        relations advances the generation of the corpus once per
+        write, and whether or not API responses are cached and
+        tagged for the current generation.
+        """
+        cache.clear()
+        first = generation.generation()
+        regest = Regest.objects.create(title='1420')
+        second = generation.generation()
+        self.assertNotEqual(first, second)
+        concept = Concept.objects.create(name='Burg')
+        regest.mentions.add(concept)
+        self.assertEqual(generation.generation(), second + 2)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(generation.generation(), second + 2)
+
+        response = self.client.get('/api/concepts/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.client.get('/api/concepts/').content, response.content)
+        response = self.client.get(
+            '/api/concepts/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        Concept.objects.create(name='Kirche')
+        response = self.client.get(
+            '/api/concepts/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['results']), 2)
+
+    def test_generation_of_other_process(self):
+        """
+        Check whether or not generations advanced by other processes,
+        which do not share the cache of this one, are seen once the
+        cached generation expired.
+        """
+        cache.clear()
+        Regest.objects.create(title='1420')
+        timeout = generation.GENERATION_TIMEOUT
+        generation.GENERATION_TIMEOUT = 1
+        try:
+            cache.clear()
+            first = generation.generation()
+            Generation.objects.update(value=F('value') + 1)
+            self.assertEqual(generation.generation(), first)
+            time.sleep(1.1)
+            self.assertEqual(generation.generation(), first + 1)
+        finally:
+            generation.GENERATION_TIMEOUT = timeout
+
+
+class RenderingTest(TestCase):
+    def test_rendering(self):
+        """
+        Check whether or not XML representations are rendered to HTML
+        once per distinct XML, and again after they change.
+        """
+        self.assertEqual(
+            rendering.render(
+                u'<item id="item_1" type="person"><person-header>'
+                u'<quote>Tom &amp; Jerry</quote></person-header>'
+                u'<reg-ref>1</reg-ref></item>'),
+            u'<div class="item" data-id="item_1" data-type="person">'
+            u'<div class="person-header"><q class="quote">Tom &amp; '
+            u'Jerry</q></div><span class="reg-ref">1</span></div>')
+        first = Regest.objects.create(
+            title='1420', xml_repr='<regest>A &lt; B</regest>')
+        second = Regest.objects.create(
+            title='1421', xml_repr='<regest>A &lt; B</regest>')
+        Regest.objects.create(title='1422')
+        self.assertEqual(first.xml_hash, second.xml_hash)
+        self.assertEqual(
+            rendering.html(first), u'<span class="regest">A &lt; B</span>')
+        with self.assertNumQueries(1):
+            rendering.html(second)
+        first.xml_repr = '<regest>C</regest>'
+        first.save()
+        self.assertEqual(rendering.render_all(processes=2), 1)
+        self.assertEqual(Rendering.objects.count(), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(rendering.html(first),
+                             u'<span class="regest">C</span>')
+        second.delete()
+        self.assertEqual(rendering.render_all(processes=1), 0)
+        self.assertEqual(Rendering.objects.get().html,
+                         u'<span class="regest">C</span>')
+
+
+class AdminTest(TestCase):
+    def test_admin_changelist_queries(self):
+        """
+        Check whether or not changelist pages of the admin interface
+        cost a fixed number of queries, no matter how many objects
+        they show, and whether or not results are counted only once
+        per generation of the corpus.
+        """
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        models = ['regest', 'concept', 'person', 'location', 'family',
+                  'persongroup', 'landmark']
+        for start in [0, 3]:
+            for number in range(start, start + 3 + 2 * start):
+                location = Location.objects.create(
+                    name='Ort {0}'.format(number), xml_repr='<item/>')
+                Person.objects.create(
+                    name='Person {0}'.format(number), resident_of=location,
+                    xml_repr='<item/>')
+                Landmark.objects.create(name='Burg {0}'.format(number))
+                Family.objects.create(name='Familie {0}'.format(number))
+                Regest.objects.create(
+                    title='14{0:02d}'.format(number), xml_repr='<regest/>')
+            for model in models:
+                url = '/admin/regesten_webapp/{0}/'.format(model)
+                # Session, user, count, and results
+                with self.assertNumQueries(4):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(3):
+                    self.client.get(url)
+                # Filtered and total counts
+                with self.assertNumQueries(5):
+                    self.client.get(url, {'q': 'Ort'})
+        self.assertContains(
+            self.client.get('/admin/regesten_webapp/person/'),
+            ': Ort 5')
+
+    def test_autocomplete(self):
+        """
+        Check whether or not the autocomplete view returns a limited
+        number of objects whose names match the text typed so far,
+        and whether or not change forms render only the selected
+        objects of many-to-many fields.
+        """
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        location = Location.objects.create(name='Saarbruecken')
+        person = Person.objects.create(name='Johann von Saarbruecken')
+        for number in range(views.AUTOCOMPLETE_LIMIT + 5):
+            Person.objects.create(
+                name='Heinrich {0:02d}'.format(number),
+                description='Buerger von Saarbruecken')
+        group = PersonGroup.objects.create(name='Saarbruecker Buerger')
+        group.members.add(person)
+
+        def autocomplete(model, text):
+            response = self.client.get(
+                '/api/autocomplete/{0}/'.format(model), {'q': text})
+            return [(result['id'], result['text']) for result in
+                    json.loads(response.content)['results']]
+
+        self.assertEqual(
+            autocomplete('person', 'saarbr JOH'),
+            [(person.pk, 'Person {0}: Johann von Saarbruecken'.format(
+                        person.pk))])
+        self.assertEqual(
+            [pk for pk, text in autocomplete('indexentry', 'saar')],
+            [person.pk, location.pk, group.pk])
+        results = autocomplete('person', 'Hein')
+        self.assertEqual(len(results), views.AUTOCOMPLETE_LIMIT)
+        self.assertTrue(results[0][1].endswith('Heinrich 00'))
+        self.assertEqual(autocomplete('concept', ''), [])
+        self.assertEqual(
+            self.client.get('/api/autocomplete/regest/').status_code, 404)
+
+        response = self.client.get(
+            '/admin/regesten_webapp/persongroup/{0}/'.format(group.pk))
+        self.assertContains(response, '<option', count=1)
+        self.assertContains(response, 'data-url="/api/autocomplete/person/"')
+
+    def test_admin_generation(self):
+        """
+        Check whether or not saving objects in the admin interface
+        advances the generation of the corpus only after their
+        transaction was committed.
+        """
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        Concept.objects.create(name='Burg')
+        first = generation.generation()
+        committed = []
+
+        def commit(*args, **kwargs):
+            committed.append(cache.get(generation.GENERATION_KEY))
+
+        prefix = 'regesten_webapp-quote-content_type-object_id-'
+        disabled_commit, transaction.commit = transaction.commit, commit
+        try:
+            response = self.client.post(
+                '/admin/regesten_webapp/concept/add/',
+                {'name': 'Kirche', prefix + 'TOTAL_FORMS': 0,
+                 prefix + 'INITIAL_FORMS': 0, prefix + 'MAX_NUM_FORMS': ''})
+        finally:
+            transaction.commit = disabled_commit
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(committed)
+        self.assertEqual(set(committed), set([first]))
+        self.assertEqual(generation.generation(), first + 1)
+
+
+class GraphTest(TestCase):
+    def test_graph(self):
+        """
+        Check whether or not neighbourhoods in the graph of regests
+        and concepts are found with one query per hop, and whether or
+        not the in-memory graph yields the same neighbourhoods and is
+        reloaded after the corpus changes.
+        """
+        first = Person.objects.create(name='Johann')
+        second = Person.objects.create(name='Heinrich')
+        group = PersonGroup.objects.create(name='Buerger')
+        location = Location.objects.create(name='Saarbruecken')
+        concept = Concept.objects.create(name='Burg')
+        related = Concept.objects.create(name='Kirche')
+        regest = Regest.objects.create(title='1420')
+        regest.mentions.add(concept, first)
+        first.related_concepts.add(related)
+        group.members.add(first, second)
+        second.related_entries.add(location)
+        expected = {
+            graph.node(regest): 0, graph.node(concept): 1,
+            graph.node(first): 1, graph.node(related): 2,
+            graph.node(group): 2, graph.node(second): 3,
+            graph.node(location): 4}
+        with self.assertNumQueries(5):
+            self.assertEqual(graph.neighbourhood(graph.node(regest), 5),
+                             expected)
+        with self.assertNumQueries(1):
+            self.assertEqual(graph.neighbourhood(graph.node(location), 1),
+                             {graph.node(location): 0,
+                              graph.node(second): 1})
+        self.assertEqual(
+            graph.graph().neighbourhood(graph.node(regest), 5), expected)
+        with self.assertNumQueries(0):
+            graph.graph()
+        location.related_entries.add(group)
+        self.assertEqual(
+            graph.graph().neighbourhood(graph.node(location), 1),
+            {graph.node(location): 0, graph.node(second): 1,
+             graph.node(group): 1})
+
+
+class ExportTest(TestCase):
+    def test_export(self):
+        """
+        Check whether or not regests and index entries are exported
+        with their dates and relations, in chunks costing a fixed
+        number of queries, and whether or not exports are streamed
+        in all formats, with and without gzip.
+        """
+        person = Person.objects.create(name='Johann')
+        family = Family.objects.create(name='von Saarbruecken')
+        family.members.add(person)
+        concept = Concept.objects.create(name='Burg')
+        person.related_concepts.add(concept)
+        archive = Archive.objects.create(info='LA Saarbruecken')
+        for title in ['1420', '1421-1422', '1423', '1424', '1425']:
+            regest = Regest.objects.create(title=title)
+            regest.mentions.add(concept)
+            regest.archives.add(archive)
+
+        # One query per chunk, plus dates, mentions, and archives per
+        # non-empty chunk
+        with self.assertNumQueries(4 + 3 * 3):
+            records = list(export.regest_records(chunk_size=2))
+        self.assertEqual([record['title'] for record in records],
+                         ['1420', '1421-1422', '1423', '1424', '1425'])
+        self.assertEqual(records[1]['dates'], [
+                {'start': date(1421, 1, 1), 'start_offset': '',
+                 'end': date(1422, 1, 1), 'end_offset': '',
+                 'alt_date': False}])
+        self.assertEqual(records[0]['mentions'], [concept.pk])
+        self.assertEqual(records[0]['archives'], ['LA Saarbruecken'])
+        self.assertNotIn('xml_repr', records[0])
+
+        records = list(export.entry_records())
+        self.assertEqual([(record['type'], record['name'])
+                          for record in records],
+                         [('person', 'Johann'),
+                          ('family', 'von Saarbruecken')])
+        self.assertEqual(records[0]['related_concepts'], [concept.pk])
+        self.assertEqual(records[1]['members'], [person.pk])
+        self.assertEqual(records[1]['concept'], family.concept_ptr_id)
+
+        response = self.client.get('/export/regests/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = response.content.splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines],
+                         ['1420', '1421-1422', '1423', '1424', '1425'])
+        response = self.client.get(
+            '/export/index/', {'format': 'json', 'gzip': '1'})
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename=index.json.gz')
+        self.assertEqual(
+            len(json.loads(zlib.decompress(
+                        response.content, 16 + zlib.MAX_WBITS))), 2)
+        self.assertEqual(self.client.get(
+                '/export/index/', {'format': 'xml'}).status_code, 400)
+
+
+class StaticSiteTest(TestCase):
+    def test_static_site(self):
+        """
+        Check whether or not the static site holds pages of all regests,
+        index entries, letters, and decades, and whether or not builds
+        only render pages whose data changed and delete pages that no
+        longer exist.
+        """
+        person = Person.objects.create(name='Johann')
+        regest = Regest.objects.create(title='1421', content='Urkunde')
+        regest.mentions.add(person)
+        other = Regest.objects.create(title='1455', content='Urkunde')
+        output = tempfile.mkdtemp()
+        try:
+            counts = static_site.build(output, processes=1)
+            paths = [
+                'index.html', 'regests/{0}.html'.format(regest.pk),
+                'regests/{0}.html'.format(other.pk),
+                'index/{0}.html'.format(person.pk), 'alphabet/index.html',
+                'alphabet/J.html', 'timeline/index.html',
+                'timeline/1420.html', 'timeline/1450.html']
+            self.assertEqual(counts['built'], len(paths))
+            for path in paths:
+                self.assertTrue(os.path.exists(os.path.join(output, path)))
+            with open(os.path.join(output, paths[1])) as page:
+                content = page.read()
+            self.assertIn('href="../index/{0}.html"'.format(person.pk),
+                          content)
+            self.assertEqual(static_site.build(output, processes=1),
+                             {'built': 0, 'unchanged': len(paths),
+                              'deleted': 0})
+
+            # Only pages showing the title of the regest change
+            other.title = '1456'
+            other.save()
+            counts = static_site.build(output, processes=1)
+            self.assertEqual(counts['built'], 2)
+            with open(os.path.join(output, paths[2])) as page:
+                self.assertIn('1456', page.read())
+
+            other.delete()
+            counts = static_site.build(output, processes=1)
+            self.assertEqual(counts['deleted'], 2)
+            self.assertFalse(os.path.exists(os.path.join(output, paths[2])))
+            self.assertFalse(os.path.exists(os.path.join(output, paths[-1])))
+
+            # Forced builds render all pages, and still delete pages
+            # that no longer exist
+            regest.delete()
+            counts = static_site.build(output, processes=1, force=True)
+            self.assertEqual(counts['unchanged'], 0)
+            self.assertEqual(counts['deleted'], 2)
+            self.assertFalse(os.path.exists(os.path.join(output, paths[1])))
+            self.assertFalse(os.path.exists(os.path.join(output, paths[-2])))
+        finally:
+            shutil.rmtree(output)
+
+
+class NameKeyTest(TestCase):
+    def test_name_key(self):
+        """
+        Check whether or not concepts are looked up by the keys of any
+        of their names, regardless of the spelling of umlauts, sharp s, and y,
+        of brackets, and of punctuation, in the model, the admin
+        interface, and the search API, using the index of name keys.
+        """
+        self.assertEqual(name_key(u'Saarbr\xfccken (Stadt),'),
+                         u'saarbruecken')
+        self.assertEqual(name_key(u'SAARBRUECKEN'), u'saarbruecken')
+        self.assertEqual(name_key(u'Meyer, Johann [II.]'), u'meier johann')
+        self.assertEqual(name_key(u'Gro\xdfe Stra\xdfe.'), u'grosse strasse')
+
+        # Before writing anything, as the sqlite3 module commits before
+        # statements like EXPLAIN
+        sql, params = Concept.objects.named(
+            u'Mei', prefix=True).values('id').query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        self.assertIn('(key>? AND key<?)', ' '.join(
+                row[-1] for row in cursor.fetchall()))
+
+        person = Person.objects.create(
+            name=u'Meyer, Johann', forename='Johann', surname='Meyer',
+            additional_names=u'(Meiger, Maier)')
+        location = Location.objects.create(
+            name=u'Saarbr\xfccken', additional_names=u'(Sarbrucka)')
+        concept = Concept.objects.create(name=u'Burg (Ruine)')
+        self.assertIn(('name', u'meier johann'),
+                      NameKey.objects.stored(person.concept_ptr_id))
+        self.assertEqual(
+            list(Concept.objects.named(u'Saarbruecken')),
+            [Concept.objects.get(pk=location.concept_ptr_id)])
+        self.assertEqual(
+            list(Concept.objects.named(u'Sarbrucka')),
+            [Concept.objects.get(pk=location.concept_ptr_id)])
+        for name in [u'Meier', u'Meiger', u'Maier', u'Meyer, Johann']:
+            self.assertEqual(
+                list(Person.objects.filter(name_lookup(name, model=Person))),
+                [person])
+        self.assertEqual(
+            list(Person.objects.filter(
+                    name_lookup(u'Mei', prefix=True, model=Person))),
+            [person])
+        self.assertEqual(
+            [key.key for key in person.name_keys.filter(field='surname')],
+            [u'meier'])
+        self.assertFalse(Concept.objects.named(u'Meyers'))
+        self.assertFalse(Concept.objects.named(u'', prefix=True))
+
+        # Keys of names written with update() are recomputed
+        self.assertEqual(Concept.objects.update_name_keys(), 0)
+        Concept.objects.filter(pk=concept.pk).update(name=u'Burg')
+        self.assertEqual(Concept.objects.update_name_keys(), 1)
+        self.assertFalse(Concept.objects.named(u'Ruine'))
+        Person.objects.filter(pk=person.pk).update(surname=u'Schmidt')
+        self.assertEqual(Concept.objects.update_name_keys(), 1)
+        self.assertEqual(Concept.objects.named(u'Schmidt').count(), 1)
+        Concept.objects.filter(pk=concept.pk).update(name=u'Kirche')
+        self.assertEqual(Concept.objects.update_name_keys(), 1)
+        self.assertEqual(list(Concept.objects.named(u'kirche')), [concept])
+
+        # Keys are only rewritten when names changed: Saving costs one
+        # query for looking up stored keys, plus three for rewriting
+        # them (select, delete, and insert)
+        person = Person.objects.get(pk=person.pk)
+        person.description = u'Sch\xf6ffe'
+        with self.assertNumQueries(10):
+            person.save()
+        person.surname = 'Schmitt'
+        with self.assertNumQueries(13):
+            person.save()
+        self.assertEqual(Concept.objects.named(u'Schmitt').count(), 1)
+
+        response = self.client.get(
+            '/api/concepts/', {'name': u'SAARBR\xdcCKEN.'})
+        self.assertEqual([result['name'] for result in json.loads(
+                    response.content)['results']], [u'Saarbr\xfccken'])
+        response = self.client.get('/api/concepts/', {'name_prefix': 'mei'})
+        self.assertEqual([result['name'] for result in json.loads(
+                    response.content)['results']], [u'Meyer, Johann'])
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.assertContains(self.client.get(
+                '/admin/regesten_webapp/person/', {'q': 'Meier'}),
+                            'Meyer, Johann')
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.zip')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def __contents(self):
+        return (
+            list(Regest.objects.values_list('id', 'title')),
+            list(RegestDate.objects.values_list(
+                    'regest', 'start', 'end', 'start_offset', 'alt_date')),
+            list(Location.objects.values_list(
+                    'id', 'name', 'abandoned_village', 'region__name')),
+            list(Concept.objects.values_list('id', 'name')),
+            list(Concept.related_concepts.through.objects.values_list(
+                    'from_concept', 'to_concept')),
+            list(Quote.objects.values_list(
+                    'content', 'content_type', 'object_id')))
+
+    def test_roundtrip(self):
+        """
+        Check whether or not restoring a snapshot brings back the
+        exact contents (including ids) the database had when the
+        snapshot was taken.
+        """
+        Regest.objects.create(title='1419-05 bis 06 (vor)')
+        Regest.objects.create(title='1524 und 1525')
+        location = Location.objects.create(
+            name='Frauenberg', abandoned_village=True,
+            region=Region.objects.create(name='Dep. Moselle'))
+        concept = Concept.objects.create(name='Zins')
+        concept.related_concepts.add(location)
+        Quote.objects.create(content='zins', content_object=concept)
+        contents = self.__contents()
+        export_snapshot(self.path)
+
+        Regest.objects.all().delete()
+        Concept.objects.create(name='Beutedepot')
+        restore_snapshot(self.path)
+        self.assertEqual(self.__contents(), contents)
+
+
+# Index items (see extraction/index_utils/index_to_xml.py) by number.
+INDEX_ITEMS = {
+    1: u'<item id="item_1" type="location" value="Saarbr\xfccken">'
+    u'<location-header><placeName><settlement abandoned-village="false">'
+    u'Saarbr\xfccken</settlement><region type="Bundesland">Saarland'
+    u'</region></placeName></location-header></item>',
+    2: u'<item id="item_2" type="person" value="Hans von Strassburg">'
+    u'<person-header><person><persName><foreName>Hans</foreName>'
+    u'<surname>von Strassburg</surname></persName></person><index-refs>'
+    u'<index-ref itemid="item_1"/></index-refs></person-header>'
+    u'<concept-body><related-concepts><concept><name>Sch\xf6ffe</name>'
+    u'</concept></related-concepts></concept-body></item>',
+    3: u'<item id="item_3" type="landmark" value="Burg"><landmark-header>'
+    u'<geogName type="Burg">Burg</geogName></landmark-header></item>',
+    4: u'<item id="item_4" type="landmark" value="Burg Bucherbach">'
+    u'<landmark-header><geogName type="Burg">Burg Bucherbach</geogName>'
+    u'</landmark-header></item>',
+    5: u'<item id="item_5" type="location" value="Dudweiler">'
+    u'<location-header><placeName><settlement abandoned-village="false">'
+    u'Dudweiler</settlement></placeName></location-header></item>',
+    6: u'<item id="item_6" type="person" value="Heinrich"><person-header>'
+    u'<person><persName><foreName>Heinrich</foreName></persName></person>'
+    u'</person-header></item>'}
+
+
+def import_index(items, **options):
+    """
+    Write the given index items to sbr-regesten.xml in the current
+    directory and import it (see index_to_db), discarding progress
+    messages.
+    """
+    with open('sbr-regesten.xml', 'w') as xml:
+        xml.write(u'<regesten><index>{0}</index></regesten>'.format(
+                u''.join(items)).encode('utf-8'))
+    stdout, sys.stdout = sys.stdout, StringIO()
+    try:
+        index_to_db(**options)
+    finally:
+        sys.stdout = stdout
+
+
+class IndexImportTest(TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_incremental_import(self):
+        """
+        Check whether or not re-importing the index leaves entries
+        whose XML did not change alone, updates changed entries, adds
+        new ones, and deletes removed ones along with the concepts
+        created for them, keeping the objects that referred to them.
+        """
+        import_index([INDEX_ITEMS[number] for number in [1, 2, 3, 5, 6]])
+        self.assertEqual(
+            sorted(Concept.objects.values_list('name', flat=True)),
+            ['Burg', 'Dudweiler', 'Hans von Strassburg', 'Heinrich',
+             u'Saarbr\xfccken', u'Sch\xf6ffe'])
+        self.assertEqual(
+            list(Person.objects.get(id=2).related_entries.all()),
+            [IndexEntry.objects.get(id=1)])
+        regest = Regest.objects.create(
+            title='1425', issuer=Person.objects.get(id=2))
+        Person.objects.filter(id=6).update(resident_of=5)
+        # Marks the entry, so that writing it again would show.
+        Location.objects.filter(id=1).update(district='Alt-Saarbruecken')
+
+        import_index(
+            [INDEX_ITEMS[1], INDEX_ITEMS[3].replace(
+                    'value="Burg"', 'value="Burg Kirkel"'), INDEX_ITEMS[4],
+             INDEX_ITEMS[6]],
+            incremental=True)
+        self.assertEqual(Location.objects.get(id=1).district,
+                         'Alt-Saarbruecken')
+        self.assertEqual(Landmark.objects.get(id=3).name, 'Burg Kirkel')
+        self.assertEqual(Landmark.objects.get(id=4).name, 'Burg Bucherbach')
+        self.assertEqual(
+            sorted(IndexEntry.objects.values_list('id', flat=True)),
+            [1, 3, 4, 6])
+        self.assertEqual(
+            sorted(Concept.objects.values_list('name', flat=True)),
+            ['Burg Bucherbach', 'Burg Kirkel', 'Heinrich',
+             u'Saarbr\xfccken'])
+        self.assertFalse(IndexEntry.objects.get(id=1).related_entries.exists())
+        self.assertEqual(Regest.objects.get(id=regest.id).issuer, None)
+        self.assertEqual(Person.objects.get(id=6).resident_of, None)
+
+
+class PipelinedImportTest(TransactionTestCase):
+    """
+    The pipelined import writes the index from a thread of its own,
+    which has a connection of its own as well. These tests therefore
+    use a database file shared between connections instead of the
+    in-memory test database.
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.database = connection.settings_dict['NAME'], connection.connection
+        connection.connection = None
+        connection.settings_dict['NAME'] = os.path.join(
+            self.directory, 'sbr-regesten.db')
+        call_command('syncdb', verbosity=0, interactive=False)
+
+    def tearDown(self):
+        connection.close()
+        connection.settings_dict['NAME'], connection.connection = self.database
+        ContentType.objects.clear_cache()
+        cache.clear()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_pipelined_import(self):
+        """
+        Check whether or not the pipelined import writes the same
+        index entries, concepts, and relations as the sequential one,
+        and advances the generation of the corpus only once.
+        """
+        items = [INDEX_ITEMS[number] for number in sorted(INDEX_ITEMS)]
+        import_index(items)
+        contents = self.__contents()
+        Concept.objects.all().delete()
+        self.assertFalse(IndexEntry.objects.exists())
+        first = generation.bump()
+        import_index(items, pipelined=True)
+        self.assertEqual(self.__contents(), contents)
+        self.assertEqual(Generation.objects.get().value, first + 1)
+
+    def test_pipelined_import_error(self):
+        """
+        Check whether or not an error writing a row stops the
+        pipelined import and is raised in the parsing thread, even
+        if the queue between both threads is full.
+        """
+        connection.cursor().execute('DROP TABLE regesten_webapp_landmark')
+        xml = u'<index>{0}</index>'.format(u''.join(
+                INDEX_ITEMS[number] for number in [3, 1, 2, 5, 6] * 10))
+        with self.assertRaises(DatabaseError):
+            pipelined_items_to_db(iter_items(xml), queueSize=2, batchSize=2)
+        # The batch holding the landmark was rolled back.
+        self.assertFalse(Location.objects.filter(id=1).exists())
+
+    def __contents(self):
+        return (
+            sorted(IndexEntry.objects.values_list('id', 'xml_hash')),
+            sorted(Concept.objects.values_list('id', 'name')),
+            sorted(Person.objects.values_list('id', 'forename', 'surname')),
+            sorted(IndexEntry.related_entries.through.objects.values_list(
+                    'from_indexentry', 'to_indexentry')),
+            sorted(Concept.related_concepts.through.objects.values_list(
+                    'from_concept', 'to_concept')))
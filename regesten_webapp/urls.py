@@ -0,0 +1,15 @@
+"""
+This module maps URLs to the views of the Sbr Regesten webapp.
+"""
+
+from django.conf.urls import patterns, url
+
+urlpatterns = patterns('regesten_webapp.views',
+    url(r'^api/regests/$', 'regests', name='api-regests'),
+    url(r'^api/regests/facets/$', 'regest_facets', name='api-regest-facets'),
+    url(r'^api/concepts/$', 'concepts', name='api-concepts'),
+    url(r'^api/autocomplete/(?P<model>\w+)/$', 'autocomplete',
+        name='api-autocomplete'),
+    url(r'^export/(?P<name>regests|index)/$', 'corpus_export',
+        name='export'),
+)
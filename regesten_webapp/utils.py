@@ -5,19 +5,158 @@ Regesten webapp.
 Author: Tim Krones <tkrones@coli.uni-saarland.de>
 """
 
+import hashlib
 import re
+import threading
+import unicodedata
 
+from collections import OrderedDict
 from datetime import date
 from regesten_webapp import DAY_DEFAULT, MONTH_DEFAULT
 from regesten_webapp import RegestTitleType, RANGE_TYPES, NON_RANGE_TYPES
 from regesten_webapp import EllipsisType
 
 
+# Patterns for the different types of regest titles, listed in order of
+# precedence: A title is of the first type whose pattern matches it.
+TITLE_PATTERNS = [
+    (RegestTitleType.SIMPLE_ADDITIONS,
+     '\d{4}(?:-\d{2}){0,2}' \
+         ' [\(\[]?und ' \
+         '\d{4}(?:-\d{2}){0,2}'),
+    (RegestTitleType.ELLIPTICAL_ADDITIONS,
+     '\d{4}(?:-\d{2}){0,2}' \
+         ' [\(\[]?und ' \
+         '\d{2}(?:-\d{2})?'),
+    (RegestTitleType.SIMPLE_ALTERNATIVES,
+     '\d{4}(?:-\d{2}){0,2}' \
+         '(?: ?/ ?| [\(\[]| [\(\[]?bzw\.? | [\(\[]?oder )' \
+         '\d{4}(?:-\d{2}){0,2}'),
+    (RegestTitleType.ELLIPTICAL_ALTERNATIVES,
+     '\d{4}(?:-\d{2}){0,2}' \
+         '(?: ?/ ?| [\(\[]| [\(\[]?bzw\.? | [\(\[]?oder )' \
+         '\d{2}(?:-\d{2})?[\)\]]?(?:[^\.].+|)$'),
+    (RegestTitleType.SIMPLE_RANGE,
+     '(?:\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})' \
+         '(?: \(.{2,}\))?' \
+         ' ?- ?' \
+         '(?:\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})'),
+    (RegestTitleType.ELLIPTICAL_RANGE,
+     '^\d{4}-\d{2}(?:-\d{2})?' \
+         '(?: \(\D{2,}\))? bis \d{2}(?:-\d{2})?'),
+    ]
+
+# One pattern per title type, plus a single pattern combining all of
+# them. Alternatives of a regex are tried from left to right, so the
+# combined pattern matches with the group of the first type in
+# TITLE_PATTERNS that applies.
+TITLE_TYPE_PATTERNS = dict((title_type, re.compile(pattern))
+                           for title_type, pattern in TITLE_PATTERNS)
+TITLE_TYPE_PATTERN = re.compile('|'.join(
+    '(?P<type{0}>{1})'.format(title_type, pattern)
+    for title_type, pattern in TITLE_PATTERNS))
+
+# Separators of additional dates and elliptical end dates: '/' for
+# alternatives, 'und' for additions and 'bis' for elliptical ranges.
+SEPARATORS = ('/', 'und', 'bis')
+
+
+def compile_per_separator(pattern):
+    """
+    Return a dict mapping each separator to pattern compiled with the
+    separator substituted for '%(separator)s'.
+    """
+    return dict((separator, re.compile(pattern % {'separator': separator}))
+                for separator in SEPARATORS)
+
+
+# Patterns for determining the type of ellipsis of elliptical titles
+# (see RegestTitleAnalyzer.determine_ellipsis_type).
+ELLIPSIS_TYPE_PATTERNS = [
+    (EllipsisType.MONTH_DIFFERENT_NO_DAY, compile_per_separator(
+            '\d{4}-\d{2} ?%(separator)s ?\d{2}([^\d-].*|)$')),
+    (EllipsisType.DAY_DIFFERENT, compile_per_separator(
+            '\d{4}-\d{2}-\d{2} ?%(separator)s ?\d{2}([^\d-].*|)$')),
+    (EllipsisType.MONTH_AND_DAY_DIFFERENT, compile_per_separator(
+            '\d{4}-\d{2}-\d{2} ?%(separator)s ?\d{2}-\d{2}')),
+    ]
+
+# Patterns used by RegestDateExtractor.
+OFFSETS_SIMPLE_RANGE_PATTERN = re.compile(
+    '\(?(?P<start_offset>ca\.|nach|kurz nach|post|um|vor)?\)?' \
+        ' ?- ?' \
+        '(\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})' \
+        ' ?(\([a-z]\)|[\w\. ]+)? ?' \
+        '\(?(?P<end_offset>' \
+        'ca\.|nach|kurz nach|post|um|vor|zwischen)?\)?')
+OFFSETS_ELLIPTICAL_RANGE_PATTERN = re.compile(
+    '\(?(?P<start_offset>ca\.|nach|kurz nach|post|um|vor)?\)?' \
+        ' bis ' \
+        '(\d{2}-\d{2}|\d{2})' \
+        ' ?(\([a-z]\)|[\w\. ]+)? ?' \
+        '\(?(?P<end_offset>' \
+        'ca\.|nach|kurz nach|post|um|vor|zwischen)?\)?')
+OFFSET_PATTERN = re.compile('(?P<offset>ca\.|nach|kurz nach|post|um|vor)')
+
+ALTERNATIVE_SEPARATOR_PATTERN = re.compile('[\(\[]?(bzw\.?|oder)')
+MISC_PATTERN = re.compile(' \((\D+|\d{2}\..+)\)')
+CLOSING_BRACKET_PATTERN = re.compile('[\)\]]')
+LOCATION_PATTERN = re.compile(' \D+$')
+OPENING_BRACKET_PATTERN = re.compile('[\(\[]')
+SPACED_OPENING_BRACKET_PATTERN = re.compile(' [\(\[]')
+
+RANGE_START_PATTERN = re.compile(
+    '(?P<start>\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4}) ?- ?')
+START_PATTERN = re.compile(
+    '(?P<start>\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})')
+RANGE_END_PATTERN = re.compile(
+    ' ?- ?(?P<end>\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})')
+ELLIPTICAL_RANGE_END_PATTERN = re.compile(' bis (?P<end>\d{2}-\d{2}|\d{2})')
+
+SIMPLE_ADD_DATES_PATTERNS = compile_per_separator(
+    '(?P<add_dates>' \
+        '( ?%(separator)s ?\d{4}-\d{2}-\d{2})+|' \
+        '( ?%(separator)s ?\d{4}-\d{2})+|' \
+        '( ?%(separator)s ?\d{4})+)')
+SIMPLE_ADD_DATE_PATTERNS = compile_per_separator(
+    ' ?%(separator)s ?(\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})')
+ELLIPTICAL_ADD_DATES_PATTERNS = compile_per_separator(
+    '(?P<add_dates>' \
+        '( ?%(separator)s ?\d{2}-\d{2})+|' \
+        '( ?%(separator)s ?\d{2})+)')
+ELLIPTICAL_ADD_DATE_PATTERNS = compile_per_separator(
+    ' ?%(separator)s ?(\d{2})')
+ELLIPTICAL_ADD_MONTH_DAY_PATTERNS = compile_per_separator(
+    ' ?%(separator)s ?(\d{2}-\d{2})')
+MONTH_DAY_PATTERN = re.compile('(?P<add_month>\d{2})-(?P<add_day>\d{2})')
+
+DATE_PATTERN = re.compile(
+    '(?P<year>\d{4})-?(?P<month>\d{2})?-?(?P<day>\d{2})?')
+
+
 class RegestTitleAnalyzer(object):
     """
     The RegestTitleAnalyzer class groups functionalities for analyzing
     regest titles in various ways.
     """
+    @staticmethod
+    def classify(title):
+        """
+        Return type of a regest title as defined by RegestTitleType.
+
+        This is equivalent to checking the title with
+        contains_simple_additions, contains_elliptical_additions,
+        contains_simple_alternatives, contains_elliptical_alternatives,
+        is_simple_range and is_elliptical_range (in that order) and
+        returning the type of the first check that succeeds, or
+        RegestTitleType.REGULAR if none of them does. However, the
+        title is only matched once against a combined pattern.
+        """
+        match = TITLE_TYPE_PATTERN.match(title)
+        if match:
+            return int(match.lastgroup[len('type'):])
+        return RegestTitleType.REGULAR
+
     @staticmethod
     def contains_simple_additions(string):
         """
@@ -32,10 +171,8 @@ class RegestTitleAnalyzer(object):
         - 1419-05 und 1419-06
         - 1421-10-05 und 1422-10-04
         """
-        return re.match(
-            '\d{4}(-\d{2}){0,2}' \
-                ' [\(\[]?und ' \
-                '\d{4}(-\d{2}){0,2}', string)
+        return TITLE_TYPE_PATTERNS[
+            RegestTitleType.SIMPLE_ADDITIONS].match(string)
 
     @staticmethod
     def contains_elliptical_additions(string):
@@ -52,10 +189,8 @@ class RegestTitleAnalyzer(object):
         - 1440-11-12 und 17
         - 1270-04-27 und 05-28
         """
-        return re.match(
-            '\d{4}(-\d{2}){0,2}' \
-                ' [\(\[]?und ' \
-                '\d{2}(-\d{2})?', string)
+        return TITLE_TYPE_PATTERNS[
+            RegestTitleType.ELLIPTICAL_ADDITIONS].match(string)
 
     @staticmethod
     def contains_simple_alternatives(string):
@@ -79,10 +214,8 @@ class RegestTitleAnalyzer(object):
         - 1520-02 bzw. 1519-03
         - 1520-02-18 bzw. 1519-03-06
         """
-        return re.match(
-            '\d{4}(-\d{2}){0,2}' \
-                '( ?/ ?| [\(\[]| [\(\[]?bzw\.? | [\(\[]?oder )' \
-                '\d{4}(-\d{2}){0,2}', string)
+        return TITLE_TYPE_PATTERNS[
+            RegestTitleType.SIMPLE_ALTERNATIVES].match(string)
 
     @staticmethod
     def contains_elliptical_alternatives(string):
@@ -109,10 +242,8 @@ class RegestTitleAnalyzer(object):
         - 1343-04-12 oder 19
         - 1343-04-12 oder 05-19
         """
-        return re.match(
-            '\d{4}(-\d{2}){0,2}' \
-                '( ?/ ?| [\(\[]| [\(\[]?bzw\.? | [\(\[]?oder )' \
-                '\d{2}(-\d{2})?[\)\]]?([^\.].+|)$', string)
+        return TITLE_TYPE_PATTERNS[
+            RegestTitleType.ELLIPTICAL_ALTERNATIVES].match(string)
 
     @staticmethod
     def is_simple_range(string):
@@ -122,10 +253,8 @@ class RegestTitleAnalyzer(object):
         Simple date ranges are non-elliptical, i.e. they include year,
         month, and day information for both start and end date.
         """
-        return re.match('(\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})' \
-                            '( \(.{2,}\))?' \
-                            ' ?- ?' \
-                            '(\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})', string)
+        return TITLE_TYPE_PATTERNS[
+            RegestTitleType.SIMPLE_RANGE].match(string)
 
     @staticmethod
     def is_elliptical_range(string):
@@ -145,8 +274,8 @@ class RegestTitleAnalyzer(object):
         - 1419-05-10 bis 20 (denotes a time span of ten days ranging
           from May 10th to May 20th, 1419).
         """
-        return re.match('^\d{4}-\d{2}(-\d{2})?' \
-                            '( \(\D{2,}\))? bis \d{2}(-\d{2})?', string)
+        return TITLE_TYPE_PATTERNS[
+            RegestTitleType.ELLIPTICAL_RANGE].match(string)
 
     @staticmethod
     def determine_ellipsis_type(elliptical_title, separator):
@@ -174,27 +303,102 @@ class RegestTitleAnalyzer(object):
         N.B.: This method should be called *after* removing any
         non-standard formatting from the elliptical title in question.
         """
-        if re.match(
-            '\d{4}-\d{2} ?' + separator + ' ?\d{2}([^\d-].*|)$',
-            elliptical_title):
-            return EllipsisType.MONTH_DIFFERENT_NO_DAY
-        elif re.match(
-            '\d{4}-\d{2}-\d{2} ?' + separator + ' ?\d{2}([^\d-].*|)$',
-            elliptical_title):
-            return EllipsisType.DAY_DIFFERENT
-        elif re.match(
-            '\d{4}-\d{2}-\d{2} ?' + separator + ' ?\d{2}-\d{2}',
-            elliptical_title):
-            return EllipsisType.MONTH_AND_DAY_DIFFERENT
+        for ellipsis_type, patterns in ELLIPSIS_TYPE_PATTERNS:
+            if patterns[separator].match(elliptical_title):
+                return ellipsis_type
+
+
+class LRUCache(object):
+    """
+    The LRUCache class implements a thread-safe cache holding at most
+    maxsize values. When the cache is full, the least recently used
+    value is discarded to make room for a new one.
+
+    The cache keeps statistics on hits, misses and evictions (see
+    stats). Setting enabled to False turns the cache off; values are
+    then always computed.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all values from the cache and reset its statistics.
+        """
+        with self.lock:
+            self.values = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get(self, key, compute):
+        """
+        Return value cached for key. If there is none, call compute
+        to obtain the value and add it to the cache.
+        """
+        if not self.enabled or self.maxsize <= 0:
+            return compute()
+        with self.lock:
+            if key in self.values:
+                self.hits += 1
+                # Re-insert value to mark it as most recently used.
+                value = self.values.pop(key)
+                self.values[key] = value
+                return value
+            self.misses += 1
+        # Compute outside of the lock, so that other threads are not
+        # blocked in the meantime.
+        value = compute()
+        with self.lock:
+            self.values[key] = value
+            while len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        """
+        Return a dict holding the number of hits, misses and
+        evictions, as well as the current and maximum size of the
+        cache.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'size': len(self.values),
+                    'maxsize': self.maxsize}
 
 
 class RegestDateExtractor(object):
     """
     The RegestDateExtractor class groups functionalities for
     extracting dates from regest titles.
+
+    As many regest titles are identical, dates extracted from titles
+    are cached (see extract_dates).
     """
+    cache = LRUCache(maxsize=10000)
+
     @classmethod
     def extract_dates(cls, title, title_type):
+        """
+        Based on its type, extract all dates from a given regest
+        title. Return them as a tuple of (start, end, start_offset,
+        end_offset, alt_date) tuples.
+
+        Results are cached per title and title type in
+        RegestDateExtractor.cache, so extracting dates from a title
+        again is cheap. To turn caching off, set
+        RegestDateExtractor.cache.enabled to False.
+        """
+        return cls.cache.get(
+            (title, title_type),
+            lambda: tuple(cls.__extract_dates(title, title_type)))
+
+    @classmethod
+    def __extract_dates(cls, title, title_type):
         """
         Based on its type, extract all dates from a given regest
         title.
@@ -234,30 +438,15 @@ class RegestDateExtractor(object):
         title.
         """
         if title_type == RegestTitleType.SIMPLE_RANGE:
-            match = re.search(
-                '\(?(?P<start_offset>ca\.|nach|kurz nach|post|um|vor)?\)?' \
-                    ' ?- ?' \
-                    '(\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})' \
-                    ' ?(\([a-z]\)|[\w\. ]+)? ?' \
-                    '\(?(?P<end_offset>' \
-                    'ca\.|nach|kurz nach|post|um|vor|zwischen)?\)?',
-                title)
+            match = OFFSETS_SIMPLE_RANGE_PATTERN.search(title)
             start_offset = match.group('start_offset') or ''
             end_offset = match.group('end_offset') or ''
         elif title_type == RegestTitleType.ELLIPTICAL_RANGE:
-            match = re.search(
-                '\(?(?P<start_offset>ca\.|nach|kurz nach|post|um|vor)?\)?' \
-                    ' bis ' \
-                    '(\d{2}-\d{2}|\d{2})' \
-                    ' ?(\([a-z]\)|[\w\. ]+)? ?' \
-                    '\(?(?P<end_offset>' \
-                    'ca\.|nach|kurz nach|post|um|vor|zwischen)?\)?',
-                title)
+            match = OFFSETS_ELLIPTICAL_RANGE_PATTERN.search(title)
             start_offset = match.group('start_offset') or ''
             end_offset = match.group('end_offset') or ''
         else:
-            match = re.search(
-                '(?P<offset>ca\.|nach|kurz nach|post|um|vor)', title)
+            match = OFFSET_PATTERN.search(title)
             start_offset = match.group('offset') if match else ''
             end_offset = ''
         return cls.determine_final_offsets(
@@ -328,17 +517,17 @@ class RegestDateExtractor(object):
         - Replace ' (' and ' [' with '-' (elliptical alternatives)
         - Remove '(' and '[' (simple and elliptical additions)
         """
-        title = re.sub('[\(\[]?(bzw\.?|oder)', '/', title)
-        title = re.sub(' \((\D+|\d{2}\..+)\)', '', title)
-        title = re.sub('[\)\]]', '', title)
-        title = re.sub(' \D+$', '', title)
+        title = ALTERNATIVE_SEPARATOR_PATTERN.sub('/', title)
+        title = MISC_PATTERN.sub('', title)
+        title = CLOSING_BRACKET_PATTERN.sub('', title)
+        title = LOCATION_PATTERN.sub('', title)
         if title_type == RegestTitleType.SIMPLE_ALTERNATIVES:
-            title = re.sub('[\(\[]', '/ ', title)
+            title = OPENING_BRACKET_PATTERN.sub('/ ', title)
         elif title_type == RegestTitleType.ELLIPTICAL_ALTERNATIVES:
-            title = re.sub(' [\(\[]', '-', title)
+            title = SPACED_OPENING_BRACKET_PATTERN.sub('-', title)
         elif title_type == RegestTitleType.SIMPLE_ADDITIONS or \
                 title_type == RegestTitleType.ELLIPTICAL_ADDITIONS:
-            title = re.sub('[\(\[]', '', title)
+            title = OPENING_BRACKET_PATTERN.sub('', title)
         return title
 
     @classmethod
@@ -347,13 +536,9 @@ class RegestDateExtractor(object):
         Based on its type, extract start date from a given regest title.
         """
         if title_type == RegestTitleType.SIMPLE_RANGE:
-            start = re.search(
-                '(?P<start>\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4}) ?- ?',
-                title).group('start')
+            start = RANGE_START_PATTERN.search(title).group('start')
         else:
-            start = re.search(
-                '(?P<start>\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})',
-                title).group('start')
+            start = START_PATTERN.search(title).group('start')
         return cls.extract_date(start)
 
     @classmethod
@@ -377,13 +562,10 @@ class RegestDateExtractor(object):
         see docstring of RegestTitleAnalyzer.determine_ellipsis_type.
         """
         if title_type == RegestTitleType.SIMPLE_RANGE:
-            end = re.search(
-                ' ?- ?(?P<end>\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})',
-                title).group('end')
+            end = RANGE_END_PATTERN.search(title).group('end')
             end = cls.extract_date(end)
         elif title_type == RegestTitleType.ELLIPTICAL_RANGE:
-            end = re.search(
-                ' bis (?P<end>\d{2}-\d{2}|\d{2})', title).group('end')
+            end = ELLIPTICAL_RANGE_END_PATTERN.search(title).group('end')
             ellipsis_type = RegestTitleAnalyzer.determine_ellipsis_type(
                 title, separator='bis')
             if ellipsis_type == EllipsisType.MONTH_DIFFERENT_NO_DAY:
@@ -391,7 +573,7 @@ class RegestDateExtractor(object):
             elif ellipsis_type == EllipsisType.DAY_DIFFERENT:
                 end = date(start.year, start.month, int(end))
             elif ellipsis_type == EllipsisType.MONTH_AND_DAY_DIFFERENT:
-                end_month, end_day = re.split('-', end)
+                end_month, end_day = end.split('-')
                 end = date(start.year, int(end_month), int(end_day))
         else:
             end = start
@@ -410,13 +592,9 @@ class RegestDateExtractor(object):
         """
         alt_date = title_type == RegestTitleType.SIMPLE_ALTERNATIVES
         separator = '/' if alt_date else 'und'
-        add_dates = re.search(
-            '(?P<add_dates>' \
-                '( ?' + separator + ' ?\d{4}-\d{2}-\d{2})+|' \
-                '( ?' + separator + ' ?\d{4}-\d{2})+|' \
-                '( ?' + separator + ' ?\d{4})+)', title).group('add_dates')
-        for add_date in re.findall(
-            ' ?' + separator + ' ?(\d{4}-\d{2}-\d{2}|\d{4}-\d{2}|\d{4})',
+        add_dates = SIMPLE_ADD_DATES_PATTERNS[separator].search(
+            title).group('add_dates')
+        for add_date in SIMPLE_ADD_DATE_PATTERNS[separator].findall(
             add_dates):
             start = cls.extract_date(add_date)
             dates.append((start, start, start_offset, end_offset, alt_date))
@@ -450,29 +628,26 @@ class RegestDateExtractor(object):
         """
         alt_date = title_type == RegestTitleType.ELLIPTICAL_ALTERNATIVES
         separator = '/' if alt_date else 'und'
-        add_dates = re.search(
-            '(?P<add_dates>' \
-                '( ?' + separator + ' ?\d{2}-\d{2})+|' \
-                '( ?' + separator + ' ?\d{2})+)', title).group('add_dates')
+        add_dates = ELLIPTICAL_ADD_DATES_PATTERNS[separator].search(
+            title).group('add_dates')
         ellipsis_type = RegestTitleAnalyzer.determine_ellipsis_type(
             title, separator)
         if ellipsis_type == EllipsisType.MONTH_DIFFERENT_NO_DAY:
-            for add_date in re.findall(
-                ' ?' + separator + ' ?(\d{2})', add_dates):
+            for add_date in ELLIPTICAL_ADD_DATE_PATTERNS[separator].findall(
+                add_dates):
                 start = date(start.year, int(add_date), DAY_DEFAULT)
                 dates.append(
                     (start, start, start_offset, end_offset, alt_date))
         elif ellipsis_type == EllipsisType.DAY_DIFFERENT:
-            for add_date in re.findall(
-                ' ?' + separator + ' ?(\d{2})', add_dates):
+            for add_date in ELLIPTICAL_ADD_DATE_PATTERNS[separator].findall(
+                add_dates):
                 start = date(start.year, start.month, int(add_date))
                 dates.append(
                     (start, start, start_offset, end_offset, alt_date))
         elif ellipsis_type == EllipsisType.MONTH_AND_DAY_DIFFERENT:
-            for add_date in re.findall(
-                ' ?' + separator + ' ?(\d{2}-\d{2})', add_dates):
-                add_month, add_day = re.search(
-                    '(?P<add_month>\d{2})-(?P<add_day>\d{2})',
+            for add_date in ELLIPTICAL_ADD_MONTH_DAY_PATTERNS[
+                separator].findall(add_dates):
+                add_month, add_day = MONTH_DAY_PATTERN.search(
                     add_date).group('add_month', 'add_day')
                 start = date(start.year, int(add_month), int(add_day))
                 dates.append(
@@ -498,12 +673,115 @@ class RegestDateExtractor(object):
         MONTH_DEFAULT and DAY_DEFAULT constants are defined in
         __init__.py.
         """
-        year, month, day = re.search(
-            '(?P<year>\d{4})-?(?P<month>\d{2})?-?(?P<day>\d{2})?',
-            string).group('year', 'month', 'day')
+        year, month, day = DATE_PATTERN.search(string).group(
+            'year', 'month', 'day')
         if year and month and day:
             return date(int(year), int(month), int(day))
         elif year and month and not day:
             return date(int(year), int(month), DAY_DEFAULT)
         elif year and not month and not day:
             return date(int(year), MONTH_DEFAULT, DAY_DEFAULT)
+
+
+def content_hash(content):
+    """
+    Return SHA-1 hex digest of the unicode representation of content.
+
+    This is used to detect whether stored representations (such as
+    the XML representation of an index entry) have changed.
+    """
+    return hashlib.sha1(unicode(content).encode('utf-8')).hexdigest()
+
+
+# Spellings of German special characters without them, as used e.g. in
+# the index of the Sbr Regesten ("Saarbruecken").
+GERMAN_FOLDINGS = {
+    u'\xe4': u'ae', u'\xf6': u'oe', u'\xfc': u'ue', u'\xdf': u'ss',
+    u'\xc4': u'Ae', u'\xd6': u'Oe', u'\xdc': u'Ue'}
+
+GERMAN_FOLDING_PATTERN = re.compile(
+    u'[{0}]'.format(u''.join(GERMAN_FOLDINGS)))
+
+
+def fold_german(text):
+    """
+    Replace umlauts and sharp s in text by their spellings without
+    special characters (e.g. u'Saarbr\\xfccken' -> u'Saarbruecken'),
+    so that both spellings can be matched.
+    """
+    return GERMAN_FOLDING_PATTERN.sub(
+        lambda match: GERMAN_FOLDINGS[match.group()], text)
+
+
+# Historical spellings mapped to their modern equivalents in name keys,
+# applied after lowercasing.
+NAME_KEY_SPELLINGS = [(u'y', u'i')]
+
+# Bracketed parts of names (e.g. variant spellings or annotations), left
+# out of name keys.
+NAME_KEY_BRACKETS = re.compile(u'\\([^)]*\\)|\\[[^\\]]*\\]', re.UNICODE)
+
+# Punctuation (and whitespace) in names, replaced by single spaces in
+# name keys.
+NAME_KEY_PUNCTUATION = re.compile(u'[\\W_]+', re.UNICODE)
+
+
+def name_key(name):
+    """
+    Return the key under which name is looked up, so that spellings
+    of the same name differing in umlauts and sharp s (ae, ss),
+    historical spellings (y for i), other diacritics, case, bracketed
+    parts, and punctuation get the same key (e.g. u'Saarbr\\xfccken
+    (Stadt),' and u'SAARBRUECKEN' both get u'saarbruecken').
+    """
+    key = NAME_KEY_BRACKETS.sub(u' ', fold_german(unicode(name)))
+    key = u''.join(
+        character for character in unicodedata.normalize('NFKD', key)
+        if not unicodedata.combining(character)).lower()
+    for spelling, modern in NAME_KEY_SPELLINGS:
+        key = key.replace(spelling, modern)
+    return u' '.join(NAME_KEY_PUNCTUATION.sub(u' ', key).split())
+
+
+# Characters separating several names in a single field, such as the
+# additional names of concepts (e.g. u'(Sarbrucka, Sarbrucken)').
+NAME_SEPARATORS = re.compile(u'[,;()\\[\\]]', re.UNICODE)
+
+
+def split_names(text):
+    """
+    Return list of the names in text, which may hold several names
+    separated by commas or semicolons, or set off by brackets.
+    """
+    return [name.strip() for name in NAME_SEPARATORS.split(text)
+            if name.strip()]
+
+def name_key_range(prefix):
+    """
+    Return the (inclusive) lower and (exclusive) upper bound of the
+    name keys starting with the key of prefix, so that they can be
+    looked up with a range scan of an index (SQLite does not use
+    indexes for the LIKE queries of startswith lookups). Return None
+    if prefix has an empty key.
+    """
+    key = name_key(prefix)
+    if not key:
+        return None
+    return key, key + u'\uffff'
+
+
+def ancestor_link(model, ancestor):
+    """
+    Return the name of the field holding the primary key of ancestor
+    for objects of model, which is ancestor itself or one of its
+    subclasses (possibly inheriting from it via other models).
+    """
+    # Objects with deferred fields are instances of proxy models.
+    model = model._meta.concrete_model
+    if model is ancestor:
+        return ancestor._meta.pk.name
+    for parent in [model] + list(model._meta.get_parent_list()):
+        if ancestor in parent._meta.parents:
+            return parent._meta.parents[ancestor].name
+    raise ValueError('{0} is not a subclass of {1}'.format(
+            model.__name__, ancestor.__name__))
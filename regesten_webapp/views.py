@@ -1 +1,281 @@
-# Create your views here.
+"""
+This module contains the views of the Sbr Regesten webapp.
+
+The search API returns regests and concepts as JSON. Results are
+paginated by keyset: Every page holds a cursor identifying its last
+object, and the next page starts right after it, so that fetching a
+deep page costs as much as fetching the first one.
+"""
+
+import json
+import re
+
+from functools import wraps
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from regesten_webapp.export import ExportError, export
+from regesten_webapp.facets import facet_counts
+from regesten_webapp.filters import FILTER_PARAMETERS, InvalidParameter
+from regesten_webapp.filters import filter_regests, parse_date
+from regesten_webapp.generation import cached_view
+from regesten_webapp.models import Concept, IndexEntry, Landmark, Location
+from regesten_webapp.models import Person, PersonGroup, Regest, name_lookup
+from regesten_webapp.search import CONCEPT_INDEX
+from regesten_webapp.utils import ancestor_link
+
+# Number of results per page, unless the client asks for fewer.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+REGEST_CURSOR_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})?:(\d+)$')
+
+# Content types of the formats of exports.
+EXPORT_CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'json': 'application/json',
+    }
+
+# Maximum number of objects returned by the autocomplete view.
+AUTOCOMPLETE_LIMIT = 20
+
+# Models the autocomplete view looks up objects of, by name, along with
+# the models whose objects are searched for them.
+AUTOCOMPLETE_MODELS = {
+    'concept': (Concept, [Concept]),
+    'person': (Person, [Person]),
+    'indexentry': (IndexEntry, [Landmark, Location, Person, PersonGroup]),
+    }
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        json.dumps(data, cls=DjangoJSONEncoder), status=status,
+        content_type='application/json')
+
+
+def page_size(request):
+    """
+    Return number of results per page requested by the client.
+    """
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise InvalidParameter(
+            'Invalid limit: {0}'.format(request.GET['limit']))
+    if limit < 1:
+        raise InvalidParameter('Invalid limit: {0}'.format(limit))
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def page(request, queryset, cursor, size):
+    """
+    Return the objects of the page of queryset requested by the
+    client, and the URL of the next page (or None). cursor returns
+    the cursor identifying an object.
+    """
+    objects = list(queryset[:size + 1])
+    next_url = None
+    if len(objects) > size:
+        objects = objects[:size]
+        parameters = request.GET.copy()
+        parameters['after'] = cursor(objects[-1])
+        next_url = '{0}?{1}'.format(request.path, parameters.urlencode())
+    return objects, next_url
+
+
+def regest_cursor(regest):
+    return '{0}:{1}'.format(regest.earliest_start or '', regest.id)
+
+
+def after_regest(cursor):
+    """
+    Return filter selecting the regests that come after the regest
+    identified by cursor in chronological order.
+
+    Regests without dates come first (like NULL values in SQLite).
+    """
+    match = REGEST_CURSOR_PATTERN.match(cursor)
+    if not match:
+        raise InvalidParameter('Invalid cursor: {0}'.format(cursor))
+    earliest_start, regest_id = match.groups()
+    if earliest_start is None:
+        return Q(earliest_start__isnull=True, id__gt=regest_id) | \
+            Q(earliest_start__isnull=False)
+    earliest_start = parse_date(earliest_start)
+    return Q(earliest_start__gt=earliest_start) | \
+        Q(earliest_start=earliest_start, id__gt=regest_id)
+
+
+def serialize_regest(regest):
+    return {
+        'id': regest.id,
+        'title': regest.title,
+        'location': regest.location,
+        'regest_type': regest.regest_type,
+        'author': regest.author,
+        'content': regest.content,
+        'earliest_start': regest.earliest_start,
+        'latest_end': regest.latest_end,
+        'exact': regest.is_exact,
+        'dates': [{'start': regest_date.start,
+                   'start_offset': regest_date.start_offset,
+                   'end': regest_date.end,
+                   'end_offset': regest_date.end_offset,
+                   'alt_date': regest_date.alt_date}
+                  for regest_date in regest.regestdate_set.all()],
+        }
+
+
+def serialize_concept(concept):
+    return {
+        'id': concept.id,
+        'name': concept.name,
+        'description': concept.description,
+        'additional_names': concept.additional_names,
+        }
+
+
+def api_view(view):
+    """
+    Decorator turning InvalidParameter exceptions raised by view into
+    responses with status 400. Successful responses are cached for
+    the current generation of the corpus (see generation.py).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except InvalidParameter as error:
+            return json_response({'error': unicode(error)}, status=400)
+    return require_GET(cached_view(wrapper))
+
+
+@api_view
+def regests(request):
+    """
+    Return regests matching the parameters of request (see
+    filters.filter_regests) in chronological order, i.e. by earliest
+    date and id.
+    """
+    queryset = filter_regests(
+        request.GET, Regest.objects.defer('xml_repr')).order_by(
+        'earliest_start', 'id').prefetch_related('regestdate_set')
+    if request.GET.get('after'):
+        queryset = queryset.filter(after_regest(request.GET['after']))
+    objects, next_url = page(
+        request, queryset, regest_cursor, page_size(request))
+    return json_response({
+            'results': [serialize_regest(regest) for regest in objects],
+            'next': next_url})
+
+
+@api_view
+def concepts(request):
+    """
+    Return concepts matching the text (q) given in the parameters of
+    request, ordered by id. Concepts can also be looked up by any of
+    their names (including additional names, forenames, and surnames),
+    exactly (name) or by prefix (name_prefix), regardless of the
+    spelling of umlauts, brackets, and punctuation (see
+    models.name_lookup). If any of the parameters of the regest search
+    are given, only concepts mentioned in matching regests are
+    returned.
+    """
+    queryset = Concept.objects.all()
+    if request.GET.get('q'):
+        queryset = CONCEPT_INDEX.filter(queryset, request.GET['q'])
+    if request.GET.get('name'):
+        queryset = queryset.filter(name_lookup(request.GET['name']))
+    if request.GET.get('name_prefix'):
+        queryset = queryset.filter(
+            name_lookup(request.GET['name_prefix'], prefix=True))
+    regest_parameters = dict(
+        (parameter, request.GET.get(parameter))
+        for parameter in FILTER_PARAMETERS if parameter != 'q')
+    if any(regest_parameters.values()):
+        mentions = Regest.mentions.through.objects.filter(
+            regest__in=filter_regests(regest_parameters))
+        queryset = queryset.filter(id__in=mentions.values('concept'))
+    if request.GET.get('after'):
+        try:
+            queryset = queryset.filter(id__gt=int(request.GET['after']))
+        except ValueError:
+            raise InvalidParameter('Invalid cursor: {0}'.format(
+                    request.GET['after']))
+    objects, next_url = page(
+        request, queryset.order_by('id'), lambda concept: concept.id,
+        page_size(request))
+    return json_response({
+            'results': [serialize_concept(concept) for concept in objects],
+            'next': next_url})
+
+
+@api_view
+def regest_facets(request):
+    """
+    Return facet counts (see facets.py) for the regests matching the
+    parameters of request (see filters.filter_regests).
+    """
+    return json_response(facet_counts(request.GET))
+
+
+@staff_member_required
+@require_GET
+def autocomplete(request, model):
+    """
+    Return up to AUTOCOMPLETE_LIMIT objects of model whose names
+    contain words starting with every word of the text (q) given in
+    the parameters of request, ordered by name. Names are looked up in
+    the full-text index of concepts (see search.py), so the cost of a
+    lookup does not depend on the number of objects in the database.
+
+    This view backs the autocomplete widgets of the admin interface
+    (see widgets.py).
+    """
+    try:
+        target, models = AUTOCOMPLETE_MODELS[model]
+    except KeyError:
+        return json_response(
+            {'error': u'Unknown model: {0}'.format(model)}, status=404)
+    text = request.GET.get('q', '')
+    objects = []
+    if CONCEPT_INDEX.words(text):
+        for model in models:
+            objects.extend(CONCEPT_INDEX.filter(
+                    model.objects.all(), text, columns=['name']).order_by(
+                    'name', 'pk')[:AUTOCOMPLETE_LIMIT])
+    objects.sort(key=lambda obj: (obj.name, obj.pk))
+    return json_response({'results': [
+                {'id': getattr(obj, obj._meta.get_field(
+                            ancestor_link(type(obj), target)).attname),
+                 'text': unicode(obj)}
+                for obj in objects[:AUTOCOMPLETE_LIMIT]]})
+
+
+@require_GET
+def corpus_export(request, name):
+    """
+    Return the export called name (see export.py) as a download in
+    the format given by the parameters of request (jsonl or json),
+    compressed with gzip if gzip=1 is given. The response is streamed
+    record by record instead of being built in memory.
+    """
+    format = request.GET.get('format', 'jsonl')
+    compress = request.GET.get('gzip') == '1'
+    try:
+        stream = export(name, format, compress)
+    except ExportError as error:
+        return json_response({'error': unicode(error)}, status=400)
+    filename = '{0}.{1}'.format(name, format)
+    if compress:
+        filename += '.gz'
+    response = HttpResponse(
+        stream, content_type='application/gzip' if compress
+        else EXPORT_CONTENT_TYPES[format])
+    response['Content-Disposition'] = 'attachment; filename={0}'.format(
+        filename)
+    return response
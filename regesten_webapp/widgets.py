@@ -0,0 +1,47 @@
+"""
+This module contains custom form widgets of the Sbr Regesten webapp.
+"""
+
+from django import forms
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.translation import ugettext as _
+
+
+class AutocompleteSelectMultiple(forms.SelectMultiple):
+    """
+    Widget for selecting objects of a large model. Only the selected
+    objects are rendered as options; further objects are looked up by
+    name with the autocomplete view (see views.autocomplete) while
+    typing, so that the size of the form does not depend on the number
+    of objects in the database.
+    """
+
+    class Media:
+        js = ['regesten_webapp/autocomplete.js']
+
+    def __init__(self, url, attrs=None):
+        super(AutocompleteSelectMultiple, self).__init__(attrs)
+        self.url = url
+
+    def render(self, name, value, attrs=None, choices=()):
+        select = super(AutocompleteSelectMultiple, self).render(
+            name, value, attrs, choices)
+        select_id = (attrs or {}).get('id', 'id_' + name)
+        return mark_safe(
+            u'<input type="text" class="autocomplete" data-url="{0}" '
+            u'data-select="{1}" placeholder="{2}" />{3}'.format(
+                escape(self.url), escape(select_id), escape(_('Search...')),
+                select))
+
+    def render_options(self, choices, selected_choices):
+        selected_choices = set(
+            unicode(choice) for choice in selected_choices if choice)
+        if not selected_choices:
+            return u''
+        field = self.choices.field
+        return u'\n'.join(
+            self.render_option(
+                selected_choices, obj.pk, field.label_from_instance(obj))
+            for obj in self.choices.queryset.filter(
+                pk__in=selected_choices))